@@ -1,25 +1,56 @@
-from flask import Flask, request
+import json
+from flask import Flask, Response, make_response, request, stream_with_context
 from solver.z_array import ZArray, ZLabeledArray
-from solver.equation import Equation
+from solver.wire_format import WireFormat
+from solver.equation_cache import EquationCache
+from solver.result_cache import ResultCache
+from solver.tile_cache import TileCache
+from solver.domain_coloring import DomainColoring
+from solver.parallel_evaluator import ParallelEvaluator
 from solver.parser import ExpressionType, ParserError
+from strokes import (StrokesRequest, flatten_branches, error_text, reducer_from_fields, splitter_from_fields,
+                     track_from_fields, preimage_from_fields, evaluate_group, stroke_pieces)
+from metrics import RequestTiming, Metrics, cache_gauges
 from flask_cors import CORS, cross_origin
 
 app = Flask(__name__)
 cors = CORS(app, origins=['http://localhost:5000', 'https://complex-variable.netlify.app'])
 
-known_equations: dict[str, Equation] = {} 
+equations = EquationCache(max_size=256)
+equations.warm()
+results = ResultCache(max_bytes=64 * 1024 * 1024)
+tiles = TileCache(max_bytes=32 * 1024 * 1024)
+evaluator = ParallelEvaluator.from_environment()
+ndjson_mimetype = 'application/x-ndjson'
+metrics = Metrics()
 
-def ensure_flat_list(val):
-    # If val is a list of complex numbers, return as is
-    if isinstance(val, list):
-        # Check if nested list, flatten once
-        if val and isinstance(val[0], list):
-            return [item for sublist in val for item in sublist]
-        else:
-            return val
-    else:
-        # Single complex number -> wrap in list
-        return [val]
+def accepts_binary() -> bool:
+    # the binary format is sent only to clients asking for it
+    return request.accept_mimetypes.best_match(['application/json', WireFormat.mimetype]) == WireFormat.mimetype
+
+def stream_lines(first, strokes, timing: RequestTiming):
+    # a line per stroke; the status is sent already, so an error ends the stream with an error line
+    try:
+        if first is not None:
+            with timing.phase('serialize'):
+                line = json.dumps([first[0], flatten_branches(first[1])]) + '\n'
+            yield line
+        for label, fz in strokes:
+            with timing.phase('serialize'):
+                line = json.dumps([label, flatten_branches(fz)]) + '\n'
+            yield line
+    except ParserError as e:
+        yield json.dumps({'error': error_text(e)}) + '\n'
+    finally:
+        metrics.observe(timing)
+
+def timed(timing: RequestTiming, *response) -> Response:
+    # the response with its Server-Timing header, counted in the metrics
+    response = make_response(*response)
+    timing.status = response.status_code
+    response.headers['Server-Timing'] = timing.server_timing()
+    metrics.observe(timing)
+    return response
 
 @app.route("/")
 def helloWorld():
@@ -27,40 +58,190 @@ def helloWorld():
 
 @app.route("/strokes", methods=['GET', 'POST', 'OPTIONS'])
 def main():
-    print(f"Got a request: {request}")
-    raw_data = request.get_json(force=True)
-    z_data = raw_data['z']
-    ln_branches = raw_data.get('lnBranches', 6)
+    timing = RequestTiming('strokes')
+    try:
+        strokes_request = StrokesRequest(request.args, request.mimetype, request.get_data(), accepts_binary(), timing)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return timed(timing, "Bad request", 400)
+    if strokes_request.f is None:
+        return timed(timing, "", 200)
+    try:
+        eq = strokes_request.compile(equations)
+    except ParserError as e:
+        return timed(timing, error_text(e), 400)
+    if eq is None:
+        return timed(timing, "Bad function string", 400)
+    strokes = strokes_request.evaluate(results, eq, evaluator)
+    if request.accept_mimetypes.best_match(['application/json', ndjson_mimetype]) == ndjson_mimetype:
+        # NDJSON, every stroke is sent as soon as it is evaluated. The first one is evaluated
+        # before answering, an error in it is still a 400
+        try:
+            first = next(strokes, None)
+        except ParserError as e:
+            return timed(timing, error_text(e), 400)
+        response = Response(stream_with_context(stream_lines(first, strokes, timing)), mimetype=ndjson_mimetype)
+        response.vary.add('Accept')
+        # the header only has what was done before the first line, the metrics get the whole stream
+        response.headers['Server-Timing'] = timing.server_timing()
+        return response
+    try:
+        strokes = list(strokes)
+    except ParserError as e:
+        return timed(timing, error_text(e), 400)
+    response_type, body = strokes_request.serialize(strokes)
+    response = Response(body, mimetype=response_type)
+    response.vary.add('Accept')
+    return timed(timing, response)
+
+@app.route("/tiles/<int:zoom>/<int(signed=True):x>/<int(signed=True):y>.png")
+def tile(zoom, x, y):
+    # domain coloring of ?f= behind the drawing plane, see DomainColoring for the tile coordinates
+    timing = RequestTiming('tiles')
+    f = request.args.get('f')
+    if f is None or not 0 <= zoom <= DomainColoring.max_zoom:
+        return timed(timing, "Bad request", 400)
     try:
-        z_array = ZLabeledArray(z_data)
-        f = request.args.get('f')
-    except TypeError:
-        print(f'Bad request')
-        return "Bad request", 400
+        with timing.phase('compile'):
+            timing.equation_cached = f in equations
+            eq = equations.get(f)
+            timing.function = eq.function_string
+            if eq.expression.type == ExpressionType.NONE:
+                return timed(timing, "Bad function string", 400)
+            function = eq.vector_function
+        key = TileCache.key(eq.function_string, zoom, x, y)
+        png = tiles.get(key)
+        cached = png is not None
+        if png is None:
+            with timing.phase('evaluate'):
+                w = DomainColoring.evaluate(function, zoom, x, y)
+            with timing.phase('serialize'):
+                png = DomainColoring.image(w)
+            tiles.put(key, png)
+        timing.count_stroke(1, DomainColoring.size ** 2, cached)
+    except ParserError as e:
+        return timed(timing, error_text(e), 400)
+    response = Response(png, mimetype='image/png')
+    # a tile only depends on its URL
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return timed(timing, response)
+
+@app.route("/preimage", methods=['POST', 'OPTIONS'])
+def preimage():
+    # strokes drawn on the result plane back to the z plane: {"z": [...], "region": {...}} like /strokes.
+    # A stroke comes back as its pieces, a piece per preimage and per stretch of it in the region,
+    # unless "split": false asks for all preimages at every point, with NaN where one is lost
+    timing = RequestTiming('preimage')
+    try:
+        with timing.phase('decode'):
+            raw_data = request.get_json(force=True)
+            splitter = splitter_from_fields({'split': True, **raw_data})
+            f = request.args.get('f')
+        with timing.phase('strokes'):
+            z_array = ZLabeledArray(raw_data['z'])
+    except (TypeError, ValueError, KeyError):
+        return timed(timing, "Bad request", 400)
     if f is None:
-        return 200
-    print(f'Function: {f}')
-    if f not in known_equations.keys():
-        known_equations[f] = Equation(f)
-    eq = known_equations[f]
+        return timed(timing, "Bad request", 400)
     try:
-        if eq.expression.type == ExpressionType.NONE:
-            return "Bad function string", 400
-        print(f'Calculated expression...')
-        function = eq.function
-        print(f'Got functional function...')
-        response = []
+        with timing.phase('compile'):
+            timing.equation_cached = f in equations
+            eq = equations.get(f)
+            timing.function = eq.function_string
+            if eq.expression.type == ExpressionType.NONE:
+                return timed(timing, "Bad function string", 400)
+            solver = preimage_from_fields(raw_data, eq.expression)
     except ParserError as e:
-        return f'{e.type.value} {e.text_value}', 400
-    response = []
-    for label, z in z_array.labeled_points:
-        x1, y1 = z.get_x(), z.get_y()
-        fz = function(x1 + y1*1j, num_branches=ln_branches)
-        fz = ensure_flat_list(fz)
-        response.append([label, [[w.real, w.imag] for w in fz]])
-    print(f'Processed, sending back')
-    return response
+        return timed(timing, error_text(e), 400)
+    except (TypeError, ValueError, KeyError):
+        return timed(timing, "Bad request", 400)
+    strokes = []
+    for label, w in z_array.labeled_points:
+        with timing.phase('evaluate'):
+            z = solver.solve(w.get_z())
+            pieces = splitter.split(z) if splitter is not None else [z]
+        timing.count_stroke(z.shape[0], z.shape[1], False)
+        strokes += [[label, flatten_branches(piece)] for piece in pieces]
+    with timing.phase('serialize'):
+        response = app.json.response(strokes)
+    return timed(timing, response)
+
+@app.route("/metrics")
+def metrics_text():
+    # for a Prometheus server on the same host
+    if request.remote_addr not in ['127.0.0.1', '::1']:
+        return "Forbidden", 403
+    return Response(metrics.render({**cache_gauges('equation', equations.stats()),
+                                    **cache_gauges('result', results.stats()),
+                                    **cache_gauges('tile', tiles.stats())}),
+                    mimetype='text/plain; version=0.0.4')
 
+@app.route("/strokes/batch", methods=['POST', 'OPTIONS'])
+def batch():
+    # several functions over one set of strokes: {"functions": [...], "z": [...], "lnBranches": 6}
+    timing = RequestTiming('batch')
+    try:
+        with timing.phase('decode'):
+            raw_data = request.get_json(force=True)
+            function_strings = raw_data.get('functions')
+            ln_branches = raw_data.get('lnBranches', 6)
+            reducer = reducer_from_fields(raw_data)
+            splitter = splitter_from_fields(raw_data)
+            track = track_from_fields(raw_data)
+        with timing.phase('strokes'):
+            z_array = ZLabeledArray(raw_data['z'])
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return timed(timing, "Bad request", 400)
+    if not isinstance(function_strings, list) or not all(isinstance(f, str) for f in function_strings):
+        return timed(timing, "Bad request", 400)
+
+    errors: dict[str, str] = {}  # function string -> parser error
+    valid: dict[str, str] = {}  # function string -> canonical function string
+    failed: dict[str, str] = {}  # canonical function string -> evaluation error
+    with timing.phase('compile'):
+        for f in function_strings:
+            try:
+                eq = equations.get(f)
+                if eq.expression.type == ExpressionType.NONE:
+                    errors[f] = "Bad function string"
+                else:
+                    valid[f] = eq.function_string
+            except ParserError as e:
+                errors[f] = error_text(e)
+        group = equations.get_group(list(dict.fromkeys(valid.values()))) if len(valid) > 0 else None
+
+    pieces: dict[str, list] = {key: [] for key in valid.values()}  # canonical function string -> (label, piece)
+    if group is not None:
+        for label, z in z_array.labeled_points:
+            with timing.phase('evaluate'):
+                try:
+                    values = evaluate_group(results, group, z, ln_branches, timing)
+                except ParserError:
+                    # one of the functions can't be evaluated on this stroke, find out which one
+                    values = []
+                    for eq in group.equations:
+                        try:
+                            values.append(evaluate_group(results, equations.get_group([eq.function_string]), z,
+                                                         ln_branches, timing)[0])
+                        except ParserError as e:
+                            failed[eq.function_string] = error_text(e)
+                            values.append(None)
+                for eq, fz in zip(group.equations, values):
+                    if fz is not None:
+                        pieces[eq.function_string] += [(label, piece)
+                                                       for piece in stroke_pieces(fz, reducer, splitter, track)]
+
+    with timing.phase('serialize'):
+        response = []
+        for f in function_strings:
+            if f in errors:
+                response.append({'f': f, 'error': errors[f]})
+            elif valid[f] in failed:
+                response.append({'f': f, 'error': failed[valid[f]]})
+            else:
+                response.append({'f': f, 'strokes': [[label, flatten_branches(piece)]
+                                                     for label, piece in pieces[valid[f]]]})
+        response = app.json.response(response)
+    return timed(timing, response)
 
 if __name__=="__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,339 @@
+"""
+    Concurrent serving mode: an ASGI front end that only reads requests and writes responses,
+    while parsing, evaluation and serialization run in a pool of worker processes (worker.py).
+    Run from the backend directory with any ASGI server, for example: uvicorn asgi:app
+
+    Serves POST /strokes like the Flask app (JSON or the binary format, see WireFormat);
+    NDJSON streaming and /strokes/batch are left to the Flask app. GET /metrics serves the metrics of
+    the requests to local clients, see metrics.py. The WebSocket /live is a live drawing session, see live.py;
+    its evaluations go through the same pool and limits as the requests.
+    - every request gets a time budget, a request that runs out of it gets 504 and its worker is restarted;
+    - identical requests arriving while the first one is evaluated share its result;
+    - at most max_pending different requests are evaluated or queued, the rest get 503 right away,
+      so a burst can't grow the queue and the latency of everyone in it.
+    Settings come from the environment:
+        COMPLEX_WORKERS        worker processes, the number of cores by default
+        COMPLEX_MAX_PENDING    requests evaluated or queued at once, 4 per worker by default
+        COMPLEX_TIME_BUDGET    seconds a request may take, 10 by default
+        COMPLEX_MAX_BODY       largest accepted request body in bytes, 32 MB by default
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import worker
+from live import LiveSession
+from metrics import RequestTiming, Metrics, Counter
+from solver.wire_format import WireFormat
+
+allowed_origins = ['http://localhost:5000', 'https://complex-variable.netlify.app']
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Worker:
+    def __init__(self, context, result_cache_bytes: int):
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=worker.serve, args=(child_conn, result_cache_bytes), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._ready = False
+
+    def call(self, request: tuple) -> tuple[int, str, bytes, dict | None]:
+        # blocking, runs in a thread of the pool
+        if not self._ready:
+            self._conn.recv()
+            self._ready = True
+        self._conn.send(request)
+        return self._conn.recv()
+
+    def kill(self):
+        self._process.kill()
+        self._conn.close()
+
+
+class WorkerPool:
+    """Worker processes taking one request at a time. A worker whose request is cancelled is replaced"""
+    def __init__(self, size: int, result_cache_bytes: int = 64 * 1024 * 1024):
+        self._size = size
+        self._result_cache_bytes = result_cache_bytes
+        # spawn, so a replacement worker isn't forked from a process running threads
+        self._context = multiprocessing.get_context('spawn')
+        self._threads = ThreadPoolExecutor(max_workers=size, thread_name_prefix='worker-pipe')
+        self._idle: asyncio.Queue[Worker] | None = None
+        self._workers: set[Worker] = set()
+        self.restarts = Counter('complex_worker_restarts_total',
+                                'Workers replaced after a cancelled or failed request.')
+        self.restarts.inc(amount=0)  # a sample from the start, not once the first worker is replaced
+
+    @property
+    def started(self):
+        return self._idle is not None
+
+    def start(self):
+        self._idle = asyncio.Queue()
+        for _ in range(self._size):
+            self._idle.put_nowait(self._spawn())
+
+    def stop(self):
+        # busy workers too, their pipe threads must see the end of the pipe for the process to exit
+        for current in self._workers:
+            current.kill()
+        self._workers.clear()
+        self._threads.shutdown(wait=False, cancel_futures=True)
+
+    def _spawn(self) -> Worker:
+        current = Worker(self._context, self._result_cache_bytes)
+        self._workers.add(current)
+        return current
+
+    async def run(self, request: tuple) -> tuple[int, str, bytes, dict | None]:
+        current = await self._idle.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._threads, current.call, request)
+        except BaseException:
+            # cancelled, timed out, or the process died: nothing else may read this pipe
+            current.kill()
+            self._workers.discard(current)
+            current = self._spawn()
+            self.restarts.inc()
+            raise
+        finally:
+            self._idle.put_nowait(current)
+
+
+class Dispatcher:
+    """
+        Runs requests on the pool: identical requests in flight share one evaluation,
+        which is cancelled when the last request waiting for it gives up.
+    """
+    def __init__(self, pool: WorkerPool, max_pending: int):
+        self._pool = pool
+        self._max_pending = max_pending
+        self._in_flight: dict[str, list] = {}  # key -> [task, number of requests waiting for it]
+        self.coalesced = 0
+        self.rejected = 0
+
+    @staticmethod
+    def key(request: tuple) -> str:
+        args, content_type, binary, body = request
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((sorted(args.items()), content_type, binary)).encode())
+        digest.update(body)
+        return digest.hexdigest()
+
+    async def run(self, request: tuple, budget: float) -> tuple[int, str, bytes, dict | None]:
+        key = Dispatcher.key(request)
+        entry = self._in_flight.get(key)
+        if entry is None:
+            if len(self._in_flight) >= self._max_pending:
+                self.rejected += 1
+                raise Overloaded()
+            entry = [asyncio.ensure_future(self._pool.run(request)), 0]
+            self._in_flight[key] = entry
+            entry[0].add_done_callback(lambda _: self._forget(key, entry))
+        else:
+            self.coalesced += 1
+        entry[1] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry[0]), budget)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # nobody waits for it anymore; a request arriving now must not join a cancelled evaluation
+                self._forget(key, entry)
+                entry[0].cancel()
+
+    def _forget(self, key: str, entry: list):
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+
+class Application:
+    def __init__(self, workers: int | None = None, max_pending: int | None = None,
+                 time_budget: float | None = None, max_body: int | None = None):
+        workers = workers or int(os.environ.get('COMPLEX_WORKERS', os.cpu_count() or 1))
+        self.max_pending = max_pending or int(os.environ.get('COMPLEX_MAX_PENDING', 4 * workers))
+        self.time_budget = time_budget or float(os.environ.get('COMPLEX_TIME_BUDGET', 10))
+        self.max_body = max_body or int(os.environ.get('COMPLEX_MAX_BODY', 32 * 1024 * 1024))
+        self.pool = WorkerPool(workers)
+        self.dispatcher = Dispatcher(self.pool, self.max_pending)
+        self.metrics = Metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await self._websocket(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.pool.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.pool.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        if not self.pool.started:
+            self.pool.start()  # the server doesn't send lifespan events
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        cors = Application._cors_headers(headers)
+        method, path = scope['method'], scope['path']
+        if method == 'OPTIONS':
+            await Application._respond(send, 204, 'text/plain', b'', cors + Application._preflight_headers(headers))
+        elif path == '/':
+            await Application._respond(send, 200, 'text/plain', b'Hello, cross-origin-world!', cors)
+        elif path == '/metrics':
+            await self._metrics(scope, send)
+        elif path != '/strokes':
+            await Application._respond(send, 404, 'text/plain', b'Not found', cors)
+        elif method not in ['GET', 'POST']:
+            await Application._respond(send, 405, 'text/plain', b'Method not allowed', cors)
+        else:
+            timing = RequestTiming('strokes')
+            body = await Application._read_body(receive, self.max_body)
+            if body is None:
+                timing.status = 413
+                self.metrics.observe(timing)
+                await Application._respond(send, 413, 'text/plain', b'Request too large', cors)
+                return
+            args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+            content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+            binary = Application.accepts(headers.get('accept', ''), WireFormat.mimetype)
+            status, response_type, response, record = await self._evaluate((args, content_type, binary, body),
+                                                                           receive)
+            if status is None:
+                return  # the client is gone
+            if record is not None:
+                timing.update(record)
+            timing.status = status
+            self.metrics.observe(timing)
+            await Application._respond(send, status, response_type, response,
+                                       cors + [(b'vary', b'Accept'),
+                                               (b'server-timing', timing.server_timing().encode('latin-1'))])
+
+    async def _metrics(self, scope, send):
+        # for a Prometheus server on the same host
+        client = scope.get('client') or ('', 0)
+        if client[0] not in ['127.0.0.1', '::1']:
+            await Application._respond(send, 403, 'text/plain', b'Forbidden', [])
+            return
+        text = self.metrics.render({'complex_requests_coalesced': self.dispatcher.coalesced,
+                                    'complex_requests_rejected': self.dispatcher.rejected}, [self.pool.restarts])
+        await Application._respond(send, 200, 'text/plain; version=0.0.4', text.encode(), [])
+
+    async def _websocket(self, scope, receive, send):
+        if not self.pool.started:
+            self.pool.start()
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        # browsers don't apply CORS to WebSockets, the origin is checked here
+        if scope['path'] != '/live' or headers.get('origin', allowed_origins[0]) not in allowed_origins:
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+        await send({'type': 'websocket.accept'})
+        session = LiveSession(self._dispatch)
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('text') is None:
+                replies = [{'type': 'error', 'error': 'Bad message'}]
+            else:
+                # one message at a time, the replies keep the order of the drawing
+                replies = await session.handle(message['text'])
+            for reply in replies:
+                await send({'type': 'websocket.send', 'text': json.dumps(reply)})
+
+    async def _dispatch(self, request: tuple) -> tuple[int, str, bytes, dict | None]:
+        try:
+            return await self.dispatcher.run(request, self.time_budget)
+        except Overloaded:
+            return 503, 'text/plain', b'Server is busy', None
+        except asyncio.TimeoutError:
+            return 504, 'text/plain', b'Time budget exceeded', None
+        except (EOFError, OSError):
+            return 500, 'text/plain', b'Worker failed', None
+
+    async def _evaluate(self, request: tuple, receive) -> tuple[int | None, str, bytes, dict | None]:
+        work = asyncio.ensure_future(self._dispatch(request))
+        disconnect = asyncio.ensure_future(Application._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait([work, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        if not work.done():
+            work.cancel()
+            return None, '', b'', None
+        try:
+            return work.result()
+        except asyncio.CancelledError:
+            return 500, 'text/plain', b'Worker failed', None
+
+    @staticmethod
+    def accepts(accept: str, mimetype: str) -> bool:
+        # named explicitly with a non-zero quality, '*/*' alone means the default JSON
+        for part in accept.split(','):
+            name, *params = [item.strip() for item in part.split(';')]
+            if name.lower() == mimetype:
+                return all(param.replace(' ', '') not in ['q=0', 'q=0.0', 'q=0.00', 'q=0.000'] for param in params)
+        return False
+
+    @staticmethod
+    async def _read_body(receive, max_body: int) -> bytes | None:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def _cors_headers(headers: dict[str, str]) -> list[tuple[bytes, bytes]]:
+        origin = headers.get('origin')
+        if origin not in allowed_origins:
+            return []
+        return [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+
+    @staticmethod
+    def _preflight_headers(headers: dict[str, str]) -> list[tuple[bytes, bytes]]:
+        result = [(b'access-control-allow-methods', b'GET, POST, OPTIONS')]
+        if 'access-control-request-headers' in headers:
+            result.append((b'access-control-allow-headers', headers['access-control-request-headers'].encode('latin-1')))
+        return result
+
+    @staticmethod
+    async def _respond(send, status: int, content_type: str, body: bytes, headers: list[tuple[bytes, bytes]]):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode('latin-1')),
+                                (b'content-length', str(len(body)).encode('latin-1')), *headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = Application()
@@ -0,0 +1,82 @@
+"""
+    Strokes and formulas for the benchmarks, shaped like what the frontend sends.
+    The drawing tools densify every line before sending it (scatterLine in Main.tsx, 0.01 apart),
+    so a stroke is a polyline with points about 0.01 apart, labeled with the id of its line.
+"""
+import numpy as np
+
+from solver.parser import Parser
+
+spacing = 0.01
+
+
+def densify(vertices: list[complex], closed: bool = False) -> np.ndarray:
+    """Points about spacing apart along the polyline through vertices"""
+    z = np.asarray(vertices + vertices[:1] if closed else vertices, dtype=np.complex128)
+    pieces = []
+    for a, b in zip(z[:-1], z[1:]):
+        count = max(int(np.ceil(abs(b - a) / spacing)), 1)
+        pieces.append(a + (b - a) * np.arange(count) / count)
+    pieces.append(z[-1:])
+    return np.concatenate(pieces)
+
+
+def labeled(strokes: list[np.ndarray]) -> list:
+    """The z field of a /strokes request: [[label, [[x, y], ...]], ...]"""
+    return [[label, np.stack((z.real, z.imag), axis=-1).tolist()] for label, z in enumerate(strokes, start=1)]
+
+
+def dots(count: int = 200) -> list[np.ndarray]:
+    # the dots tool: every click is a stroke of a single point
+    rng = np.random.default_rng(0)
+    return [rng.uniform(-3, 3, 1) + 1j * rng.uniform(-3, 3, 1) for _ in range(count)]
+
+
+def pencil(count: int = 3) -> list[np.ndarray]:
+    # long freehand lines, wandering across the plane
+    strokes = []
+    for n in range(count):
+        t = np.linspace(0, 2 * np.pi, 60)
+        vertices = (2.5 * np.cos(t + n) + 0.6 * np.sin(5 * t) + 1j * (1.8 * np.sin(2 * t + n) + 0.4 * np.cos(7 * t)))
+        strokes.append(densify(vertices.tolist()))
+    return strokes
+
+
+def rectangle() -> list[np.ndarray]:
+    return [densify([-2 - 1.5j, 2 - 1.5j, 2 + 1.5j, -2 + 1.5j], closed=True)]
+
+
+def ellipse() -> list[np.ndarray]:
+    t = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+    return [densify((2.5 * np.cos(t) + 1.5j * np.sin(t) + (0.3 + 0.2j)).tolist(), closed=True)]
+
+
+strokes = {'dots': dots, 'pencil': pencil, 'rectangle': rectangle, 'ellipse': ellipse}
+
+
+def nested(depth: int) -> str:
+    functions = ['sin', 'ln', 'ch', 'atg', 'cos', 'sh']
+    f = 'z'
+    for i in range(depth):
+        f = f'{functions[i % len(functions)]}({f}/2+{i % 3})'
+    return f
+
+
+def formulas() -> dict[str, str]:
+    """A name for every formula: every function of the parser, then compound and nested expressions"""
+    corpus = {f'{name}': f'{name}(z)' for name in Parser.unary_functions}
+    corpus['log'] = 'log(z, 2)'
+    corpus['root'] = 'root(z, 3)'
+    corpus.update({
+        'polynomial': '3*z^5 - 2*z^3 + z/2 - 7',
+        'rational': '(z^2 + 1)/(z^2 - 1)',
+        'exponential': 'e^(i*z) + e^(-i*z)',
+        'mixed': 'sin(z)*ln(z) + root(z^2 + 1, 2)',
+        'shared': 'sin(z^2 + 1)/(1 + sin(z^2 + 1))^2',
+        'branches': 'ln(z) + atg(z)',
+        'nested 4': nested(4),
+        'nested 8': nested(8),
+    })
+    missing = set(Parser.unary_functions + Parser.binary_functions) - set(corpus)
+    assert not missing, missing
+    return corpus
@@ -0,0 +1,332 @@
+"""
+    Load test of /strokes: many clients sending the requests of a class drawing at once.
+    Requests are shaped like the ones of getStrokes in Main.tsx: POST /strokes?f=... with the JSON body
+    {"z": [[label, [[x, y], ...]], ...], "lnBranches": n}. They are synthesized (popular functions of the course
+    more often than the rest, some functions nobody sent before, strokes drawn again with another function)
+    or replayed from a JSON lines file of {"f", "lnBranches", "z"} objects, which --save writes.
+    Run from the backend directory; the server is started on a free port and stopped at the end:
+        python -m benchmarks.load --server flask --concurrency 8 --duration 30 --output before.json
+        python -m benchmarks.load --server asgi --rate 20 --duration 60 --compare before.json
+        python -m benchmarks.load --url http://127.0.0.1:5000 --pid 1234 --replay traffic.jsonl
+    Without --rate, every one of --concurrency clients sends its next request as soon as it has the answer.
+    With --rate, requests arrive at random (Poisson) at that many per second, at most --concurrency at once,
+    and latency counts from the arrival, so a server falling behind shows in it.
+    The report has the throughput, latency percentiles, errors by status and the resident memory of the server
+    and its child processes, sampled during the run (memory is read from /proc, so Linux only).
+    --compare prints what got worse than --threshold times an earlier run and exits with 1 if anything did.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks import fixtures
+from benchmarks.suite import git_commit
+from solver.equation_cache import EquationCache
+
+servers = {
+    'flask': ['-c', 'from app import app; app.run(host="127.0.0.1", port={port}, threaded=True)'],
+    'asgi': ['-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def synthesize(count: int, seed: int = 0, unique_share: float = 0.05, redraw_share: float = 0.3) -> list[dict]:
+    """count requests of students drawing: unique_share of them with a new function, redraw_share with strokes sent before"""
+    rng = np.random.default_rng(seed)
+    popular = EquationCache.default_catalog
+    others = list(fixtures.formulas().values())
+    # the frontend default is 4, 0 is "principal branch only"
+    ln_branches = [0, 1, 2, 3, 4, 6, 10, 25, 49]
+    ln_weights = [0.1, 0.05, 0.05, 0.05, 0.55, 0.1, 0.05, 0.03, 0.02]
+    shapes = [lambda: fixtures.dots(int(rng.integers(1, 30))), lambda: fixtures.pencil(int(rng.integers(1, 4))),
+              fixtures.rectangle, fixtures.ellipse]
+    requests = []
+    for i in range(count):
+        f = str(rng.choice(popular)) if rng.random() < 0.8 else str(rng.choice(others))
+        if rng.random() < unique_share:
+            f = f'({f})+{i}/1000'
+        if len(requests) > 0 and rng.random() < redraw_share:
+            z = requests[int(rng.integers(len(requests)))]['z']
+        else:
+            zs = shapes[int(rng.integers(len(shapes)))]()
+            scale = rng.uniform(0.3, 2)
+            shift = complex(*rng.uniform(-2, 2, 2))
+            z = fixtures.labeled([stroke * scale + shift for stroke in zs])
+        requests.append({'f': f, 'lnBranches': int(rng.choice(ln_branches, p=ln_weights)), 'z': z})
+    return requests
+
+
+def read_requests(path: str) -> list[dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_requests(path: str, requests: list[dict]):
+    with open(path, 'w') as file:
+        for r in requests:
+            file.write(json.dumps(r) + '\n')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, port: int) -> subprocess.Popen:
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, *(part.replace('{port}', str(port)) for part in servers[kind])]
+    return subprocess.Popen(command, cwd=backend, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url + '/', timeout=1).close()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def rss(pid: int) -> int:
+    """Resident bytes of a process and all its descendants"""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as file:
+                    # the command in parentheses may contain spaces, the parent pid is the second field after it
+                    parent = int(file.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending += children.get(current, [])
+        try:
+            with open(f'/proc/{current}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class Load:
+    def __init__(self, url: str, requests: list[dict], timeout: float):
+        self.url = url
+        self.bodies = [(urllib.parse.urlencode({'f': r['f']}), json.dumps({'z': r['z'], 'lnBranches': r['lnBranches']})
+                        .encode()) for r in requests]
+        self.timeout = timeout
+        self.results: list[tuple[float, float, str]] = []  # (finished at, latency, status) per request
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _take(self) -> tuple[str, bytes]:
+        with self._lock:
+            body = self.bodies[self._next % len(self.bodies)]
+            self._next += 1
+            return body
+
+    def send(self, arrived: float | None = None):
+        query, body = self._take()
+        started = arrived if arrived is not None else time.perf_counter()
+        # what fetch sends for a string body
+        request = urllib.request.Request(f'{self.url}/strokes?{query}', data=body, method='POST',
+                                         headers={'Content-Type': 'text/plain;charset=UTF-8'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status = str(response.status)
+        except urllib.error.HTTPError as e:
+            status = str(e.code)
+        except OSError as e:
+            status = type(e).__name__
+        finished = time.perf_counter()
+        with self._lock:
+            self.results.append((finished, finished - started, status))
+
+    def closed(self, concurrency: int, duration: float, limit: int | None):
+        deadline = time.perf_counter() + duration
+
+        def client():
+            while time.perf_counter() < deadline and (limit is None or self._next < limit):
+                self.send()
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def open(self, rate: float, concurrency: int, duration: float, limit: int | None, seed: int):
+        rng = np.random.default_rng(seed)
+        started = time.perf_counter()
+        arrival = started
+        count = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while arrival - started < duration and (limit is None or count < limit):
+                arrival += rng.exponential(1 / rate)
+                time.sleep(max(arrival - time.perf_counter(), 0))
+                pool.submit(self.send, arrival)
+                count += 1
+
+
+def summarize(results: list[tuple[float, float, str]], started: float, memory: list[tuple[float, int]]) -> dict:
+    elapsed = max((finished for finished, _, _ in results), default=started) - started
+    latencies = np.array([latency for _, latency, status in results if status == '200'])
+    statuses: dict[str, int] = {}
+    for _, _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    errors = len(results) - len(latencies)
+    summary = {'requests': len(results), 'statuses': statuses, 'error_rate': errors / max(len(results), 1),
+               'seconds': elapsed, 'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0}
+    if len(latencies) > 0:
+        summary['latency'] = {'mean': float(latencies.mean()), 'max': float(latencies.max()),
+                              **{f'p{q}': float(np.percentile(latencies, q)) for q in [50, 90, 95, 99]}}
+    if len(memory) > 0:
+        values = [value for _, value in memory]
+        summary['rss'] = {'start': values[0], 'peak': max(values), 'end': values[-1], 'growth': values[-1] - values[0]}
+    return summary
+
+
+def timeline(results: list[tuple[float, float, str]], started: float,
+             memory: list[tuple[float, int]]) -> list[dict]:
+    seconds = int(max((finished for finished, _, _ in results), default=started) - started) + 1
+    points = [{'second': s, 'done': 0, 'errors': 0, 'rss': None} for s in range(seconds)]
+    for finished, _, status in results:
+        point = points[min(int(finished - started), seconds - 1)]
+        point['done'] += 1
+        point['errors'] += status != '200'
+    for at, value in memory:
+        if 0 <= at - started < seconds:
+            points[int(at - started)]['rss'] = value
+    return points
+
+
+def compare(summary: dict, old_path: str, threshold: float) -> int:
+    """Prints what got worse than threshold times the old run, returns how many"""
+    with open(old_path) as file:
+        old = json.load(file)['summary']
+    checks = [('throughput', old['throughput'], summary['throughput'], False)]
+    for q in ['p50', 'p90', 'p99']:
+        if 'latency' in old and 'latency' in summary:
+            checks.append((f'latency {q}', old['latency'][q], summary['latency'][q], True))
+    if 'rss' in old and 'rss' in summary:
+        checks.append(('rss peak', old['rss']['peak'], summary['rss']['peak'], True))
+    worse = 0
+    print(f'\n{"measure":<14}{"old":>14}{"new":>14}{"ratio":>8}')
+    for name, before, after, higher_is_worse in checks:
+        ratio = after / before if before > 0 else float('inf')
+        if (ratio > threshold) if higher_is_worse else (ratio < 1 / threshold):
+            worse += 1
+            print(f'{name:<14}{before:>14.4g}{after:>14.4g}{ratio:>8.2f}')
+    if summary['error_rate'] > old['error_rate'] + 0.01:
+        worse += 1
+        print(f'{"error rate":<14}{old["error_rate"]:>14.4g}{summary["error_rate"]:>14.4g}')
+    print(f'{worse} measures worse than {threshold}x')
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=list(servers), default='flask', help='server to start')
+    parser.add_argument('--url', help='a server already running, instead of starting one')
+    parser.add_argument('--pid', type=int, help='process of the server at --url, for its memory')
+    parser.add_argument('--replay', help='JSON lines file of requests, instead of synthesized ones')
+    parser.add_argument('--save', help='where to write the requests, as JSON lines')
+    parser.add_argument('--payloads', type=int, default=500, help='number of requests synthesized')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8, help='clients, or requests in flight with --rate')
+    parser.add_argument('--rate', type=float, help='requests per second arriving at random')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--requests', type=int, help='stop after that many requests')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds a client waits for an answer')
+    parser.add_argument('--output', help='where to write the JSON report')
+    parser.add_argument('--compare', help='JSON report of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+
+    requests = read_requests(args.replay) if args.replay else synthesize(args.payloads, args.seed)
+    if args.save:
+        write_requests(args.save, requests)
+
+    process = None
+    url, pid = args.url, args.pid
+    if url is None:
+        port = free_port()
+        process = start_server(args.server, port)
+        url, pid = f'http://127.0.0.1:{port}', process.pid
+    memory: list[tuple[float, int]] = []
+    done = threading.Event()
+
+    def sample_memory():
+        while pid is not None and not done.is_set():
+            memory.append((time.perf_counter(), rss(pid)))
+            done.wait(0.5)
+
+    try:
+        wait_until_up(url.rstrip('/'))
+        load = Load(url.rstrip('/'), requests, args.timeout)
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        if args.rate:
+            load.open(args.rate, args.concurrency, args.duration, args.requests, args.seed)
+        else:
+            load.closed(args.concurrency, args.duration, args.requests)
+        done.set()
+        sampler.join()
+        if pid is not None:
+            memory.append((time.perf_counter(), rss(pid)))
+    finally:
+        done.set()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    summary = summarize(load.results, started, memory)
+    result = {
+        'meta': {'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'server': args.url or args.server,
+                 'payloads': len(requests), 'replay': args.replay, 'seed': args.seed,
+                 'concurrency': args.concurrency, 'rate': args.rate, 'duration': args.duration},
+        'summary': summary,
+        # one point a second: requests done, errors and memory, to see growth over the run
+        'timeline': timeline(load.results, started, memory),
+    }
+    latency = summary.get('latency', {})
+    print(f'{summary["requests"]} requests, {summary["throughput"]:.1f}/s, errors {summary["error_rate"]:.1%}, '
+          f'p50 {latency.get("p50", 0) * 1e3:.1f} ms, p99 {latency.get("p99", 0) * 1e3:.1f} ms'
+          + (f', rss {summary["rss"]["start"] / 2 ** 20:.0f} -> {summary["rss"]["end"] / 2 ** 20:.0f} MB'
+             if 'rss' in summary else ''), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=1)
+    else:
+        json.dump(result, sys.stdout, indent=1)
+    if args.compare and compare(summary, args.compare, args.threshold) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
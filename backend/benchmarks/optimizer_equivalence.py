@@ -0,0 +1,25 @@
+"""
+    Shows what the optimizer saves on the corpus of tests/test_optimizer.py, which checks that it keeps the values.
+    Run from the backend directory: python -m benchmarks.optimizer_equivalence
+    Every formula is compiled with and without the optimizer and timed on whole strokes (VectorSolver).
+"""
+import timeit
+import warnings
+
+from solver.vector_solver import VectorSolver
+from tests.test_optimizer import corpus, functions, points
+
+
+def main():
+    warnings.filterwarnings('ignore')
+    z = points()
+    print(f'{"function":<32}{"plain us":>10}{"optimized us":>14}')
+    for f in corpus:
+        plain, optimized = functions(f, VectorSolver)
+        before = min(timeit.repeat(lambda: plain(z, num_branches=3), number=20, repeat=3)) / 20
+        after = min(timeit.repeat(lambda: optimized(z, num_branches=3), number=20, repeat=3)) / 20
+        print(f'{f:<32}{before * 1e6:>10.1f}{after * 1e6:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+    Parse time against token count for long sums and deeply nested calls.
+    Run from the backend directory: python -m benchmarks.parser_scaling
+    The time per token should stay flat as the expressions grow.
+"""
+import sys
+import timeit
+
+from solver.parser import Parser
+
+
+def long_sum(terms: int) -> str:
+    parts = ['2*z^2', 'sin(z)', 'z/3', 'ln(z)']
+    return '+'.join(parts[i % len(parts)] for i in range(terms))
+
+
+def nested_calls(depth: int) -> str:
+    functions = ['ln', 'sin', 'cos', 'sh']
+    f = 'z'
+    for i in range(depth):
+        f = f'{functions[i % len(functions)]}({f}+{i})'
+    return f
+
+
+def measure(f: str, repeat: int = 5) -> tuple[int, float, float]:
+    tokens = Parser.tokenize(f)
+    tokenize = min(timeit.repeat(lambda: Parser.tokenize(f), number=1, repeat=repeat))
+    parse = min(timeit.repeat(lambda: Parser._parse_expression(tokens, 0, Parser._first_argument_priorities(tokens)),
+                              number=1, repeat=repeat))
+    return len(tokens), tokenize, parse
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    print(f'{"shape":<8}{"tokens":>8}{"tokenize ms":>14}{"parse ms":>12}{"parse us/token":>16}')
+    for name, make, sizes in [('sum', long_sum, [50, 100, 200, 400, 800, 1600]),
+                              ('nested', nested_calls, [10, 20, 40, 80, 160, 320])]:
+        for size in sizes:
+            count, tokenize, parse = measure(make(size))
+            print(f'{name:<8}{count:>8}{tokenize * 1e3:>14.3f}{parse * 1e3:>12.3f}{parse * 1e6 / count:>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
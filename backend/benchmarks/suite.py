@@ -0,0 +1,162 @@
+"""
+    Benchmark suite: tokenize, parse, compile, evaluate and serialize times of every formula of the corpus
+    on every stroke fixture (see fixtures.py), and the /strokes endpoint of the Flask app end to end.
+    Run from the backend directory:
+        python -m benchmarks.suite --output before.json
+        python -m benchmarks.suite --output after.json --compare before.json
+    Times are the best of --repeat runs, in seconds. The output is a JSON file with a record per
+    (formula, fixture, phase), so the files of two commits can be compared; --compare prints the phases
+    slower than --threshold times the old ones (when longer than --floor) and exits with 1 if there are any.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import warnings
+
+import numpy as np
+
+from benchmarks import fixtures
+from solver.compiler import Compiler, CompiledExpression
+from solver.optimizer import Optimizer
+from solver.parser import Parser
+from solver.vector_solver import VectorSolver
+from solver.wire_format import WireFormat
+from solver.equation_cache import EquationCache
+from solver.result_cache import ResultCache
+from strokes import flatten_branches
+
+
+def best(f, repeat: int) -> float:
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+
+def measure_formula(f: str, strokes: dict[str, list[np.ndarray]], repeat: int) -> list[dict]:
+    records = []
+    tokens = Parser.tokenize(f)
+    expression = Parser.try_get_expression(f, True)[1]
+    records.append({'phase': 'tokenize', 'seconds': best(lambda: Parser.tokenize(f), repeat)})
+    records.append({'phase': 'parse', 'seconds': best(
+        lambda: Parser._parse_expression(tokens, 0, Parser._first_argument_priorities(tokens)), repeat)})
+    # generated every time, Compiler.compile would return its cached code after the first run
+    records.append({'phase': 'compile', 'seconds': best(
+        lambda: CompiledExpression(*Compiler.generate([Optimizer.optimize(expression)])), repeat)})
+    compiled = Compiler.compile(Optimizer.optimize(expression))
+    records.append({'phase': 'link', 'seconds': best(lambda: Compiler.link(compiled, VectorSolver), repeat)})
+    function = VectorSolver.wrap_for_array(Compiler.link(compiled, VectorSolver))
+    for name, zs in strokes.items():
+        fixture = {'fixture': name, 'strokes': len(zs), 'points': sum(len(z) for z in zs)}
+        values = [function(z) for z in zs]
+        fixture['branches'] = max(fz.shape[0] for fz in values)
+        labeled_values = list(enumerate(values, start=1))
+        records += [
+            {**fixture, 'phase': 'evaluate', 'seconds': best(lambda: [function(z) for z in zs], repeat)},
+            {**fixture, 'phase': 'serialize json', 'seconds': best(
+                lambda: json.dumps([[label, flatten_branches(fz)] for label, fz in labeled_values]), repeat)},
+            {**fixture, 'phase': 'serialize binary', 'seconds': best(
+                lambda: WireFormat.encode(labeled_values), repeat)},
+        ]
+    return records
+
+
+def measure_endpoint(f: str, bodies: dict[str, bytes], repeat: int) -> list[dict]:
+    import app as server  # the Flask app, imported only when the endpoint is measured
+
+    client = server.app.test_client()
+    records = []
+
+    def post(body: bytes):
+        response = client.post('/strokes', query_string={'f': f}, data=body, content_type='application/json')
+        assert response.status_code == 200, response.status_code
+        return response
+
+    def cold(body: bytes):
+        # a function and strokes never seen by the server
+        server.equations = EquationCache(max_size=256)
+        server.results = ResultCache()
+        return post(body)
+
+    for name, body in bodies.items():
+        records += [{'fixture': name, 'phase': 'endpoint cold', 'seconds': best(lambda: cold(body), repeat)},
+                    {'fixture': name, 'phase': 'endpoint warm', 'seconds': best(lambda: post(body), repeat)}]
+    return records
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records: list[dict], old_path: str, threshold: float, floor: float) -> int:
+    """Prints the phases slower than threshold times the old ones, returns their number; below floor is noise"""
+    with open(old_path) as file:
+        old = {(r['formula'], r.get('fixture'), r['phase']): r['seconds'] for r in json.load(file)['results']}
+    slower = 0
+    print(f'\n{"formula":<14}{"fixture":<11}{"phase":<18}{"old ms":>10}{"new ms":>10}{"ratio":>8}')
+    for r in records:
+        before = old.get((r['formula'], r.get('fixture'), r['phase']))
+        if before is None or max(before, r['seconds']) < floor:
+            continue
+        ratio = r['seconds'] / before
+        if ratio > threshold:
+            slower += 1
+            print(f'{r["formula"]:<14}{r.get("fixture") or "":<11}{r["phase"]:<18}'
+                  f'{before * 1e3:>10.3f}{r["seconds"] * 1e3:>10.3f}{ratio:>8.2f}')
+    print(f'{slower} phases slower than {threshold}x')
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    parser.add_argument('--floor', type=float, default=1e-3, help='seconds under which phases are not compared')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--formulas', nargs='*', help='names of the formulas to run, all by default')
+    parser.add_argument('--no-endpoint', action='store_true', help='skip the Flask test client')
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+
+    corpus = fixtures.formulas()
+    if args.formulas:
+        corpus = {name: corpus[name] for name in args.formulas}
+    strokes = {name: make() for name, make in fixtures.strokes.items()}
+    bodies = {name: json.dumps({'z': fixtures.labeled(zs), 'lnBranches': 6}).encode() for name, zs in strokes.items()}
+
+    records = []
+    started = time.perf_counter()
+    for name, f in corpus.items():
+        formula_records = measure_formula(f, strokes, args.repeat)
+        if not args.no_endpoint:
+            # what the app writes to stdout must not end in the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                formula_records += measure_endpoint(f, bodies, args.repeat)
+        records += [{'formula': name, **r} for r in formula_records]
+        evaluate = sum(r['seconds'] for r in formula_records if r['phase'] == 'evaluate')
+        print(f'{name:<14}{evaluate * 1e3:>10.3f} ms evaluate, all fixtures', file=sys.stderr)
+
+    result = {
+        'meta': {'commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+                 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'repeat': args.repeat, 'seconds': time.perf_counter() - started},
+        'results': records,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=1)
+    else:
+        json.dump(result, sys.stdout, indent=1)
+    if args.compare and compare(records, args.compare, args.threshold, args.floor) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
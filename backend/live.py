@@ -0,0 +1,132 @@
+"""
+    Live drawing over a WebSocket (see asgi.py, /live): the server keeps the function and the points
+    drawn so far, the client sends only what it adds and gets back only the images of the new points.
+    Messages are JSON objects, told apart by their type:
+        client -> {"type": "function", "f": "ln(z)", "lnBranches": 6}
+                  {"type": "points", "label": 1, "points": [[x, y], ...]}   points appended to a stroke
+                  {"type": "clear", "label": 1}                             without label, all strokes
+        server -> {"type": "function", "f": "ln(z)"}                          the function is compiled
+                  {"type": "values", "label": 1, "start": 41, "branches": 5, "values": [[u, v], ...]}
+                  {"type": "error", "error": text}
+    values are the images of the points of the stroke from index start on, flattened like /strokes does:
+    all branches of the first point, then of the second one. Every message repeats the last point
+    the client already has (start is one less than the number of points it had), so the lines of
+    two messages join even when they have a different number of branches.
+    A value the function doesn't have at a point (a pole, a cut) is null instead of a pair.
+    The branches of a message are in the order of the branches already sent for the stroke: the server
+    keeps the values of the last point sent and puts the rows of the new points in their order.
+    When the function changes, every stroke comes back whole, from start 0, and so does a stroke
+    whose branches at the repeated point aren't the ones sent already.
+"""
+import json
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from solver.wire_format import WireFormat
+
+# the worker request of asgi.py: (args, content type, binary, body) -> (status, content type, body, timing)
+Evaluate = Callable[[tuple], Awaitable[tuple]]
+
+
+class LiveSession:
+    def __init__(self, evaluate: Evaluate, max_points: int = 1_000_000):
+        self._evaluate = evaluate
+        self.max_points = max_points
+        self.function: str | None = None
+        self.ln_branches = 6
+        self.strokes: dict[float, np.ndarray] = {}  # label -> complex points
+        self.last: dict[float, np.ndarray] = {}  # label -> values of its last point sent, a value per branch
+
+    @property
+    def points(self) -> int:
+        return sum(len(z) for z in self.strokes.values())
+
+    async def handle(self, text: str) -> list[dict]:
+        """The messages to send back for a message of the client"""
+        try:
+            message = json.loads(text)
+            kind = message['type']
+            if kind == 'function':
+                return await self._set_function(message['f'], int(message.get('lnBranches', 6)))
+            if kind == 'points':
+                return await self._append(float(message['label']), message['points'])
+            if kind == 'clear':
+                if message.get('label') is None:
+                    self.strokes.clear()
+                    self.last.clear()
+                else:
+                    self.strokes.pop(float(message['label']), None)
+                    self.last.pop(float(message['label']), None)
+                return []
+        except (TypeError, ValueError, KeyError, AttributeError):
+            pass
+        return [{'type': 'error', 'error': 'Bad message'}]
+
+    async def _set_function(self, f: str, ln_branches: int) -> list[dict]:
+        self.function = f
+        self.ln_branches = ln_branches
+        strokes = [(label, z, 0) for label, z in self.strokes.items()]
+        # a request without strokes checks that the function compiles
+        status, _, body = await self._request([])
+        if status != 200:
+            self.function = None
+            return [{'type': 'error', 'error': body.decode()}]
+        return [{'type': 'function', 'f': f}, *await self._values(strokes)]
+
+    async def _append(self, label: float, points: list) -> list[dict]:
+        added = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        added = added[:, 0] + 1j * added[:, 1]
+        if self.points + len(added) > self.max_points:
+            return [{'type': 'error', 'error': 'Too many points'}]
+        previous = self.strokes.get(label, np.empty(0, dtype=np.complex128))
+        self.strokes[label] = np.concatenate((previous, added))
+        if self.function is None or len(added) == 0:
+            return []
+        start = max(len(previous) - 1, 0)
+        return await self._values([(label, self.strokes[label][start:], start)])
+
+    async def _values(self, strokes: list[tuple[float, np.ndarray, int]]) -> list[dict]:
+        if len(strokes) == 0:
+            return []
+        status, _, body = await self._request([(label, z) for label, z, _ in strokes])
+        if status != 200:
+            return [{'type': 'error', 'error': body.decode()}]
+        messages = []
+        whole = []  # strokes to send again from the start
+        for (label, z, start), (_, values) in zip(strokes, WireFormat.decode(body)):
+            if start > 0:
+                order = LiveSession.order(self.last.get(label), values[0, :, 0] + 1j * values[0, :, 1])
+                if order is None:
+                    whole.append((label, self.strokes[label], 0))
+                    continue
+                values = values[:, order]
+            self.last[label] = values[-1, :, 0] + 1j * values[-1, :, 1]
+            pairs = values.reshape(-1, 2)
+            finite = np.isfinite(pairs).all(axis=1)
+            # NaN and Infinity aren't JSON, a value the function doesn't have is null
+            pairs = pairs.tolist() if finite.all() else [pair if ok else None for pair, ok in zip(pairs.tolist(), finite)]
+            messages.append({'type': 'values', 'label': label, 'start': start, 'branches': values.shape[1],
+                             'values': pairs})
+        return messages + await self._values(whole)
+
+    @staticmethod
+    def order(last: np.ndarray | None, first: np.ndarray) -> np.ndarray | None:
+        """
+            The rows of the values of a repeated point in the order of the values sent for it,
+            None when they aren't the same values
+        """
+        if last is None or len(last) != len(first):
+            return None
+        same = np.isclose(last[:, None], first[None, :], rtol=1e-9, atol=1e-9, equal_nan=True)
+        order = same.argmax(axis=1)
+        if not same[np.arange(len(last)), order].all() or len(np.unique(order)) != len(order):
+            return None
+        return order
+
+    async def _request(self, strokes: list[tuple[float, np.ndarray]]) -> tuple[int, str, bytes]:
+        # the points go to the worker in the binary format, a single branch per stroke
+        body = WireFormat.encode([(label, z.reshape(1, -1)) for label, z in strokes])
+        args = {'f': self.function, 'lnBranches': str(self.ln_branches)}
+        status, content_type, response, _ = await self._evaluate((args, WireFormat.mimetype, True, body))
+        return status, content_type, response
@@ -0,0 +1,217 @@
+"""
+    Request instrumentation shared by the Flask app and the concurrent serving mode (asgi.py).
+    RequestTiming records how long each phase of one request took and what the request was made of;
+    it is sent back in the Server-Timing header. Metrics aggregates the timings of the process,
+    served in the Prometheus text format at /metrics, and logs a sample of them as JSON lines.
+    Settings come from the environment:
+        COMPLEX_LOG_SAMPLE     share of the requests logged, 0 (none) by default, 1 logs all of them
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('complex.requests')
+
+
+class RequestTiming:
+    # in the order they happen, see Server-Timing
+    phases = ['decode', 'strokes', 'compile', 'evaluate', 'serialize']
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.status = 200
+        self.function: str | None = None
+        self.strokes = 0
+        self.points = 0
+        self.branches = 0
+        self.equation_cached: bool | None = None
+        self.result_hits = 0
+        self.result_misses = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - started
+
+    def add(self, durations: dict[str, float]):
+        for name, duration in durations.items():
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def count_stroke(self, branches: int, points: int, cached: bool):
+        self.strokes += 1
+        self.points += points
+        self.branches = max(self.branches, branches)
+        if cached:
+            self.result_hits += 1
+        else:
+            self.result_misses += 1
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header: the phases done so far and the total, in milliseconds"""
+        entries = [f'{name};dur={self.durations[name] * 1e3:.3f}' for name in RequestTiming.phases
+                   if name in self.durations]
+        return ', '.join([*entries, f'total;dur={self.total * 1e3:.3f}'])
+
+    def record(self) -> dict:
+        """Everything about the request, for the logs and to be sent from a worker process"""
+        return {'route': self.route, 'status': self.status, 'function': self.function, 'strokes': self.strokes,
+                'points': self.points, 'branches': self.branches, 'equation_cached': self.equation_cached,
+                'result_hits': self.result_hits, 'result_misses': self.result_misses,
+                'durations': self.durations, 'total': self.total}
+
+    def update(self, record: dict):
+        """Takes what a worker process measured, see record"""
+        self.add(record['durations'])
+        self.function = record['function']
+        for name in ['strokes', 'points', 'branches', 'equation_cached', 'result_hits', 'result_misses']:
+            setattr(self, name, record[name])
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, label_values: tuple = (), amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.values: dict[tuple, list] = {}  # label values -> [count per bucket, sum, count]
+
+    def observe(self, value: float, label_values: tuple = ()):
+        entry = self.values.setdefault(label_values, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _labels((*self.labels, 'le'), (*label_values, _number(bound)))
+                lines.append(f'{self.name}_bucket{bucket_labels} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels((*self.labels, "le"), (*label_values, "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+class Metrics:
+    """
+        Process-wide aggregates of the request timings. Functions are a label of the latency,
+        the first max_functions distinct ones; the others are counted as 'other' so that a client
+        sending random functions can't grow the metrics without bounds.
+    """
+    seconds_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    points_buckets = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+    branches_buckets = (1, 2, 4, 13, 25, 50, 100, 169, 500)
+
+    def __init__(self, max_functions: int = 100, log_sample: float | None = None):
+        self.max_functions = max_functions
+        self.log_sample = log_sample if log_sample is not None else float(os.environ.get('COMPLEX_LOG_SAMPLE', 0))
+        if self.log_sample > 0 and not logger.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        self._functions: set[str] = set()
+        self._lock = threading.Lock()
+        self.requests = Counter('complex_requests_total', 'Requests by route and status.', ('route', 'status'))
+        self.latency = Histogram('complex_request_seconds', 'Time to answer a request, by function.',
+                                 Metrics.seconds_buckets, ('route', 'function'))
+        self.phases = Histogram('complex_request_phase_seconds', 'Time spent in each phase of a request.',
+                                Metrics.seconds_buckets, ('route', 'phase'))
+        self.points = Histogram('complex_request_points', 'Points evaluated or sent per request.',
+                                Metrics.points_buckets, ('route',))
+        self.branches = Histogram('complex_request_branches', 'Largest number of branches of a stroke.',
+                                  Metrics.branches_buckets, ('route',))
+        self.equation_cache = Counter('complex_equation_cache_total', 'Requests whose function was compiled already.',
+                                      ('result',))
+        self.result_cache = Counter('complex_result_cache_total', 'Strokes found in the result cache or evaluated.',
+                                    ('result',))
+
+    def observe(self, timing: RequestTiming):
+        record = timing.record()
+        with self._lock:
+            # only functions that could be evaluated, the others are counted by status
+            function = record['function'] if timing.status < 400 else None
+            if function is not None and function not in self._functions:
+                if len(self._functions) < self.max_functions:
+                    self._functions.add(function)
+                else:
+                    function = 'other'
+            self.requests.inc((timing.route, str(timing.status)))
+            self.latency.observe(record['total'], (timing.route, function or ''))
+            for name, duration in timing.durations.items():
+                self.phases.observe(duration, (timing.route, name))
+            if timing.strokes > 0:
+                self.points.observe(timing.points, (timing.route,))
+                self.branches.observe(timing.branches, (timing.route,))
+            if timing.equation_cached is not None:
+                self.equation_cache.inc(('hit' if timing.equation_cached else 'miss',))
+            self.result_cache.inc(('hit',), timing.result_hits)
+            self.result_cache.inc(('miss',), timing.result_misses)
+        if self.log_sample > 0 and random.random() < self.log_sample:
+            logger.info(json.dumps(record))
+
+    def render(self, gauges: dict[str, float] | None = None, counters: list[Counter] | None = None) -> str:
+        """
+            The metrics in the Prometheus text format, with gauges: current values by metric name,
+            and counters kept outside of the request metrics
+        """
+        with self._lock:
+            lines = []
+            for metric in [self.requests, self.latency, self.phases, self.points, self.branches,
+                           self.equation_cache, self.result_cache]:
+                lines += metric.render()
+        for counter in counters or []:
+            lines += counter.render()
+        for name, value in (gauges or {}).items():
+            lines += [f'# TYPE {name} gauge', f'{name} {_number(value)}']
+        return '\n'.join(lines) + '\n'
+
+
+def cache_gauges(name: str, stats: dict[str, int]) -> dict[str, float]:
+    """Gauges for the stats() of a cache"""
+    return {f'complex_{name}_cache_{stat}': value for stat, value in stats.items()}
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if len(names) == 0:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,67 @@
+from typing import Callable
+import numpy as np
+
+
+class AdaptiveSampler:
+    """
+        Samples a stroke given by its vertices densely only where the image needs it.
+        Every segment is first cut into pieces no longer than max_step, then a piece is halved while
+        the image of its middle is farther than tolerance from the middle of the images of its ends,
+        for any branch. All the middles of one round are evaluated together, in one call.
+        Pieces around poles and cuts never get straight, they stop after max_depth halvings,
+        and no piece is halved once the stroke has max_points points.
+    """
+    def __init__(self, tolerance: float = 0.01, max_step: float = 0.25, max_depth: int = 10,
+                 max_points: int = 100_000):
+        if not tolerance > 0 or not max_step > 0 or max_depth < 0 or max_points < 2:
+            raise ValueError('Bad sampling parameters')
+        self.tolerance = tolerance
+        self.max_step = max_step
+        self.max_depth = max_depth
+        self.max_points = max_points
+
+    @property
+    def key(self) -> tuple:
+        """What makes results of this sampler differ from others, for the result cache"""
+        return 'adaptive', self.tolerance, self.max_step, self.max_depth, self.max_points
+
+    def sample(self, function: Callable[..., np.ndarray], z: np.ndarray, num_branches: int) -> np.ndarray:
+        """The (branches, points) values at the refined points of the polyline z"""
+        points = self.initial_points(z)
+        values = function(points, num_branches=num_branches)
+        pieces = np.arange(len(points) - 1)  # a piece i goes from points[i] to points[i + 1]
+        for _ in range(self.max_depth):
+            if len(pieces) == 0 or len(points) >= self.max_points:
+                break
+            pieces = pieces[:self.max_points - len(points)]
+            middles = (points[pieces] + points[pieces + 1]) / 2
+            middle_values = function(middles, num_branches=num_branches)
+            if middle_values.shape[0] != values.shape[0]:
+                break  # the number of branches changed along the stroke, nothing to compare with
+            with np.errstate(invalid='ignore'):
+                expected = (values[:, pieces] + values[:, pieces + 1]) / 2
+                error = np.abs(middle_values - expected)
+            # nan and inf are never close enough, the piece is halved until max_depth
+            bent = np.any(~(error <= self.tolerance), axis=0)
+            pieces = pieces[bent]
+            if len(pieces) == 0:
+                break
+            points = np.insert(points, pieces + 1, middles[bent])
+            values = np.insert(values, pieces + 1, middle_values[:, bent], axis=1)
+            # both halves of every halved piece, in the indexes after the insertion
+            left = pieces + np.arange(len(pieces))
+            pieces = np.stack((left, left + 1), axis=-1).reshape(-1)
+        return values
+
+    def initial_points(self, z: np.ndarray) -> np.ndarray:
+        """Vertices of the polyline, with every segment cut into pieces not longer than max_step"""
+        if len(z) < 2:
+            return z
+        lengths = np.abs(np.diff(z))
+        step = max(self.max_step, lengths.sum() / self.max_points)
+        counts = np.maximum(np.ceil(lengths / step), 1).astype(np.int64)
+        # position of each new point within its segment, from 0 to just below 1
+        segment = np.repeat(np.arange(len(counts)), counts)
+        start = np.repeat(np.cumsum(counts) - counts, counts)
+        t = (np.arange(counts.sum()) - start) / counts[segment]
+        return np.append(z[segment] + t * (z[segment + 1] - z[segment]), z[-1])
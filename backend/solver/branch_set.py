@@ -0,0 +1,148 @@
+import math
+import numpy as np
+
+from .stroke_splitter import StrokeSplitter
+
+
+class BranchSet:
+    """
+        Operations on the values of a multi-valued expression: a (branches, points) complex array,
+        a row per branch, like VectorSolver keeps them.
+        Combining two sets is a Cartesian product of their rows, so nested multi-valued functions multiply
+        the number of branches. Each set is kept within a budget derived from the number of branches
+        of the request, and branches equal to another one at every point are dropped.
+        Which rows are kept and their order only depend on the branch numbers, never on the points,
+        so that row k is the same branch in every evaluation, of a stroke or of the middles of its pieces:
+        - of equal branches, the one with the lowest row is kept, and rows keep their order;
+        - when a set has to be cut, the middle rows are kept: the rows of a logarithm go from branch
+          -n to n, the far branches at both ends are the ones that end up outside the view.
+    """
+    rtol = 1e-9
+    atol = 1e-9
+    # projection used to sort the branches, so that equal ones end up next to each other
+    direction = 0.7548776662466927
+
+    @staticmethod
+    def budget(num_branches: int) -> int:
+        """As many branches as a function with a pair of logarithms gives, atg or arth"""
+        return (2 * num_branches + 1) ** 2
+
+    @staticmethod
+    def limit(values: np.ndarray, max_branches: int) -> np.ndarray:
+        """The max_branches middle rows, in their order"""
+        max_branches = max(1, max_branches)
+        rows = values.shape[0]
+        if rows <= max_branches:
+            return values
+        start = (rows - max_branches) // 2
+        return values[start:start + max_branches]
+
+    @staticmethod
+    def fit(values: np.ndarray, fan_out: int, budget: int) -> np.ndarray:
+        """Cut values so that a function giving fan_out branches for each of them stays within budget"""
+        return BranchSet.limit(values, budget // max(1, fan_out))
+
+    @staticmethod
+    def fit_pair(a: np.ndarray, b: np.ndarray, fan_out: int, budget: int) -> tuple[np.ndarray, np.ndarray]:
+        """Cut a and b so that their Cartesian product, fan_out branches for each pair, stays within budget"""
+        allowed = max(1, budget // max(1, fan_out))
+        if a.shape[0] * b.shape[0] <= allowed:
+            return a, b
+        # the smaller set keeps what it can of an even split, the other one gets the rest
+        even = max(1, math.isqrt(allowed))
+        if a.shape[0] <= b.shape[0]:
+            a = BranchSet.limit(a, even)
+            return a, BranchSet.limit(b, allowed // a.shape[0])
+        b = BranchSet.limit(b, even)
+        return BranchSet.limit(a, allowed // b.shape[0]), b
+
+    @staticmethod
+    def unique(values: np.ndarray) -> np.ndarray:
+        """values without the branches equal to an earlier row at every point (within rtol and atol)"""
+        rows, points = values.shape
+        if rows < 2 or points == 0:
+            return values
+        finite = np.flatnonzero(np.isfinite(values).all(axis=0))
+        column = values[:, finite[0] if len(finite) > 0 else 0]
+        key = column.real + BranchSet.direction * column.imag
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        # equal values have keys this close, so only neighbours in the sorted order need to be compared
+        reach = (BranchSet.atol + BranchSet.rtol * np.abs(column[order])) * (1 + BranchSet.direction)
+        duplicate = np.zeros(rows, dtype=bool)
+        for i in range(rows):
+            if duplicate[order[i]]:
+                continue
+            end = i + 1
+            while end < rows and key[end] - key[i] <= max(reach[i], reach[end]):
+                end += 1
+            candidates = order[i + 1:end][~duplicate[order[i + 1:end]]]
+            if len(candidates) == 0:
+                continue
+            close = np.isclose(values[candidates], values[order[i]], rtol=BranchSet.rtol, atol=BranchSet.atol,
+                               equal_nan=True)
+            # of equal branches, the lowest row is kept, whatever the sort order of the points is
+            equal = np.append(candidates[close.all(axis=1)], order[i])
+            duplicate[equal[equal != equal.min()]] = True
+        if not duplicate.any():
+            return values
+        return values[~duplicate]
+
+    @staticmethod
+    def track(values: np.ndarray, jump_ratio: float = 8.0, max_elements: int = 1 << 22) -> np.ndarray:
+        """
+            values with the branches of every point reordered so that every row is a continuous branch.
+            A row keeps its place except across a jump (see StrokeSplitter.jumps), where the values of the rows
+            that jump are matched to the nearest values of the point after it, the closest pairs first.
+            A branch that runs off the computed ones (the last ln(z) + 2 pi i k crossing the cut) still jumps:
+            it gets what is left, the jumps left are where its polyline should be cut
+        """
+        rows, points = values.shape
+        if rows < 2 or points < 2:
+            return values
+        jumps = StrokeSplitter(jump_ratio).jumps(values)
+        moved = np.flatnonzero(jumps.any(axis=0))
+        if len(moved) == 0:
+            return values
+        # following[k][r]: the row after step moved[k] matched to row r before it
+        following = np.empty((len(moved), rows), dtype=np.intp)
+        chunk = max(1, max_elements // (rows * rows))
+        for start in range(0, len(moved), chunk):
+            steps = moved[start:start + chunk]
+            following[start:start + chunk] = BranchSet.match(values[:, steps].T, values[:, steps + 1].T,
+                                                             jumps[:, steps].T)
+        # orders[k + 1][r]: the row of branch r after step moved[k], every point takes the order of the last
+        # step before it
+        orders = np.empty((len(moved) + 1, rows), dtype=np.intp)
+        orders[0] = np.arange(rows)
+        for k in range(len(moved)):
+            orders[k + 1] = following[k][orders[k]]
+        order = orders[np.searchsorted(moved, np.arange(points))]
+        return np.take_along_axis(values, order.T, axis=0)
+
+    @staticmethod
+    def match(a: np.ndarray, b: np.ndarray, free: np.ndarray) -> np.ndarray:
+        """
+            (pairs, rows) values -> for every pair and row of a, the row of b matched to it.
+            The rows that aren't free keep their row, the free ones are matched to the rows left,
+            the mutually nearest pairs of every round at once
+        """
+        pairs, rows = a.shape
+        with np.errstate(invalid='ignore', over='ignore'):
+            distance = np.abs(a[:, :, None] - b[:, None, :])
+        distance[~np.isfinite(distance)] = np.finfo(np.float64).max
+        distance[~free] = np.inf
+        distance.transpose(0, 2, 1)[~free] = np.inf
+        matched = np.tile(np.arange(rows), (pairs, 1))
+        left = free.copy()
+        # the closest pair left is mutually nearest, every round matches at least one pair for each
+        while left.any():
+            nearest_b = distance.argmin(axis=2)
+            nearest_a = distance.argmin(axis=1)
+            pair, row = np.nonzero(left & (np.take_along_axis(nearest_a, nearest_b, axis=1) == np.arange(rows)))
+            column = nearest_b[pair, row]
+            matched[pair, row] = column
+            distance[pair, row, :] = np.inf
+            distance[pair, :, column] = np.inf
+            left[pair, row] = False
+        return matched
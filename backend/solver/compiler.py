@@ -0,0 +1,161 @@
+import numpy as np
+from typing import Callable
+
+from .parser import Expression, Token, TokenType, ExpressionType, ParserError, ParserErrorType
+from .lru_cache import LRUCache
+from .optimizer import Optimizer
+
+
+class CompiledExpression:
+    """
+        Python source generated for an expression, its code object and the names the code expects.
+        Symbols map a name used in the source to what it stands for: ('const', value), ('func1', name),
+        ('func2', name), ('op', operator) or ('ipow', None) for powers with a small integer exponent.
+        The same code object can be linked against Solver to work point by point, or against VectorSolver
+        to work on whole strokes.
+    """
+    def __init__(self, source: str, symbols: dict[str, tuple[str, object]]):
+        self._source = source
+        self._symbols = symbols
+        self._code = compile(source, '<expression>', 'exec')
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @property
+    def code(self):
+        return self._code
+
+
+class Compiler:
+    function_name = 'f'
+    variable_name = 'z'
+    operator_names = {'+': 'add', '-': 'sub', '*': 'mul', '/': 'div', '^': 'pow'}
+    _compiled = LRUCache(max_size=256)
+
+    @staticmethod
+    def compile(exp: Expression) -> CompiledExpression:
+        # expressions are hash-consed, functions written differently that optimize to one tree share their code
+        return Compiler._compiled.get_or_create(exp, lambda: CompiledExpression(*Compiler.generate([exp])))
+
+    @staticmethod
+    def compile_many(expressions: list[Expression]) -> CompiledExpression:
+        """One function returning a tuple with the value of every expression, common parts computed once"""
+        source, symbols = Compiler.generate(expressions, as_tuple=True)
+        return CompiledExpression(source, symbols)
+
+    @staticmethod
+    def link(compiled: CompiledExpression, solver) -> Callable:
+        """Bind the names of the compiled code to the functions of solver (Solver or VectorSolver)"""
+        namespace = {}
+        for name, (kind, value) in compiled.symbols.items():
+            if kind == 'const':
+                namespace[name] = solver.constant(value)
+            elif kind == 'func1':
+                namespace[name] = solver.get_func1(value)
+            elif kind == 'func2':
+                namespace[name] = solver.get_func2(value)
+            elif kind == 'op':
+                namespace[name] = solver.get_binary_operator(value)
+            elif kind == 'ipow':
+                namespace[name] = solver.get_integer_power()
+        exec(compiled.code, namespace)
+        return namespace[Compiler.function_name]
+
+    @staticmethod
+    def generate(expressions: list[Expression], as_tuple=False) -> tuple[str, dict[str, tuple[str, object]]]:
+        generator = _CodeGenerator()
+        results = [generator.emit(exp) for exp in expressions]
+        result = f'({", ".join(results)},)' if as_tuple else results[0]
+        body = [f'    {line}' for line in [*generator.lines, f'return {result}']]
+        source = '\n'.join([f'def {Compiler.function_name}({Compiler.variable_name}, num_branches=6, **kwargs):', *body])
+        return source + '\n', generator.symbols
+
+    @staticmethod
+    def constant_value(token: Token) -> complex:
+        if token.type == TokenType.VALUE:
+            return token.value
+        if token.type == TokenType.NUM:
+            return float(token.value)
+        if token.value == 'i':
+            return 1j
+        if token.value == 'pi':
+            return np.pi
+        if token.value == 'e':
+            return np.e
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, token.value)
+
+
+class _CodeGenerator:
+    def __init__(self):
+        self.lines: list[str] = []
+        self.symbols: dict[str, tuple[str, object]] = {}
+        self._names: dict[tuple, str] = {}
+        self._values: dict[str, str] = {}
+        self._emitted: dict[Expression, str] = {}  # shared subtree -> name holding its value
+
+    def symbol(self, prefix: str, kind: str, value) -> str:
+        key = (kind, type(value), value)
+        if key not in self._names:
+            name = f'{prefix}{len(self.symbols)}'
+            self.symbols[name] = (kind, value)
+            self._names[key] = name
+        return self._names[key]
+
+    def temp(self, expression: str) -> str:
+        # equal subtrees get equal names for their parts, so the same right-hand side means the same value
+        if expression not in self._values:
+            name = f't{len(self.lines)}'
+            self.lines.append(f'{name} = {expression}')
+            self._values[expression] = name
+        return self._values[expression]
+
+    def emit(self, exp: Expression) -> str:
+        """Emit the statements computing exp, return the name holding its value"""
+        if exp not in self._emitted:
+            self._emitted[exp] = self._emit(exp)
+        return self._emitted[exp]
+
+    def _emit(self, exp: Expression) -> str:
+        tokens = exp.value
+        if exp.type == ExpressionType.VAL:
+            if tokens[0].type == TokenType.VAR:
+                return Compiler.variable_name
+            return self.symbol('c', 'const', Compiler.constant_value(tokens[0]))
+        if exp.type == ExpressionType.PAR:
+            return self.emit(tokens[1])
+        if exp.type == ExpressionType.UNARY:
+            if tokens[0].type != TokenType.UNARY or tokens[0].value != '-':
+                raise ParserError(ParserErrorType.NOT_SUPPORTED, tokens[0].value)
+            inner = self.emit(tokens[1])
+            return self.temp(f'-{inner}')
+        if exp.type == ExpressionType.FUNC:
+            if tokens[0].type == TokenType.FUNC1:
+                func = self.symbol(f'{tokens[0].value}_', 'func1', tokens[0].value)
+                arg = self.emit(tokens[2])
+                return self.temp(f'{func}({arg}, num_branches=num_branches)')
+            if tokens[0].type == TokenType.FUNC2:
+                func = self.symbol(f'{tokens[0].value}_', 'func2', tokens[0].value)
+                arg1 = self.emit(tokens[2])
+                arg2 = self.emit(tokens[4])
+                return self.temp(f'{func}({arg1}, {arg2}, num_branches=num_branches)')
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, tokens[0].value)
+        if exp.type == ExpressionType.BINARY:
+            op = tokens[1].value
+            if tokens[1].type != TokenType.BINARY or op not in Compiler.operator_names:
+                raise ParserError(ParserErrorType.NOT_SUPPORTED, op)
+            power = Optimizer.integer_power(tokens[2]) if op == '^' else None
+            if power is not None:
+                # multiplications instead of the generic power
+                func = self.symbol('ipow_', 'ipow', None)
+                return self.temp(f'{func}({self.emit(tokens[0])}, {power})')
+            func = self.symbol(f'{Compiler.operator_names[op]}_', 'op', op)
+            left = self.emit(tokens[0])
+            right = self.emit(tokens[2])
+            return self.temp(f'{func}({left}, {right}, num_branches=num_branches)')
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, exp.type)
@@ -0,0 +1,124 @@
+from .parser import Parser, Expression, Token, TokenType, ExpressionType, ParserError, ParserErrorType
+
+
+class Derivative:
+    """
+        The derivative of an expression in z, as an expression: the chain rule applied to the tree.
+        The rules are those of the principal branches (see PrincipalSolver): ln(z)' = 1/z,
+        root(z, n)' = root(z, n) / (n z) for the root the expression has.
+        real, im, abs and phi have no complex derivative, they raise ParserError.
+        Products with 0 and 1 are left out as the tree is built, Optimizer folds what is left constant.
+    """
+    # f(u)' = rule(u) * u', rules are written in z and u is put in its place
+    rules = {
+        'sin': 'cos(z)', 'cos': '-sin(z)', 'tg': '1/cos(z)^2', 'ctg': '-1/sin(z)^2',
+        'sh': 'ch(z)', 'ch': 'sh(z)', 'th': '1/ch(z)^2', 'cth': '-1/sh(z)^2',
+        'sch': '-th(z)*sch(z)', 'csch': '-cth(z)*csch(z)',
+        'ln': '1/z',
+        'asin': '1/root(1-z^2, 2)', 'acos': '-1/root(1-z^2, 2)', 'atg': '1/(1+z^2)', 'actg': '-1/(1+z^2)',
+        # not root(z^2-1, 2): the cut of the principal arch is (-inf, 1), the cut of this product too
+        'arsh': '1/root(z^2+1, 2)', 'arch': '1/(root(z-1, 2)*root(z+1, 2))', 'arth': '1/(1-z^2)', 'arcth': '1/(1-z^2)',
+    }
+    _parsed_rules: dict[str, Expression] = {}
+
+    @staticmethod
+    def of(exp: Expression) -> Expression:
+        tokens = exp.value
+        if exp.type == ExpressionType.VAL:
+            return _value(1 if tokens[0].type == TokenType.VAR else 0)
+        if exp.type == ExpressionType.PAR:
+            return Derivative.of(tokens[1])
+        if exp.type == ExpressionType.UNARY:
+            return _neg(Derivative.of(tokens[1]))
+        if exp.type == ExpressionType.FUNC:
+            name = tokens[0].value
+            u = tokens[2]
+            if tokens[0].type == TokenType.FUNC1:
+                return _mul(Derivative.substitute(Derivative.rule(name), u), Derivative.of(u))
+            v = tokens[4]
+            du, dv = Derivative.of(u), Derivative.of(v)
+            if name == 'log':
+                # ln(u) / ln(v)
+                ln_u, ln_v = _func('ln', u), _func('ln', v)
+                return _div(_sub(_mul(_div(du, u), ln_v), _mul(ln_u, _div(dv, v))), _pow(ln_v, 2))
+            if name == 'root':
+                # e^(ln(u) / v)
+                return _mul(exp, _sub(_div(du, _mul(v, u)), _div(_mul(_func('ln', u), dv), _pow(v, 2))))
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, name)
+        if exp.type == ExpressionType.BINARY:
+            u, op, v = tokens[0], tokens[1].value, tokens[2]
+            du, dv = Derivative.of(u), Derivative.of(v)
+            if op == '+':
+                return _add(du, dv)
+            if op == '-':
+                return _sub(du, dv)
+            if op == '*':
+                return _add(_mul(du, v), _mul(u, dv))
+            if op == '/':
+                return _div(_sub(_mul(du, v), _mul(u, dv)), _pow(v, 2))
+            if op == '^':
+                if _is(dv, 0):
+                    return _mul(_mul(v, _binary(u, '^', _sub(v, _value(1)))), du)
+                # e^(v ln(u))
+                return _mul(exp, _add(_mul(dv, _func('ln', u)), _div(_mul(v, du), u)))
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, op)
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, exp.type)
+
+    @staticmethod
+    def rule(name: str) -> Expression:
+        if name not in Derivative.rules:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, name)
+        if name not in Derivative._parsed_rules:
+            Derivative._parsed_rules[name] = Parser.try_get_expression(Derivative.rules[name], True)[1]
+        return Derivative._parsed_rules[name]
+
+    @staticmethod
+    def substitute(exp: Expression, u: Expression) -> Expression:
+        """exp with u in place of its variable"""
+        if exp.type == ExpressionType.VAL:
+            return u if exp.value[0].type == TokenType.VAR else exp
+        return Expression([Derivative.substitute(part, u) if isinstance(part, Expression) else part
+                           for part in exp.value], exp.type)
+
+
+def _value(c: complex) -> Expression:
+    return Expression([Token(complex(c), TokenType.VALUE)], ExpressionType.VAL)
+
+
+def _is(exp: Expression, c: complex) -> bool:
+    return exp.type == ExpressionType.VAL and exp.value[0].type == TokenType.VALUE and exp.value[0].value == c
+
+
+def _binary(u: Expression, op: str, v: Expression) -> Expression:
+    return Expression([u, Token(op, TokenType.BINARY), v], ExpressionType.BINARY)
+
+
+def _add(u: Expression, v: Expression) -> Expression:
+    return v if _is(u, 0) else u if _is(v, 0) else _binary(u, '+', v)
+
+
+def _sub(u: Expression, v: Expression) -> Expression:
+    return u if _is(v, 0) else _neg(v) if _is(u, 0) else _binary(u, '-', v)
+
+
+def _mul(u: Expression, v: Expression) -> Expression:
+    if _is(u, 0) or _is(v, 0):
+        return _value(0)
+    return v if _is(u, 1) else u if _is(v, 1) else _binary(u, '*', v)
+
+
+def _div(u: Expression, v: Expression) -> Expression:
+    return _value(0) if _is(u, 0) else u if _is(v, 1) else _binary(u, '/', v)
+
+
+def _pow(u: Expression, n: int) -> Expression:
+    return _binary(u, '^', _value(n))
+
+
+def _neg(u: Expression) -> Expression:
+    return u if _is(u, 0) else Expression([Token('-', TokenType.UNARY), u], ExpressionType.UNARY)
+
+
+def _func(name: str, u: Expression) -> Expression:
+    return Expression([Token(name, TokenType.FUNC1), Token('(', TokenType.PARL), u, Token(')', TokenType.PARR)],
+                      ExpressionType.FUNC)
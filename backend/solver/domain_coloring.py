@@ -0,0 +1,82 @@
+import struct
+import zlib
+from typing import Callable
+import numpy as np
+
+from .branch_set import BranchSet
+
+
+class DomainColoring:
+    """
+        Domain coloring of a function over the plane, cut into square tiles like a web map:
+        the tile (zoom, x, y) is a size x size image of the square of side world / 2 ** zoom whose top left corner
+        is (-world / 2 + x * side, world / 2 - y * side), so zoom 0 covers the square of side world around 0.
+        The hue of a pixel is the argument of f at its center, the lightness grows with the modulus
+        (0 is black, infinity white) and is modulated by rings where the modulus doubles.
+        Multi-valued functions are drawn with their principal branch.
+    """
+    world = 16.0
+    size = 256
+    max_zoom = 40
+    # the color of points where the function has no finite value
+    missing_color = (128, 128, 128)
+
+    @staticmethod
+    def tile_points(zoom: int, x: int, y: int, size: int = size) -> np.ndarray:
+        """The centers of the pixels of the tile, row after row from the top"""
+        if not 0 <= zoom <= DomainColoring.max_zoom:
+            raise ValueError('Bad zoom')
+        side = DomainColoring.world / 2 ** zoom
+        left = -DomainColoring.world / 2 + x * side
+        top = DomainColoring.world / 2 - y * side
+        offsets = (np.arange(size) + 0.5) * (side / size)
+        return ((left + offsets)[None, :] + 1j * (top - offsets)[:, None]).reshape(-1)
+
+    @staticmethod
+    def colors(w: np.ndarray) -> np.ndarray:
+        """(n,) complex values -> (n, 3) uint8 RGB colors"""
+        with np.errstate(all='ignore'):
+            modulus = np.abs(w)
+            hue = (np.angle(w) / (2 * np.pi)) % 1
+            lightness = 2 / np.pi * np.arctan(modulus)
+            rings = np.log2(modulus) % 1
+            lightness = np.clip(lightness * (0.85 + 0.15 * rings), 0, 1)
+        # HSL with full saturation, a channel at a time
+        chroma = np.minimum(lightness, 1 - lightness)
+        channels = []
+        for n in [0, 8, 4]:
+            k = (n + hue * 12) % 12
+            channels.append(lightness - chroma * np.clip(np.minimum(k - 3, 9 - k), -1, 1))
+        result = np.empty((len(w), 3), dtype=np.uint8)
+        for i, channel in enumerate(channels):
+            result[:, i] = np.nan_to_num(channel * 255 + 0.5, nan=0)
+        result[~np.isfinite(w)] = DomainColoring.missing_color
+        return result
+
+    @staticmethod
+    def evaluate(function: Callable[..., np.ndarray], zoom: int, x: int, y: int, size: int = size) -> np.ndarray:
+        """The values of a function compiled for VectorSolver at the pixels of the tile, in one call"""
+        values = function(DomainColoring.tile_points(zoom, x, y, size), num_branches=0)
+        if values.shape[0] == 0:
+            return np.full(size * size, np.nan, dtype=np.complex128)
+        # log(x, y) keeps its own branches whatever num_branches is, the one closest to zero is the principal one
+        return BranchSet.limit(values, 1)[0]
+
+    @staticmethod
+    def image(w: np.ndarray, size: int = size) -> bytes:
+        """The PNG tile of the values returned by evaluate"""
+        return DomainColoring.png(DomainColoring.colors(w).reshape(size, size, 3))
+
+    @staticmethod
+    def png(rgb: np.ndarray) -> bytes:
+        """(height, width, 3) uint8 -> PNG file, 8 bit RGB without filters"""
+        height, width, _ = rgb.shape
+        # every row starts with its filter type, 0
+        raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, -1)), axis=1).tobytes()
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1))
+                + chunk(b'IEND', b''))
@@ -1,5 +1,8 @@
 from .parser import Parser, Expression, ExpressionType
 from .solver import Solver
+from .vector_solver import VectorSolver
+from .compiler import Compiler, CompiledExpression
+from .optimizer import Optimizer
 from .parserError import ParserError
 
 
@@ -7,7 +10,9 @@ class Equation:
     def __init__(self, function_string):
         self._func_str = function_string
         self._expression: Expression | None = None
+        self._compiled: CompiledExpression | None = None
         self._func = None
+        self._vector_func = None
 
     @property
     def function_string(self):
@@ -25,6 +30,12 @@ class Equation:
                 raise e
         return self._expression
 
+    @property
+    def compiled(self):
+        if self._compiled is None and self.is_parsed():
+            self._compiled = Compiler.compile(Optimizer.optimize(self.expression))
+        return self._compiled
+
     @property
     def function(self):
         if self._func is not None:
@@ -32,7 +43,41 @@ class Equation:
         if not self.is_parsed():
             return None
         try:
-            self._func = Solver.get_lambda_for_array(self.expression)
+            self._func = Solver.wrap_for_array(Compiler.link(self.compiled, Solver))
         except ParserError as e:
             raise e
         return self._func
+
+    @property
+    def vector_function(self):
+        if self._vector_func is not None:
+            return self._vector_func
+        if not self.is_parsed():
+            return None
+        self._vector_func = VectorSolver.wrap_for_array(Compiler.link(self.compiled, VectorSolver))
+        return self._vector_func
+
+
+class EquationGroup:
+    """Several equations compiled into one function, their common subexpressions are computed once"""
+    def __init__(self, equations: list[Equation]):
+        self._equations = equations
+        self._compiled: CompiledExpression | None = None
+        self._vector_func = None
+
+    @property
+    def equations(self):
+        return self._equations
+
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = Compiler.compile_many([Optimizer.optimize(eq.expression) for eq in self._equations])
+        return self._compiled
+
+    @property
+    def vector_function(self):
+        """Returns a tuple with the (branches, points) array of every equation"""
+        if self._vector_func is None:
+            self._vector_func = VectorSolver.wrap_for_array(Compiler.link(self.compiled, VectorSolver))
+        return self._vector_func
@@ -0,0 +1,60 @@
+from .equation import Equation, EquationGroup
+from .lru_cache import LRUCache
+from .parser import Parser, TokenType
+from .parserError import ParserError
+
+
+class EquationCache:
+    """
+        Parsed and compiled equations, keyed by the canonical form of the function string,
+        so 'Z ^ 2', 'z^2' and 'x^2' share one entry.
+    """
+    # functions from the course, compiled at startup so the first requests don't pay for it
+    default_catalog = ['z', 'z^2', 'z^3', '1/z', 'z+1/z', 'e^z', 'ln(z)', 'root(z,2)',
+                       'sin(z)', 'cos(z)', 'tg(z)', 'ctg(z)', 'sh(z)', 'ch(z)', 'th(z)',
+                       'asin(z)', 'acos(z)', 'atg(z)', 'arsh(z)', 'arch(z)', 'arth(z)',
+                       '(z-i)/(z+i)', '(z-1)/(z+1)', 'z^i', 'abs(z)', 'phi(z)']
+
+    def __init__(self, max_size: int = 256):
+        self._cache = LRUCache(max_size=max_size)
+        self._groups = LRUCache(max_size=max_size)
+
+    @staticmethod
+    def canonical_key(function_string: str) -> str:
+        """
+            The function string rebuilt from its tokens: no spaces, lowercase like the frontend sends it,
+            explicit multiplication and 'z' as the variable. Raises ParserError for unknown tokens.
+        """
+        tokens = Parser.tokenize(function_string.lower())
+        return ''.join('z' if token.type == TokenType.VAR else token.value for token in tokens)
+
+    def __contains__(self, function_string: str):
+        """Whether the function has an entry already, raises ParserError like get"""
+        return EquationCache.canonical_key(function_string) in self._cache
+
+    def get(self, function_string: str) -> Equation:
+        key = EquationCache.canonical_key(function_string)
+        return self._cache.get_or_create(key, lambda: Equation(key))
+
+    def get_group(self, function_strings: list[str]) -> EquationGroup:
+        """Equations for all the functions compiled together. All of them must parse"""
+        keys = tuple(dict.fromkeys(EquationCache.canonical_key(f) for f in function_strings))
+        return self._groups.get_or_create(keys, lambda: EquationGroup([self.get(key) for key in keys]))
+
+    def warm(self, catalog: list[str] | None = None) -> int:
+        """Parse and compile every function of the catalog, return how many compiled"""
+        compiled = 0
+        for function_string in catalog if catalog is not None else EquationCache.default_catalog:
+            try:
+                eq = self.get(function_string)
+                if eq.expression is not None and eq.vector_function is not None:
+                    compiled += 1
+            except ParserError:
+                continue
+        return compiled
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+    def __len__(self):
+        return len(self._cache)
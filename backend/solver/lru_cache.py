@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LRUCache:
+    """
+        Thread-safe least-recently-used cache.
+        Bounded by the number of entries, and optionally by the total weight of the values
+        (weigher gives the weight of one value, for example its size in bytes).
+    """
+    def __init__(self, max_size: int | None = None, max_weight: int | None = None,
+                 weigher: Callable[[object], int] | None = None):
+        self._max_size = max_size
+        self._max_weight = max_weight
+        self._weigher = weigher if weigher is not None else (lambda value: 1)
+        self._entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    @property
+    def weight(self):
+        return self._weight
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value):
+        weight = self._weigher(value)
+        with self._lock:
+            if key in self._entries:
+                self._weight -= self._entries.pop(key)[1]
+            if self._max_weight is not None and weight > self._max_weight:
+                return  # would evict everything and still not fit
+            self._entries[key] = (value, weight)
+            self._weight += weight
+            self._evict()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], object]):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            # built outside the lock, two threads may build the same value, one of them is kept
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def stats(self) -> dict[str, int]:
+        return {'size': len(self._entries), 'weight': self._weight,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _evict(self):
+        while len(self._entries) > 0 and (
+                (self._max_size is not None and len(self._entries) > self._max_size)
+                or (self._max_weight is not None and self._weight > self._max_weight)):
+            _, (_, weight) = self._entries.popitem(last=False)
+            self._weight -= weight
+            self.evictions += 1
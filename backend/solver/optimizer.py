@@ -0,0 +1,89 @@
+import numpy as np
+
+from .parser import Expression, Token, TokenType, ExpressionType
+from .vector_solver import VectorSolver
+
+
+class Optimizer:
+    """
+        Rewrites a parsed expression before it is compiled, keeping the values it gives:
+        - constant subtrees are computed once, here, and replaced by one VALUE token
+          ('2*pi*i*z' becomes '6.28...j * z', the product is no longer computed on every call);
+        - parentheses are dropped, they are only needed by the parser;
+        Equal subtrees are one object already (Expression is hash-consed), so the compiler emits them once.
+        Only single-valued constants are folded: 'ln(2)' depends on the number of branches of the request.
+        Small integer powers are left as they are, the compiler turns them into multiplications.
+    """
+    single_valued_functions = ['real', 'im', 'sin', 'cos', 'tg', 'ctg', 'abs', 'phi',
+                               'sh', 'ch', 'th', 'cth', 'sch', 'csch']
+    # a + (b + x) = (a + b) + x for constants a and b, branches of x keep their order
+    associative_operators = ['+', '*']
+
+    @staticmethod
+    def optimize(exp: Expression) -> Expression:
+        if exp.type == ExpressionType.NONE:
+            return exp
+        return Optimizer._fold(exp)
+
+    @staticmethod
+    def is_constant(exp: Expression) -> bool:
+        return exp.type == ExpressionType.VAL and exp.value[0].type in [TokenType.NUM, TokenType.CONST, TokenType.VALUE]
+
+    @staticmethod
+    def integer_power(exp: Expression, limit: int = 16) -> int | None:
+        """The exponent if exp is a constant integer not larger than limit by absolute value"""
+        if not Optimizer.is_constant(exp):
+            return None
+        token = exp.value[0]
+        if token.type == TokenType.NUM:
+            value = complex(float(token.value))
+        elif token.type == TokenType.VALUE:
+            value = token.value
+        else:
+            return None
+        if value.imag != 0 or not value.real.is_integer() or abs(value.real) > limit:
+            return None
+        return int(value.real)
+
+    @staticmethod
+    def _value(value: complex) -> Expression:
+        return Expression([Token(value, TokenType.VALUE)], ExpressionType.VAL)
+
+    @staticmethod
+    def _evaluate(exp: Expression) -> Expression:
+        # the same numpy operations the expression would run at every call, run once on a (1, 1) array
+        fz = VectorSolver.get_function_for_array(exp)(np.zeros(1), num_branches=0)
+        return Optimizer._value(complex(fz[0, 0]))
+
+    @staticmethod
+    def _fold(exp: Expression) -> Expression:
+        tokens = exp.value
+        if exp.type == ExpressionType.VAL:
+            return exp
+        if exp.type == ExpressionType.PAR:
+            return Optimizer._fold(tokens[1])
+        if exp.type == ExpressionType.UNARY:
+            result = Expression([tokens[0], Optimizer._fold(tokens[1])], ExpressionType.UNARY)
+            return Optimizer._evaluate(result) if Optimizer.is_constant(result.value[1]) else result
+        if exp.type == ExpressionType.FUNC:
+            if tokens[0].type == TokenType.FUNC1:
+                result = Expression([*tokens[:2], Optimizer._fold(tokens[2]), tokens[3]], ExpressionType.FUNC)
+                if tokens[0].value in Optimizer.single_valued_functions and Optimizer.is_constant(result.value[2]):
+                    return Optimizer._evaluate(result)
+                return result
+            return Expression([*tokens[:2], Optimizer._fold(tokens[2]), tokens[3], Optimizer._fold(tokens[4]), tokens[5]],
+                              ExpressionType.FUNC)
+        if exp.type == ExpressionType.BINARY:
+            left = Optimizer._fold(tokens[0])
+            right = Optimizer._fold(tokens[2])
+            op = tokens[1]
+            if Optimizer.is_constant(left) and Optimizer.is_constant(right):
+                return Optimizer._evaluate(Expression([left, op, right], ExpressionType.BINARY))
+            if (op.value in Optimizer.associative_operators and Optimizer.is_constant(left)
+                    and right.type == ExpressionType.BINARY and right.value[1].value == op.value
+                    and Optimizer.is_constant(right.value[0])):
+                # operators of one priority group to the right, so this is how '2*pi*i*z' looks
+                left = Optimizer._evaluate(Expression([left, op, right.value[0]], ExpressionType.BINARY))
+                right = right.value[2]
+            return Expression([left, op, right], ExpressionType.BINARY)
+        return exp
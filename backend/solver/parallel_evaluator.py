@@ -0,0 +1,179 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+from .equation_cache import EquationCache
+from .parserError import ParserError, ParserErrorType
+
+# compiled equations of a worker process
+_equations: EquationCache | None = None
+
+
+def _evaluate_task(function_string: str, num_branches: int, input_name: str, input_size: int,
+                   ranges: list[tuple[int, int]]) -> tuple:
+    """
+        Runs in a worker: evaluates the points start:stop of the input segment for every range,
+        writes the results one after the other in a new segment and returns its name and their shapes.
+    """
+    global _equations
+    if _equations is None:
+        _equations = EquationCache(max_size=64)
+    source = shared_memory.SharedMemory(name=input_name)
+    z = np.ndarray((input_size,), dtype=np.complex128, buffer=source.buf)
+    values = output = None
+    try:
+        try:
+            eq = _equations.get(function_string)
+            eq.expression  # parsed on first use, the parent checked that it parses
+            function = eq.vector_function
+            values = [function(z[start:stop], num_branches=num_branches) for start, stop in ranges]
+        except ParserError as e:
+            # ParserError doesn't survive pickling, it is raised again by the parent
+            return 'error', e.type.value, e.text_value
+        size = sum(fz.size for fz in values)
+        # unlinked by the parent once it has read it
+        target = shared_memory.SharedMemory(create=True, size=max(size, 1) * 16)
+        output = np.ndarray((size,), dtype=np.complex128, buffer=target.buf)
+        offset = 0
+        for fz in values:
+            output[offset:offset + fz.size] = fz.reshape(-1)
+            offset += fz.size
+        shapes = [fz.shape for fz in values]
+        output = None
+        target.close()
+        return 'ok', target.name, shapes
+    finally:
+        # results may be views of the input, no array may point to a segment when it is closed
+        z = values = output = None
+        source.close()
+
+
+class ParallelEvaluator:
+    """
+        Evaluates the strokes of one request on a pool of processes, for requests with at least min_points points.
+        Strokes are cut into chunks of points, short strokes are grouped, so that every process gets
+        a few chunks. Points go to the processes in a shared memory segment, each process writes its results
+        in a segment of its own, only names and shapes are pickled. Worker processes are spawned, so they share
+        the resource tracker of this process, which removes segments left behind when the server stops.
+        Consecutive chunks of a stroke share their boundary point: branches are dropped or cut depending on
+        the points evaluated together (see BranchSet), when the shared point doesn't have the same values
+        in both chunks the stroke is evaluated again in one piece.
+    """
+    def __init__(self, processes: int, min_points: int = 50_000, chunks_per_process: int = 2):
+        self.processes = processes
+        self.min_points = min_points
+        self.chunks_per_process = chunks_per_process
+        self._pool: ProcessPoolExecutor | None = None
+
+    @staticmethod
+    def from_environment() -> 'ParallelEvaluator | None':
+        """COMPLEX_PARALLEL processes, none (serial evaluation) by default; 0 means the number of cores"""
+        processes = os.environ.get('COMPLEX_PARALLEL')
+        if processes is None:
+            return None
+        return ParallelEvaluator(int(processes) or os.cpu_count() or 1)
+
+    def worth_it(self, points: int) -> bool:
+        return self.processes > 1 and points >= self.min_points
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, the server runs threads
+            self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def evaluate(self, function_string: str, function: Callable[..., np.ndarray], zs: list[np.ndarray],
+                 num_branches: int) -> list[np.ndarray]:
+        """
+            The (branches, points) values of every stroke, like function(z, num_branches=num_branches)
+            one stroke at a time. function is used for the strokes whose chunks don't agree.
+        """
+        lengths = [len(z) for z in zs]
+        total = sum(lengths)
+        chunk = max(math.ceil(total / (self.processes * self.chunks_per_process)), 1)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        tasks = ParallelEvaluator._plan(lengths, chunk)
+
+        source = shared_memory.SharedMemory(create=True, size=max(total, 1) * 16)
+        segments = []
+        pieces: list[list[np.ndarray]] = [[] for _ in zs]
+        try:
+            z = np.ndarray((total,), dtype=np.complex128, buffer=source.buf)
+            for start, stroke in zip(offsets, zs):
+                z[start:start + len(stroke)] = stroke
+            z = None
+            pool = self._get_pool()
+            futures = [pool.submit(_evaluate_task, function_string, num_branches, source.name, total,
+                                   [(offsets[i] + start, offsets[i] + stop) for i, start, stop in task])
+                       for task in tasks]
+            error = None
+            for task, future in zip(tasks, futures):
+                result = future.result()
+                if result[0] == 'error':
+                    error = error or ParserError(ParserErrorType(result[1]), result[2])
+                    continue
+                segments.append(shared_memory.SharedMemory(name=result[1]))
+                for (i, _, _), values in zip(task, ParallelEvaluator._views(segments[-1], result[2])):
+                    pieces[i].append(values)
+            if error is not None:
+                raise error
+            # the only copy of the results, from the segments of the workers
+            return [ParallelEvaluator._join(stroke_pieces, function, z, num_branches)
+                    for stroke_pieces, z in zip(pieces, zs)]
+        finally:
+            # no view of a segment may be left when it is closed
+            pieces = values = None
+            for segment in [*segments, source]:
+                segment.close()
+                segment.unlink()
+
+    @staticmethod
+    def _plan(lengths: list[int], chunk: int) -> list[list[tuple[int, int, int]]]:
+        # tasks of (stroke, start, stop) ranges with about chunk points each, in the order of the strokes
+        tasks = []
+        current = []
+        size = 0
+        for i, length in enumerate(lengths):
+            start = 0
+            while True:
+                stop = min(length, start + max(chunk - size, 2))
+                current.append((i, start, stop))
+                size += stop - start
+                if size >= chunk:
+                    tasks.append(current)
+                    current = []
+                    size = 0
+                if stop == length:
+                    break
+                start = stop - 1  # the boundary point is in both chunks
+        if len(current) > 0:
+            tasks.append(current)
+        return tasks
+
+    @staticmethod
+    def _views(segment: shared_memory.SharedMemory, shapes: list[tuple[int, int]]) -> list[np.ndarray]:
+        size = sum(rows * points for rows, points in shapes)
+        data = np.ndarray((size,), dtype=np.complex128, buffer=segment.buf)
+        offsets = np.cumsum([0, *(rows * points for rows, points in shapes)])
+        return [data[start:start + rows * points].reshape(rows, points)
+                for start, (rows, points) in zip(offsets, shapes)]
+
+    @staticmethod
+    def _join(pieces: list[np.ndarray], function: Callable[..., np.ndarray], z: np.ndarray,
+              num_branches: int) -> np.ndarray:
+        for previous, piece in zip(pieces[:-1], pieces[1:]):
+            if previous.shape[0] != piece.shape[0] or not np.allclose(previous[:, -1], piece[:, 0], rtol=1e-12,
+                                                                      atol=1e-12, equal_nan=True):
+                return function(z, num_branches=num_branches)
+        return np.concatenate([pieces[0], *(piece[:, 1:] for piece in pieces[1:])], axis=1)
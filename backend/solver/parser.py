@@ -1,6 +1,8 @@
 import functools
 import locale
 import re
+import threading
+import weakref
 import numpy
 from enum import Enum
 
@@ -28,6 +30,7 @@ class TokenType(Enum):
     VAR = 8  # variable, one letter
     NUM = 9  # number
     CONST = 10  # constant
+    VALUE = 11  # value computed ahead of time by the optimizer, a complex number instead of a string
 
 
 class ExpressionType(Enum):
@@ -55,10 +58,68 @@ class ExpressionType(Enum):
     BINARY = 4
 
 
+class _Interned(weakref.ref):
+    # the entry of an interned node, removed when the node goes away
+    __slots__ = ('table', 'key')
+
+
+def _forget(ref: _Interned):
+    with _intern_lock:
+        if ref.table.get(ref.key) is ref:
+            del ref.table[ref.key]
+
+
+def _intern(table: dict[tuple, _Interned], key: tuple, node):
+    """The node interned under key, node itself the first time"""
+    ref = _Interned(node, _forget)
+    ref.table = table
+    ref.key = key
+    with _intern_lock:
+        existing = table.get(key)
+        existing = None if existing is None else existing()
+        if existing is not None:
+            return existing
+        table[key] = ref
+        return node
+
+
+# reentrant: a node may go away, and be forgotten, while the lock is held by the same thread
+_intern_lock = threading.RLock()
+
+
 class Token:
-    def __init__(self, name: str, token_type: TokenType):
-        self._name = name
-        self._type = token_type
+    """
+        Immutable and interned: Token(name, type) returns the same object for the same name and type,
+        so tokens compare by identity. VALUE tokens are told apart by the repr of their value,
+        which keeps 0.0 and -0.0 (and every NaN) apart.
+    """
+    __slots__ = ('_name', '_type', '_hash', '__weakref__')
+    _interned: dict[tuple, _Interned] = {}
+
+    def __new__(cls, name, token_type: TokenType):
+        # enum members hash in Python and .value is a property, the int of _value_ is neither
+        key = (repr(name) if token_type is TokenType.VALUE else name, token_type._value_)
+        ref = Token._interned.get(key)
+        token = None if ref is None else ref()
+        if token is None:
+            token = object.__new__(cls)
+            object.__setattr__(token, '_name', name)
+            object.__setattr__(token, '_type', token_type)
+            object.__setattr__(token, '_hash', hash(key))
+            token = _intern(Token._interned, key, token)
+        return token
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Token is immutable')
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return Token, (self._name, self._type)
+
+    def __repr__(self):
+        return f'Token({self._name!r}, {self._type.name})'
 
     @property
     def value(self):
@@ -70,12 +131,46 @@ class Token:
 
 
 class Expression:
-    def __init__(self, tokens, exp_type: ExpressionType):
-        self._tokens = tokens
-        self._type = exp_type
+    """
+        Immutable and hash-consed: the parts of an expression are interned tokens and expressions,
+        and Expression(parts, type) returns the object built already for the same parts and type.
+        Structurally equal trees are one object, so they compare by identity, their hash is computed
+        once, and they can be dictionary keys (the compiler emits a shared subtree once,
+        Compiler.compile finds the code of a tree it has compiled already).
+        A tree is kept while something refers to it.
+    """
+    __slots__ = ('_tokens', '_type', '_hash', '__weakref__')
+    _interned: dict[tuple, _Interned] = {}
+
+    def __new__(cls, tokens, exp_type: ExpressionType):
+        # parts are interned, so their ids stand for their structure; an entry lives as long as its
+        # expression, which keeps its parts and their ids alive
+        tokens = tuple(tokens)
+        key = (exp_type._value_, *map(id, tokens))
+        ref = Expression._interned.get(key)
+        exp = None if ref is None else ref()
+        if exp is None:
+            exp = object.__new__(cls)
+            object.__setattr__(exp, '_tokens', tokens)
+            object.__setattr__(exp, '_type', exp_type)
+            object.__setattr__(exp, '_hash', hash(key))
+            exp = _intern(Expression._interned, key, exp)
+        return exp
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Expression is immutable')
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return Expression, (self._tokens, self._type)
+
+    def __repr__(self):
+        return f'Expression({list(self._tokens)!r}, {self._type.name})'
 
     @property
-    def value(self):
+    def value(self) -> tuple:
         return self._tokens
 
     @property
@@ -102,8 +197,13 @@ class Parser:
     # sort from longest to shortest, so that longer ones are checked first. Wouldn't want to mistake 'im' for 'i'
     operators = sorted([*symbols, *keywords], key=functools.cmp_to_key(keyword_comparator))
     latin_letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
-    number_r = r'^\d+(\.\d+)?'  # regexp for number, with digits and maybe a dot separator between them
+    number_r = r'\d+(\.\d+)?'  # regexp for number, with digits and maybe a dot separator between them
+    # one regexp for any token, built once. Alternatives are tried in order, so operators keep the longest-first order
+    token_r = re.compile(f'(?P<number>{number_r})|(?P<operator>{"|".join(map(re.escape, operators))})|(?P<letter>[{latin_letters}])')
     operator_priority = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
+    # the optimizer, the compiler and Derivative walk the tree recursively, deeper trees are invalid
+    # rather than a RecursionError in one of them; 'z+z+...+z' gets one level per '+'
+    max_depth = 100
 
     @staticmethod
     def try_get_expression(f: str, accept_error=False) -> tuple[bool, Expression]:
@@ -113,13 +213,30 @@ class Parser:
             if accept_error:
                 raise e
             return False, Expression([], ExpressionType.NONE)
-        exp, rest = Parser._get_expression(tokens)
-        if len(rest) > 0:
-            if accept_error:
+        if len(tokens) == 0:
+            return True, Expression([], ExpressionType.NONE)
+        try:
+            try:
+                exp, pos = Parser._parse_expression(tokens, 0, Parser._first_argument_priorities(tokens))
+            except RecursionError:
+                raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+            if pos < len(tokens) or Parser.depth(exp) > Parser.max_depth:
                 raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+        except ParserError as e:
+            if accept_error:
+                raise e
             return False, Expression([], ExpressionType.NONE)
         return True, exp
 
+    @staticmethod
+    def depth(exp: Expression) -> int:
+        # levels of the tree, counted without recursion; shared subtrees are visited once per level
+        depth, level = 0, {exp}
+        while len(level) > 0:
+            depth += 1
+            level = {part for node in level for part in node.value if isinstance(part, Expression)}
+        return depth
+
     @staticmethod
     def get_token_type(op: str, prev=TokenType.NONE):
         # minus can be both binary and unary
@@ -151,166 +268,143 @@ class Parser:
         f = f.replace(' ', '')
         result = []
         var_letter = ''
-        while len(f) > 0:
-            found_operator = False
-            if not f[0].isdigit():
-                for op in Parser.operators:  # check for known operators, functions, separators, etc.
-                    if f.startswith(op):
-                        f = f[len(op):]
-                        result.append(
-                            Token(op, Parser.get_token_type(op, prev='' if len(result) == 0 else result[-1].type)))
-                        found_operator = True
-                        break
-                if found_operator:
-                    continue
-                # it's not an operator, so it's variable or number. Variable must have the same name across the equation
-                if f[0] in Parser.latin_letters:
-                    if var_letter == '':
-                        var_letter = f[0]  # that's the variable name from now on
-                        result.append(Token(f[0], TokenType.VAR))
-                        f = f[1:]
-                        continue
-                    elif f[0] == var_letter:
-                        result.append(Token(f[0], TokenType.VAR))
-                        f = f[1:]
-                        continue
-                    else:  # not matching variable name
-                        raise ParserError(ParserErrorType.TOO_MANY_VARIABLES, f'{var_letter}, {f[0]}')
-                raise ParserError(ParserErrorType.UNKNOWN_TOKEN, f[0])  # it's not a digit, but nothing else matches
-            else:  # that leaves digits
-                num = re.search(Parser.number_r, f)[0]
-                if num is None:
-                    raise ParserError(ParserErrorType.UNKNOWN_TOKEN, f)
-                result.append(Token(num, TokenType.NUM))
-                f = f[len(num):]
-
-        # value is next to different value, assume *. Not implemented for functions or parenthesis
-        missing_mult = []
-        for i in range(1, len(result)):
-            if result[i - 1].type in Parser.value_token_types and result[i].type in Parser.value_token_types:
-                missing_mult.append(i)
-        for i in reversed(missing_mult):
-            result = [*result[:i], Token('*', TokenType.BINARY), *result[i:]]
+        pos = 0
+        while pos < len(f):
+            match = Parser.token_r.match(f, pos)
+            if match is None:
+                raise ParserError(ParserErrorType.UNKNOWN_TOKEN, f[pos])
+            pos = match.end()
+            if match['number'] is not None:
+                token = Token(match['number'], TokenType.NUM)
+            elif match['operator'] is not None:  # known operators, functions, separators, etc.
+                op = match['operator']
+                token = Token(op, Parser.get_token_type(op, prev='' if len(result) == 0 else result[-1].type))
+            else:
+                # it's not an operator, so it's a variable. Variable must have the same name across the equation
+                letter = match['letter']
+                if var_letter == '':
+                    var_letter = letter  # that's the variable name from now on
+                elif letter != var_letter:  # not matching variable name
+                    raise ParserError(ParserErrorType.TOO_MANY_VARIABLES, f'{var_letter}, {letter}')
+                token = Token(letter, TokenType.VAR)
+            # value is next to different value, assume *. Not implemented for functions or parenthesis
+            if (token.type in Parser.value_token_types
+                    and len(result) > 0 and result[-1].type in Parser.value_token_types):
+                result.append(Token('*', TokenType.BINARY))
+            result.append(token)
         return result
 
     @staticmethod
-    def _is_expression(token: Token | Expression):
-        return isinstance(token, Expression) and token.type != ExpressionType.NONE
-
-    @staticmethod
-    def _try_get_value(tokens: list[Token | Expression]):
-        if len(tokens) == 1 and tokens[0].type in Parser.value_token_types:
-            return True, Expression(tokens, ExpressionType.VAL)
-        return False, None
+    def _parse_expression(tokens: list[Token], pos: int, first_arguments: dict[int, float],
+                          unary_priority: float = 0) -> tuple[Expression, int]:
+        """
+            Operator-precedence parse of the expression starting at pos, in one pass over the tokens.
+            Stops at the first token that can't continue the expression (a right parenthesis, a separator
+            or the end) and returns the expression with the position of that token.
+            The trees are the same the previous backtracking parser built: binary operators of the same
+            priority are grouped to the right, and a unary minus takes everything up to the first operator
+            with a lower priority than the one before the minus (unary_priority for a leading minus).
+        """
+        operands: list[Expression] = []
+        operators: list[tuple[Token, float]] = []
+        context_priority = unary_priority
+        while True:
+            while pos < len(tokens) and tokens[pos].type == TokenType.UNARY:
+                operators.append((tokens[pos], context_priority))
+                pos += 1
+            operand, pos = Parser._parse_operand(tokens, pos, first_arguments)
+            operands.append(operand)
+            if pos >= len(tokens) or tokens[pos].type != TokenType.BINARY:
+                break
+            priority = Parser.operator_priority[tokens[pos].value]
+            while len(operators) > 0 and operators[-1][1] > priority:
+                Parser._reduce(operands, operators.pop()[0])
+            operators.append((tokens[pos], priority))
+            context_priority = priority
+            pos += 1
+        while len(operators) > 0:
+            Parser._reduce(operands, operators.pop()[0])
+        return operands[0], pos
 
     @staticmethod
-    def _try_get_function(tokens: list[Token | Expression]):
-        if len(tokens) < 4 or tokens[0].type not in [TokenType.FUNC1, TokenType.FUNC2]:
-            # not a function
-            return False, None
-        if (tokens[1].type != TokenType.PARL
-                or tokens[1].value not in Parser.par_pair.keys()
-                or tokens[-1].type != TokenType.PARR
-                or tokens[-1].value != Parser.par_pair[tokens[1].value]):
-            return False, None  # wrong syntax
-
-        # func1 ( exp )
-        res, rest = Parser._get_expression(tokens[2:-1])
-        if tokens[0].type == TokenType.FUNC1 and len(res.value) != 0 and len(rest) == 0:
-            return True, Expression([*tokens[:2], res, tokens[-1]], ExpressionType.FUNC)
-
-        if rest[0].type != TokenType.SEPAR or tokens[0].type != TokenType.FUNC2:
-            return False, None  # wrong syntax
-
-        tokens = [*tokens[:2], res, *rest]
-
-        # func2 ( exp , exp )
-        res2, rest2 = Parser._get_expression(rest[1:])
-        if len(res2.value) != 0 and len(rest2) == 0:
-            return True, Expression([*tokens[:2], res, rest[0], res2, tokens[-1]], ExpressionType.FUNC)
-        return False, Expression(tokens, ExpressionType.NONE)
+    def _first_argument_priorities(tokens: list[Token]) -> dict[int, float]:
+        """
+            The backtracking parser read the first argument of a two-argument function together with
+            the rest of the call, which made a leading minus stop at the first operator with the lowest
+            priority in that argument: log(-z^2, 2) is log((-z)^2, 2), while -z^2 is -(z^2).
+            Keep that grouping: for every function2 position, the priority of its leading minus.
+        """
+        result = {}
+        groups = []  # [function2 position or None, lowest operator priority, separator seen]
+
+        def close(group):
+            if group[0] is not None and group[1] is not None:
+                result[group[0]] = group[1] + 0.5
+
+        for i, token in enumerate(tokens):
+            if token.type == TokenType.PARL:
+                owner = i - 1 if i > 0 and tokens[i - 1].type == TokenType.FUNC2 else None
+                groups.append([owner, None, False])
+            elif len(groups) == 0:
+                continue
+            elif token.type == TokenType.PARR:
+                close(groups.pop())
+            elif token.type == TokenType.SEPAR:
+                groups[-1][2] = True
+            elif token.type == TokenType.BINARY and not groups[-1][2]:
+                priority = Parser.operator_priority[token.value]
+                groups[-1][1] = priority if groups[-1][1] is None else min(groups[-1][1], priority)
+        for group in groups:
+            close(group)
+        return result
 
     @staticmethod
-    def _try_get_unary(tokens: list[Token | Expression]):
-        if tokens[0].type != TokenType.UNARY:
-            return False, None
-        res, rest = Parser._get_expression(tokens[1:])
-        if len(res.value) != 0 and len(rest) == 0:
-            return True, Expression([tokens[0], res], ExpressionType.UNARY)
-        return False, None
+    def _reduce(operands: list[Expression], operator: Token):
+        if operator.type == TokenType.UNARY:
+            operands.append(Expression([operator, operands.pop()], ExpressionType.UNARY))
+        else:
+            right = operands.pop()
+            left = operands.pop()
+            operands.append(Expression([left, operator, right], ExpressionType.BINARY))
 
     @staticmethod
-    def _try_get_expression_in_parenthesis(tokens: list[Token | Expression]):
-        if (tokens[0].type != TokenType.PARL
-                or tokens[-1].type != TokenType.PARR
-                or tokens[0].value not in Parser.par_pair.keys()
-                or tokens[-1].value != Parser.par_pair[tokens[0].value]):
-            return False, None
-        res, rest = Parser._get_expression(tokens[1:-1])
-        if len(res.value) != 0 and len(rest) == 0:
-            return True, Expression([tokens[0], res, tokens[-1]], ExpressionType.PAR)
-        return False, None
+    def _parse_operand(tokens: list[Token], pos: int, first_arguments: dict[int, float]) -> tuple[Expression, int]:
+        if pos >= len(tokens):
+            raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+        token = tokens[pos]
+        # value
+        if token.type in Parser.value_token_types:
+            return Expression([token], ExpressionType.VAL), pos + 1
+        # left-parenthesis expression right-parenthesis
+        if token.type == TokenType.PARL:
+            inner, pos = Parser._parse_expression(tokens, pos + 1, first_arguments)
+            closing = Parser._expect_closing(tokens, pos, token)
+            return Expression([token, inner, closing], ExpressionType.PAR), pos + 1
+        # function1 ( exp ), function2 ( exp , exp )
+        if token.type in [TokenType.FUNC1, TokenType.FUNC2]:
+            if pos + 1 >= len(tokens) or tokens[pos + 1].type != TokenType.PARL:
+                raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+            opening = tokens[pos + 1]
+            arg, pos = Parser._parse_expression(tokens, pos + 2, first_arguments, first_arguments.get(pos, 0))
+            if token.type == TokenType.FUNC1:
+                closing = Parser._expect_closing(tokens, pos, opening)
+                return Expression([token, opening, arg, closing], ExpressionType.FUNC), pos + 1
+            if pos >= len(tokens) or tokens[pos].type != TokenType.SEPAR:
+                raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+            separator = tokens[pos]
+            arg2, pos = Parser._parse_expression(tokens, pos + 1, first_arguments)
+            closing = Parser._expect_closing(tokens, pos, opening)
+            return Expression([token, opening, arg, separator, arg2, closing], ExpressionType.FUNC), pos + 1
+        raise ParserError(ParserErrorType.INVALID_EXPRESSION)
 
     @staticmethod
-    def _try_get_binary(tokens: list[Token | Expression]):
-        operators = []
-        for i in range(len(tokens)):
-            if tokens[i].type == TokenType.BINARY:
-                operators.append((i, Parser.operator_priority[tokens[i].value]))
-        if len(operators) == 0:
-            return False, None
-        operators = sorted(operators, key=functools.cmp_to_key(_priority_comparator))
-        if len(tokens) < 3:
-            return False, None
-        for op in operators:
-            res1, rest1 = Parser._get_expression(tokens[:op[0]])
-            if len(res1.value) != 0 and len(rest1) == 0:
-                tokens = [res1, *tokens[op[0]:]]
-                res2, rest2 = Parser._get_expression(tokens[2:])
-                if len(res2.value) != 0 and len(rest2) == 0:
-                    return True, Expression([res1, tokens[1], res2], ExpressionType.BINARY)
-                else:
-                    return False, Expression(tokens, ExpressionType.NONE)
-        return False, None
+    def _expect_closing(tokens: list[Token], pos: int, opening: Token) -> Token:
+        if (pos >= len(tokens)
+                or tokens[pos].type != TokenType.PARR
+                or tokens[pos].value != Parser.par_pair.get(opening.value)):
+            raise ParserError(ParserErrorType.INVALID_EXPRESSION)
+        return tokens[pos]
 
-    @staticmethod
-    def _get_expression(tokens: list[Token | Expression]) -> tuple[Expression, list[Token | Expression]]:
-        if len(tokens) == 0:
-            return Expression([], ExpressionType.NONE), tokens
-        if len(tokens) == 1 and Parser._is_expression(tokens[0]):
-            return tokens[0], []
-        # case1 - value
-        is_value, res = Parser._try_get_value(tokens)
-        if is_value:
-            return res, []
-        # case2 - function
-        is_function, res = Parser._try_get_function(tokens)
-        if is_function:
-            return res, []
-        # case3 - unary
-        is_unary, res = Parser._try_get_unary(tokens)
-        if is_unary:
-            return res, []
-        # case4 - parenthesis
-        is_par, res = Parser._try_get_expression_in_parenthesis(tokens)
-        if is_par:
-            return res, []
-        # case5 - binary
-        is_binary, res = Parser._try_get_binary(tokens)
-        if is_binary:
-            return res, []
-        elif res is not None:
-            tokens = res.value
-        res, rest = Parser._get_expression(tokens[:-1])
-        return res, [*rest, tokens[-1]]
-
-
-def _priority_comparator(a, b):
-    if a[1] < b[1]:
-        return -1
-    if a[1] > b[1]:
-        return 1
-    return 0
 
 def P2R(radii, angles):
     return radii * numpy.exp(1j*angles)
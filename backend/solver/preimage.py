@@ -0,0 +1,144 @@
+import numpy as np
+from typing import Callable
+
+from .branch_set import BranchSet
+from .compiler import Compiler
+from .derivative import Derivative
+from .lru_cache import LRUCache
+from .optimizer import Optimizer
+from .parser import Expression
+from .principal_solver import PrincipalSolver
+
+
+class Preimage:
+    """
+        The points z with f(z) = w for every point w of a stroke drawn on the result plane, by Newton's method
+        on the principal branch of f, with the derivative taken from the expression tree (see Derivative).
+        Every preimage is followed along the stroke, every point starting from the solution at a point near it:
+        - points stride apart are solved one after the other, all preimages at once. At each of them
+          the grid of seeds over the region is solved too, the preimages it finds that aren't followed yet
+          (they entered the region, or one was lost) are followed from there as new rows;
+        - the points between them are solved in log2(stride) rounds, all points of a round at once,
+          each from the solution stride / 2, then stride / 4, ... points before it, or after it for a row
+          that starts later.
+        The result is a (preimages, points) array like the values of /strokes, NaN where a preimage is lost
+        (Newton doesn't converge in max_iterations) or outside the region.
+    """
+    # f and f' compiled together, by expression, the options change more often than the function
+    _functions = LRUCache(max_size=64)
+
+    def __init__(self, exp: Expression, region: tuple[float, float, float, float] = (-4.0, 4.0, -4.0, 4.0),
+                 seeds: int = 16, max_iterations: int = 30, max_preimages: int = 64, stride: int = 8):
+        left, right, bottom, top = region
+        if not (right > left and top > bottom and 1 <= seeds <= 64 and 1 <= max_iterations <= 200
+                and 1 <= max_preimages and stride >= 1 and stride & (stride - 1) == 0):
+            raise ValueError('Bad preimage options')
+        self.region = (left, right, bottom, top)
+        self.seeds = seeds
+        self.max_iterations = max_iterations
+        self.max_preimages = max_preimages
+        self.stride = stride
+        self.function = Preimage._functions.get_or_create(exp, lambda: Preimage.with_derivative(exp))
+
+    @staticmethod
+    def with_derivative(exp: Expression) -> Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]]:
+        """z -> (f(z), f'(z)), compiled together so that their common parts are computed once"""
+        compiled = Compiler.compile_many([Optimizer.optimize(exp), Optimizer.optimize(Derivative.of(exp))])
+        function = Compiler.link(compiled, PrincipalSolver)
+
+        def evaluate(z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            fz, dfz = function(z)
+            return np.broadcast_to(fz, z.shape), np.broadcast_to(dfz, z.shape)
+
+        return evaluate
+
+    def newton(self, w: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """Solves f(z) = w from z for every pair at once, NaN where it doesn't converge"""
+        shape = np.broadcast_shapes(np.shape(w), np.shape(z))
+        z = np.array(np.broadcast_to(z, shape), dtype=np.complex128).reshape(-1)
+        w = np.broadcast_to(w, shape).reshape(-1)
+        active = np.flatnonzero(np.isfinite(z))
+        with np.errstate(all='ignore'):
+            for _ in range(self.max_iterations):
+                if len(active) == 0:
+                    break
+                fz, dfz = self.function(z[active])
+                step = (fz - w[active]) / dfz
+                z[active] -= step
+                # done when the step is at the rounding of z; lost when the step or z isn't finite
+                done = np.abs(step) <= 1e-13 * (1 + np.abs(z[active]))
+                lost = ~np.isfinite(z[active])
+                z[active[lost]] = np.nan
+                active = active[~(done | lost)]
+            z[active] = np.nan
+            # a step may stop shrinking at a point that is no solution, near a zero of f'
+            fz, _ = self.function(z)
+            z[~(np.abs(fz - w) <= 1e-8 * (1 + np.abs(w)))] = np.nan
+        return z.reshape(shape)
+
+    def seeded(self, w: np.ndarray) -> np.ndarray:
+        """(points, seeds^2) solutions from the grid of seeds for every point of w, NaN outside the region"""
+        left, right, bottom, top = self.region
+        x = left + (np.arange(self.seeds) + 0.5) * (right - left) / self.seeds
+        y = bottom + (np.arange(self.seeds) + 0.5) * (top - bottom) / self.seeds
+        z = self.newton(w[:, None], (x[None, :] + 1j * y[:, None]).reshape(1, -1))
+        z[~self.inside(z)] = np.nan
+        return z
+
+    def fresh(self, found: np.ndarray, followed: np.ndarray) -> np.ndarray:
+        """The distinct solutions found that aren't followed, nearest to the center of the region first"""
+        found = found[np.isfinite(found)]
+        followed = followed[np.isfinite(followed)]
+        if len(found) == 0 or len(followed) >= self.max_preimages:
+            return found[:0]
+        # most of them are followed already, the few left are merged
+        found = found[~Preimage.close(found, followed).any(axis=1)]
+        if len(found) == 0:
+            return found
+        found = BranchSet.unique(found.reshape(-1, 1))[:, 0]
+        left, right, bottom, top = self.region
+        found = found[np.argsort(np.abs(found - (left + right) / 2 - 1j * (bottom + top) / 2), kind='stable')]
+        return found[:self.max_preimages - len(followed)]
+
+    @staticmethod
+    def close(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """(len(a), len(b)) mask of the pairs that are one solution, within the tolerance of newton"""
+        return np.abs(a[:, None] - b[None, :]) <= 1e-8 * (1 + np.abs(a[:, None]))
+
+    def inside(self, z: np.ndarray) -> np.ndarray:
+        left, right, bottom, top = self.region
+        return (z.real >= left) & (z.real <= right) & (z.imag >= bottom) & (z.imag <= top)
+
+    def solve(self, w: np.ndarray) -> np.ndarray:
+        """(preimages, points) solutions along the stroke w"""
+        w = np.asarray(w, dtype=np.complex128)
+        z = np.full((0, len(w)), np.nan, dtype=np.complex128)
+        coarse = np.arange(0, len(w), self.stride)
+        # seeded a chunk of points at a time, seeds^2 solutions each
+        chunk = max(1, (1 << 16) // self.seeds ** 2)
+        for k, i in enumerate(coarse):
+            if k % chunk == 0:
+                found = self.seeded(w[coarse[k:k + chunk]])
+            if k > 0:
+                # followed outside the region too, a preimage may come back to it
+                z[:, i] = self.newton(w[i], z[:, i - self.stride])
+                # two rows that reached the same solution are one preimage from here on
+                same = np.triu(Preimage.close(z[:, i], z[:, i]), 1).any(axis=0)
+                z[same, i] = np.nan
+            roots = self.fresh(found[k % chunk], z[:, i])
+            if len(roots) > 0:
+                rows = np.full((len(roots), len(w)), np.nan, dtype=np.complex128)
+                rows[:, i] = roots
+                z = np.concatenate((z, rows))
+        step = self.stride // 2
+        while step >= 1:
+            targets = np.arange(step, len(w), 2 * step)
+            seeds = z[:, targets - step]
+            # from the point after it for a row that starts later
+            after = targets + step < len(w)
+            later = z[:, targets[after] + step]
+            seeds[:, after] = np.where(np.isfinite(seeds[:, after]), seeds[:, after], later)
+            z[:, targets] = self.newton(w[targets][None, :], seeds)
+            step //= 2
+        z[~self.inside(z)] = np.nan
+        return z
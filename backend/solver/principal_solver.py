@@ -0,0 +1,57 @@
+import numpy as np
+from typing import Callable
+
+from .parser import ParserError, ParserErrorType
+
+
+class PrincipalSolver:
+    """
+        The principal branch of every function, on 1D arrays of points: a single value per point,
+        continuous away from the cuts, which is what Newton's method needs (see Preimage).
+        Compiled expressions are linked against it like against Solver and VectorSolver;
+        num_branches is accepted and ignored. Constants stay scalars and broadcast.
+    """
+    binary_operators = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide, '^': np.power}
+    functions1 = {
+        'real': lambda z: np.real(z) + 0j, 'im': lambda z: np.imag(z) + 0j,
+        'abs': lambda z: np.abs(z) + 0j, 'phi': lambda z: np.angle(z) + 0j,
+        'sin': np.sin, 'cos': np.cos, 'tg': np.tan, 'ctg': lambda z: 1 / np.tan(z),
+        'asin': np.arcsin, 'acos': np.arccos, 'atg': np.arctan, 'actg': lambda z: np.arctan(1 / z),
+        'ln': np.log,
+        'sh': np.sinh, 'ch': np.cosh, 'th': np.tanh, 'cth': lambda z: 1 / np.tanh(z),
+        'sch': lambda z: 1 / np.cosh(z), 'csch': lambda z: 1 / np.sinh(z),
+        'arsh': np.arcsinh, 'arch': np.arccosh, 'arth': np.arctanh, 'arcth': lambda z: np.arctanh(1 / z),
+    }
+    functions2 = {
+        'log': lambda x, y: np.log(x) / np.log(y),
+        'root': lambda x, n: np.exp(np.log(x) / n),
+    }
+
+    @staticmethod
+    def constant(value: complex) -> complex:
+        return complex(value)
+
+    @staticmethod
+    def get_func1(f_name) -> Callable[..., np.ndarray]:
+        if f_name not in PrincipalSolver.functions1:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, f_name)
+        function = PrincipalSolver.functions1[f_name]
+        return lambda z, **kwargs: function(np.asarray(z, dtype=np.complex128))
+
+    @staticmethod
+    def get_func2(f_name) -> Callable[..., np.ndarray]:
+        if f_name not in PrincipalSolver.functions2:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, f_name)
+        function = PrincipalSolver.functions2[f_name]
+        return lambda x, y, **kwargs: function(np.asarray(x, dtype=np.complex128), y)
+
+    @staticmethod
+    def get_binary_operator(op: str) -> Callable[..., np.ndarray]:
+        if op not in PrincipalSolver.binary_operators:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, op)
+        operation = PrincipalSolver.binary_operators[op]
+        return lambda a, b, **kwargs: operation(a, b)
+
+    @staticmethod
+    def get_integer_power() -> Callable[..., np.ndarray]:
+        return lambda a, n: np.power(a, n)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from .lru_cache import LRUCache
+from .z_array import ZArray
+
+
+class ResultCache:
+    """
+        Evaluated strokes, keyed by the canonical function string, the content of the stroke,
+        the number of branches and the way the stroke was sampled, if not point by point.
+        Values are the (branches, points) arrays returned by Equation.vector_function,
+        evicted least recently used first once they take more than max_bytes.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self._cache = LRUCache(max_weight=max_bytes, weigher=lambda value: value.nbytes)
+
+    @staticmethod
+    def key(function_string: str, z: ZArray, num_branches: int, sampling: tuple = ()) -> tuple:
+        return function_string, z.content_hash, num_branches, *sampling
+
+    def __contains__(self, key: tuple):
+        return key in self._cache
+
+    def get(self, key: tuple) -> np.ndarray | None:
+        return self._cache.get(key)
+
+    def put(self, key: tuple, values: np.ndarray):
+        values = np.ascontiguousarray(values)
+        values.setflags(write=False)
+        self._cache.put(key, values)
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
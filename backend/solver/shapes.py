@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class Shapes:
+    """
+        Strokes described by their shape instead of their points, sampled on the server.
+        A shape is a JSON object with its kind and parameters, points are [x, y] pairs and angles are in radians:
+            {"shape": "segment", "from": [x, y], "to": [x, y]}
+            {"shape": "polyline", "points": [[x, y], ...], "closed": false}
+            {"shape": "rectangle", "corners": [[x, y], [x, y]]}     sides parallel to the axes
+            {"shape": "ellipse", "center": [x, y], "radii": [rx, ry]}
+            {"shape": "arc", "center": [x, y], "radius": r, "start": a, "end": b}    or "radii" for an elliptic arc
+        Points are about "step" apart along the shape, 0.01 by default like scatterLine of the frontend,
+        or about "count" points in all. Both ends of an open shape are sampled, a closed one ends where it starts.
+    """
+    default_step = 0.01
+    max_points = 1_000_000
+
+    @staticmethod
+    def sample(shape: dict) -> np.ndarray:
+        """The complex points of a shape, raises ValueError, TypeError or KeyError for a bad one"""
+        kind = shape['shape']
+        if kind == 'segment':
+            return Shapes.polyline([Shapes.point(shape['from']), Shapes.point(shape['to'])], shape)
+        if kind == 'polyline':
+            vertices = [Shapes.point(p) for p in shape['points']]
+            if len(vertices) == 0:
+                raise ValueError('Empty polyline')
+            if shape.get('closed', False) is True:
+                vertices.append(vertices[0])
+            return Shapes.polyline(vertices, shape)
+        if kind == 'rectangle':
+            a, b = (Shapes.point(p) for p in shape['corners'])
+            left, right = sorted([a.real, b.real])
+            bottom, top = sorted([a.imag, b.imag])
+            # counterclockwise from the bottom left corner, like rectangleToPolygon
+            corners = [complex(left, bottom), complex(right, bottom), complex(right, top), complex(left, top)]
+            return Shapes.polyline([*corners, corners[0]], shape)
+        if kind == 'ellipse':
+            return Shapes.arc(Shapes.point(shape['center']), Shapes.radii(shape), 0.0, 2 * np.pi, shape)
+        if kind == 'arc':
+            return Shapes.arc(Shapes.point(shape['center']), Shapes.radii(shape), float(shape['start']),
+                              float(shape['end']), shape)
+        raise ValueError('Unknown shape')
+
+    @staticmethod
+    def point(p) -> complex:
+        x, y = p
+        z = complex(float(x), float(y))
+        if not np.isfinite(z):
+            raise ValueError('Bad point')
+        return z
+
+    @staticmethod
+    def radii(shape: dict) -> tuple[float, float]:
+        rx, ry = shape['radii'] if 'radii' in shape else (shape['radius'], shape['radius'])
+        rx, ry = abs(float(rx)), abs(float(ry))
+        if not (np.isfinite(rx) and np.isfinite(ry)):
+            raise ValueError('Bad radius')
+        return rx, ry
+
+    @staticmethod
+    def count(length: float, shape: dict) -> int:
+        """Number of intervals between the points of a shape of that length"""
+        if 'count' in shape:
+            count = int(shape['count']) - 1
+        else:
+            step = float(shape.get('step', Shapes.default_step))
+            if not step > 0:
+                raise ValueError('Bad step')
+            with np.errstate(over='ignore'):
+                count = length / step
+            if not np.isfinite(count):
+                raise ValueError('Too many points')
+            count = int(np.ceil(count))
+        if not count < Shapes.max_points:
+            raise ValueError('Too many points')
+        return max(count, 1)
+
+    @staticmethod
+    def polyline(vertices: list[complex], shape: dict) -> np.ndarray:
+        z = np.asarray(vertices, dtype=np.complex128)
+        lengths = np.abs(np.diff(z))
+        total = lengths.sum()
+        if total == 0:
+            return z[:1]
+        # every side gets its share of the points, its first corner included
+        counts = np.maximum(np.round(Shapes.count(total, shape) * lengths / total), 1).astype(int)
+        counts[lengths == 0] = 0
+        side = np.repeat(np.arange(len(lengths)), counts)
+        t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts, counts)
+        return np.concatenate((z[side] + (z[side + 1] - z[side]) * t, z[-1:]))
+
+    @staticmethod
+    def arc(center: complex, radii: tuple[float, float], start: float, end: float, shape: dict) -> np.ndarray:
+        rx, ry = radii
+        if not (np.isfinite(start) and np.isfinite(end)):
+            raise ValueError('Bad angle')
+        # Ramanujan's perimeter of the ellipse, for the share of it the arc covers
+        h = ((rx - ry) / (rx + ry)) ** 2 if rx + ry > 0 else 0
+        perimeter = np.pi * (rx + ry) * (1 + 3 * h / (10 + np.sqrt(4 - 3 * h)))
+        t = np.linspace(start, end, Shapes.count(perimeter * abs(end - start) / (2 * np.pi), shape) + 1)
+        return center + rx * np.cos(t) + 1j * ry * np.sin(t)
@@ -1,4 +1,5 @@
 import cmath
+import operator
 import numpy as np
 from typing import Callable
 
@@ -7,11 +8,14 @@ from .parser import Expression, Token, TokenType, ExpressionType, Parser, Parser
 
 class Solver:
     constants = Parser.constants
+    binary_operators = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '^': operator.pow}
 
     @staticmethod
     def get_lambda_for_array(exp: Expression) -> Callable[[list[complex]], list[list[complex]]]:
-        f = Solver.get_lambda_function(exp)
+        return Solver.wrap_for_array(Solver.get_lambda_function(exp))
 
+    @staticmethod
+    def wrap_for_array(f: Callable[[complex], complex | list[complex]]) -> Callable[[list[complex]], list[list[complex]]]:
         def wrapper(z_list: list[complex], **kwargs) -> list[list[complex]]:
             result = []
             for z in z_list:
@@ -49,10 +53,37 @@ class Solver:
             else:
                 raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
         elif e_type == TokenType.NUM:
-            return lambda x, **kwargs: float(value)
+            number = float(value)
+            return lambda x, **kwargs: number
+        elif e_type == TokenType.VALUE:
+            return lambda x, **kwargs: value
         else:
             return lambda z, **kwargs: z
 
+    @staticmethod
+    def constant(value: complex) -> complex:
+        return value
+
+    @staticmethod
+    def get_func1(f_name) -> Callable[[complex], complex | list[complex]]:
+        return Solver._get_func1(f_name)
+
+    @staticmethod
+    def get_func2(f_name) -> Callable[[complex, complex], list[complex]]:
+        return Solver._get_func2(f_name)
+
+    @staticmethod
+    def get_binary_operator(op: str) -> Callable[[complex, complex], list[complex]]:
+        if op not in Solver.binary_operators:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, op)
+        operation = Solver.binary_operators[op]
+        return lambda a, b, **kwargs: Solver._apply_op(a, b, operation)
+
+    @staticmethod
+    def get_integer_power() -> Callable[[complex, int], list[complex]]:
+        # python powers by an integer exponent are repeated multiplications already
+        return lambda a, n: Solver._apply_op(a, n, operator.pow)
+
     @staticmethod
     def _get_func1(f_name) -> Callable[[complex], complex]:
         if f_name == 'real':
@@ -124,7 +155,7 @@ class Solver:
             return results
 
         if f_name == 'log':
-            return lambda x, y: apply_func(lambda a, b: Solver.multi_valued_log(a, b), x, y)
+            return lambda x, y, **kwargs: apply_func(lambda a, b: Solver.multi_valued_log(a, b), x, y)
 
         if f_name == 'root':
             def multi_valued_root(x, n):
@@ -133,7 +164,7 @@ class Solver:
                 r = abs(x) ** (1 / n)
                 theta = cmath.phase(x)
                 return [r * cmath.exp(1j * (theta + 2 * np.pi * k) / n) for k in range(n)]
-            return lambda x, y: apply_func(multi_valued_root, x, y)
+            return lambda x, y, **kwargs: apply_func(multi_valued_root, x, y)
 
         raise ParserError(ParserErrorType.NOT_SUPPORTED, f_name)
 
@@ -221,10 +252,10 @@ class Solver:
             inner = Solver.get_lambda_function(exp[2])
             return lambda z, **kwargs: solve(inner(z, **kwargs), **kwargs)
         elif exp[0].type == TokenType.FUNC2:
-            func_name = exp[0].value
+            solve = Solver._get_func2(exp[0].value)
             solve1 = Solver.get_lambda_function(exp[2])
             solve2 = Solver.get_lambda_function(exp[4])
-            return lambda z, **kwargs: Solver._get_func2(func_name)(solve1(z, **kwargs), solve2(z, **kwargs))
+            return lambda z, **kwargs: solve(solve1(z, **kwargs), solve2(z, **kwargs))
         raise ParserError(ParserErrorType.NOT_SUPPORTED, exp[0].value)
 
     @staticmethod
@@ -233,14 +264,15 @@ class Solver:
         e_type = exp[0].type
         if e_type == TokenType.UNARY:
             if value == '-':
-                return lambda z, **kwargs: -Solver.get_lambda_function(exp[1])(z, **kwargs)
+                inner = Solver.get_lambda_function(exp[1])
+                return lambda z, **kwargs: -inner(z, **kwargs)
         raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
 
     @staticmethod
     def _get_solution_for_par(exp: list[Expression | Token]) -> Callable[[complex], complex]:
         value = exp[0].value
         if exp[0].type == TokenType.PARL and exp[2].type == TokenType.PARR:
-            return lambda z, **kwargs: Solver.get_lambda_function(exp[1])(z, **kwargs)
+            return Solver.get_lambda_function(exp[1])
         raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
 
     @staticmethod
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class StrokeSplitter:
+    """
+        Cuts the image of a stroke where the lines drawn through it would be spurious, and drops the values
+        that can't be drawn, so that every piece is a polyline worth drawing as it is.
+        Every branch is a polyline of its own. A branch is cut:
+        - at values that aren't finite or whose modulus is above max_modulus (near a pole), they are dropped;
+        - across a jump: a step more than jump_ratio times longer than the steps on both sides of it,
+          like the 2*pi*i of ln(z) crossing its cut;
+        - across a pole: a step longer than the steps on both sides of it, going back against both of them,
+          like tg(z) going from a large positive value to a large negative one.
+        Strokes are densified by the frontend, so the images of consecutive points are close, except there.
+    """
+    def __init__(self, jump_ratio: float = 8.0, max_modulus: float = 1e8):
+        if not (jump_ratio > 1 and max_modulus > 0):
+            raise ValueError('Bad split')
+        self.jump_ratio = jump_ratio
+        self.max_modulus = max_modulus
+
+    def split(self, fz: np.ndarray) -> list[np.ndarray]:
+        """(branches, points) values -> (1, n) pieces, the pieces of the first branch first"""
+        return StrokeSplitter.pieces(fz, *self.cuts(fz))
+
+    @staticmethod
+    def pieces(fz: np.ndarray, keep: np.ndarray, cut: np.ndarray) -> list[np.ndarray]:
+        """The (1, n) pieces of every branch: the values kept, cut at the steps cut (see cuts)"""
+        # a piece starts at a kept point following a dropped one or a cut, or at the start of a branch
+        starts = keep.copy()
+        starts[:, 1:] &= ~keep[:, :-1] | cut
+        flat = fz.reshape(-1)[keep.reshape(-1)]
+        bounds = np.flatnonzero(starts.reshape(-1)[keep.reshape(-1)])
+        return [piece.reshape(1, -1) for piece in np.split(flat, bounds[1:])] if len(bounds) > 0 else []
+
+    def cuts(self, fz: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+            (branches, points) mask of the values kept, and (branches, points - 1) mask of the steps cut,
+            from every point to the next one
+        """
+        with np.errstate(invalid='ignore', over='ignore'):
+            keep = np.isfinite(fz) & (np.abs(fz) <= self.max_modulus)
+        jump, pole = self.breaks(fz)
+        return keep, jump | pole
+
+    def jumps(self, fz: np.ndarray) -> np.ndarray:
+        """(branches, points - 1) mask of the steps across a jump only"""
+        return self.breaks(fz)[0]
+
+    def breaks(self, fz: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(branches, points - 1) masks of the steps across a jump and across a pole"""
+        with np.errstate(invalid='ignore', over='ignore'):
+            steps = np.diff(fz, axis=1)
+            length = np.abs(steps)
+            # the steps on both sides, a missing one (at an end or next to a dropped value) never cuts
+            before = np.full_like(length, np.inf)
+            after = np.full_like(length, np.inf)
+            before[:, 1:] = length[:, :-1]
+            after[:, :-1] = length[:, 1:]
+            backward_before = np.zeros(length.shape, dtype=bool)
+            backward_after = np.zeros(length.shape, dtype=bool)
+            backward_before[:, 1:] = (steps[:, 1:] * np.conj(steps[:, :-1])).real < 0
+            backward_after[:, :-1] = (steps[:, :-1] * np.conj(steps[:, 1:])).real < 0
+            neighbours = np.maximum(np.nan_to_num(before, nan=np.inf), np.nan_to_num(after, nan=np.inf))
+            # rounding noise of a constant is no jump
+            noticeable = length > 1e-9 * (1 + np.abs(fz[:, :-1]) + np.abs(fz[:, 1:]))
+            jump = noticeable & (length > self.jump_ratio * neighbours)
+            pole = noticeable & (length > neighbours) & backward_before & backward_after
+        return jump, pole
@@ -0,0 +1,24 @@
+from .lru_cache import LRUCache
+
+
+class TileCache:
+    """
+        Encoded domain coloring tiles, keyed by the canonical function string and the tile coordinates.
+        Panning and zooming back ask for the same tiles again, evicted least recently used first
+        once they take more than max_bytes.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self._cache = LRUCache(max_weight=max_bytes, weigher=len)
+
+    @staticmethod
+    def key(function_string: str, zoom: int, x: int, y: int) -> tuple:
+        return function_string, zoom, x, y
+
+    def get(self, key: tuple) -> bytes | None:
+        return self._cache.get(key)
+
+    def put(self, key: tuple, tile: bytes):
+        self._cache.put(key, tile)
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
@@ -0,0 +1,336 @@
+import numpy as np
+from typing import Callable
+
+from .parser import Expression, Token, TokenType, ExpressionType, Parser, ParserError, ParserErrorType
+from .branch_set import BranchSet
+
+
+class VectorSolver:
+    """
+        Same functions as Solver, but evaluated over a whole stroke at once.
+        Every value is a 2D complex array of shape (branches, points). Single-valued functions keep
+        the number of rows, multi-valued ones produce a row per branch, and binary operators combine
+        rows as a Cartesian product in the same order Solver combines its lists.
+        Flattening the transposed result gives exactly what Solver returns point by point,
+        except that branches repeating another one are dropped and that every value is kept within
+        the branch budget of num_branches (see BranchSet), so nested multi-valued functions stay bounded.
+    """
+    constants = Parser.constants
+    binary_operators = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide, '^': np.power}
+
+    @staticmethod
+    def get_function_for_array(exp: Expression) -> Callable[[np.ndarray], np.ndarray]:
+        return VectorSolver.wrap_for_array(VectorSolver.get_array_function(exp))
+
+    @staticmethod
+    def wrap_for_array(f: Callable[[np.ndarray], np.ndarray]) -> Callable[[np.ndarray], np.ndarray]:
+        def wrapper(z_array: np.ndarray, **kwargs) -> np.ndarray | tuple[np.ndarray, ...]:
+            z = np.asarray(z_array, dtype=np.complex128).reshape(1, -1)
+            with np.errstate(all='ignore'):
+                result = f(z, **kwargs)
+            if isinstance(result, tuple):  # several functions compiled together
+                return tuple(VectorSolver._spread(value, z.shape[1]) for value in result)
+            return VectorSolver._spread(result, z.shape[1])
+
+        return wrapper
+
+    @staticmethod
+    def _spread(value: np.ndarray, points: int) -> np.ndarray:
+        value = np.asarray(value, dtype=np.complex128)
+        # constant expressions come out as a single column, spread them over the stroke
+        return np.broadcast_to(value, (value.shape[0], points))
+
+    @staticmethod
+    def get_array_function(exp: Expression) -> Callable[[np.ndarray], np.ndarray]:
+        if exp.type == ExpressionType.VAL:
+            return VectorSolver._get_solution_for_val(exp.value)
+        if exp.type == ExpressionType.FUNC:
+            return VectorSolver._get_solution_for_func(exp.value)
+        if exp.type == ExpressionType.UNARY:
+            return VectorSolver._get_solution_for_unary(exp.value)
+        if exp.type == ExpressionType.PAR:
+            return VectorSolver._get_solution_for_par(exp.value)
+        if exp.type == ExpressionType.BINARY:
+            return VectorSolver._get_solution_for_binary(exp.value)
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, exp.type)
+
+    @staticmethod
+    def constant(value: complex) -> np.ndarray:
+        return np.full((1, 1), value, dtype=np.complex128)
+
+    @staticmethod
+    def get_func1(f_name) -> Callable[[np.ndarray], np.ndarray]:
+        return VectorSolver._distinct(VectorSolver._get_func1(f_name))
+
+    @staticmethod
+    def get_func2(f_name) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        return VectorSolver._distinct(VectorSolver._get_func2(f_name))
+
+    @staticmethod
+    def get_binary_operator(op: str) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        if op not in VectorSolver.binary_operators:
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, op)
+        operation = VectorSolver.binary_operators[op]
+        return lambda a, b, num_branches=6, **kwargs: VectorSolver._combine(a, b, operation, num_branches)
+
+    @staticmethod
+    def get_integer_power() -> Callable[[np.ndarray, int], np.ndarray]:
+        # root(z, 2) ^ 2 is z for both roots
+        return lambda a, n: BranchSet.unique(VectorSolver.power_int(a, n))
+
+    @staticmethod
+    def _get_solution_for_val(exp: list[Expression | Token]) -> Callable[[np.ndarray], np.ndarray]:
+        value = exp[0].value
+        e_type = exp[0].type
+        if e_type == TokenType.CONST:
+            if value == 'i':
+                c = VectorSolver.constant(1j)
+            elif value == 'pi':
+                c = VectorSolver.constant(np.pi)
+            elif value == 'e':
+                c = VectorSolver.constant(np.e)
+            else:
+                raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
+            return lambda z, **kwargs: c
+        elif e_type == TokenType.NUM:
+            c = VectorSolver.constant(float(value))
+            return lambda z, **kwargs: c
+        elif e_type == TokenType.VALUE:
+            c = VectorSolver.constant(value)
+            return lambda z, **kwargs: c
+        else:
+            return lambda z, **kwargs: z
+
+    @staticmethod
+    def _get_func1(f_name) -> Callable[[np.ndarray], np.ndarray]:
+        if f_name == 'real':
+            return lambda z, **kwargs: z.real + 0j
+        if f_name == 'im':
+            return lambda z, **kwargs: z.imag + 0j
+        if f_name == 'sin':
+            return lambda z, **kwargs: np.sin(z)
+        if f_name == 'cos':
+            return lambda z, **kwargs: np.cos(z)
+        if f_name == 'tg':
+            return lambda z, **kwargs: np.tan(z)
+        if f_name == 'ctg':
+            return lambda z, **kwargs: VectorSolver._reciprocal(np.tan(z))
+        if f_name == 'asin':
+            return VectorSolver._branched(VectorSolver.multi_valued_asin)
+        if f_name == 'acos':
+            return VectorSolver._branched(VectorSolver.multi_valued_acos)
+        if f_name == 'atg':
+            return VectorSolver._branched(VectorSolver.multi_valued_atg, True)
+        if f_name == 'actg':
+            return VectorSolver._branched(VectorSolver.multi_valued_actg, True)
+        if f_name == 'ln':
+            return VectorSolver._branched(VectorSolver.multi_valued_log)
+        if f_name == 'abs':
+            return lambda z, **kwargs: np.abs(z) + 0j
+        if f_name == 'phi':
+            return lambda z, **kwargs: np.angle(z) + 0j
+        if f_name == 'sh':
+            return lambda z, **kwargs: np.sinh(z)
+        if f_name == 'ch':
+            return lambda z, **kwargs: np.cosh(z)
+        if f_name == 'th':
+            return lambda z, **kwargs: np.tanh(z)
+        if f_name == 'cth':
+            return lambda z, **kwargs: VectorSolver._reciprocal(np.tanh(z))
+        if f_name == 'sch':
+            return lambda z, **kwargs: VectorSolver._reciprocal(np.cosh(z))
+        if f_name == 'csch':
+            return lambda z, **kwargs: VectorSolver._reciprocal(np.sinh(z))
+        if f_name == 'arsh':
+            return VectorSolver._branched(VectorSolver.multi_valued_arsh)
+        if f_name == 'arch':
+            return VectorSolver._branched(VectorSolver.multi_valued_arch)
+        if f_name == 'arth':
+            return VectorSolver._branched(VectorSolver.multi_valued_arth, True)
+        if f_name == 'arcth':
+            return VectorSolver._branched(VectorSolver.multi_valued_arcth, True)
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, f_name)
+
+    @staticmethod
+    def _get_func2(f_name) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        if f_name == 'log':
+            # like Solver, log always uses the default branch range
+            return lambda x, y, num_branches=6, **kwargs: VectorSolver.multi_valued_log(
+                *BranchSet.fit_pair(x, y, len(range(-6, 6)), BranchSet.budget(num_branches)))
+        if f_name == 'root':
+            # the number of roots is only known from the values of y, the result is cut afterwards
+            return lambda x, y, num_branches=6, **kwargs: BranchSet.limit(VectorSolver.multi_valued_root(
+                *BranchSet.fit_pair(x, y, 1, BranchSet.budget(num_branches))), BranchSet.budget(num_branches))
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, f_name)
+
+    @staticmethod
+    def _branched(multi_valued: Callable[..., np.ndarray], difference: bool = False) -> Callable[..., np.ndarray]:
+        # the argument of multi_valued is cut first so that its distinct branches fit in the budget.
+        # With difference, multi_valued is the difference of two logarithms: of the k_range ** 2 branches
+        # it gives, only the difference of the branch numbers matters, once the duplicates are dropped
+        def solve(z: np.ndarray, num_branches: int = 6, **kwargs) -> np.ndarray:
+            k_range = range(-num_branches, num_branches + 1)
+            fan_out = 2 * len(k_range) - 1 if difference else len(k_range)
+            z = BranchSet.fit(z, fan_out, BranchSet.budget(num_branches))
+            return multi_valued(z, k_range=k_range)
+
+        return solve
+
+    @staticmethod
+    def _distinct(f: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+        # branches can meet: sin(asin(z)) has a single value, as do ln(z) - ln(z) or real(ln(z))
+        return lambda *args, **kwargs: BranchSet.unique(f(*args, **kwargs))
+
+    @staticmethod
+    def _log_branches(x: np.ndarray, k_range) -> np.ndarray:
+        # shape (rows of x, branches, points)
+        k = np.asarray(k_range, dtype=np.float64).reshape(1, -1, 1)
+        x = x[:, None, :]
+        return np.log(np.abs(x)) + 1j * (np.angle(x) + 2 * np.pi * k)
+
+    @staticmethod
+    def multi_valued_log(x: np.ndarray, base: np.ndarray | complex = np.e, k_range=range(-6, 6)) -> np.ndarray:
+        logs = VectorSolver._log_branches(x, k_range)
+        base = np.atleast_2d(np.asarray(base, dtype=np.complex128))
+        logb = np.log(np.abs(base)) + 1j * np.angle(base)
+        # every value of x against every value of the base, then every branch
+        result = logs[:, None, :, :] / logb[None, :, None, :]
+        return result.reshape(-1, result.shape[-1])
+
+    @staticmethod
+    def multi_valued_root(x: np.ndarray, n: np.ndarray) -> np.ndarray:
+        if n.size == 0:
+            return np.empty((0, x.shape[1]), dtype=np.complex128)
+        degrees = np.unique(np.trunc(n.real))
+        if len(degrees) != 1 or not np.isfinite(degrees[0]) or int(degrees[0]) < 1:
+            # the number of roots has to be the same for every point of the stroke
+            raise ParserError(ParserErrorType.NOT_SUPPORTED, 'root')
+        n_rows, n = n.shape[0], int(degrees[0])
+        k = np.arange(n, dtype=np.float64).reshape(1, 1, -1, 1)
+        r = np.abs(x) ** (1 / n)
+        theta = np.angle(x)
+        roots = r[:, None, None, :] * np.exp(1j * (theta[:, None, None, :] + 2 * np.pi * k) / n)
+        # one set of roots for every pair of values of x and n, like Solver does
+        roots = np.broadcast_to(roots, (x.shape[0], n_rows, n, x.shape[1]))
+        return roots.reshape(-1, x.shape[1])
+
+    @staticmethod
+    def multi_valued_asin(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        root = np.sqrt(1 - z * z)
+        return -1j * VectorSolver.multi_valued_log(1j * z + root, k_range=k_range)
+
+    @staticmethod
+    def multi_valued_acos(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        root = np.sqrt(1 - z * z)
+        log_vals = VectorSolver.multi_valued_log(z + root, k_range=k_range)
+        return np.pi / 2 - (-1j * log_vals)  # acos = π/2 - asin(z)
+
+    @staticmethod
+    def multi_valued_atg(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        log1 = VectorSolver._log_branches(1 + 1j * z, k_range)
+        log2 = VectorSolver._log_branches(1 - 1j * z, k_range)
+        result = 0.5j * (log1[:, :, None, :] - log2[:, None, :, :])
+        return result.reshape(-1, z.shape[-1])
+
+    @staticmethod
+    def multi_valued_actg(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        return np.pi / 2 - VectorSolver.multi_valued_atg(1 / z, k_range=k_range)
+
+    @staticmethod
+    def multi_valued_arsh(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        root = np.sqrt(z * z + 1)
+        return VectorSolver.multi_valued_log(z + root, k_range=k_range)
+
+    @staticmethod
+    def multi_valued_arch(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        root = np.sqrt(z * z - 1)
+        return VectorSolver.multi_valued_log(z + root, k_range=k_range)
+
+    @staticmethod
+    def multi_valued_arth(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        log1 = VectorSolver._log_branches(1 + z, k_range)
+        log2 = VectorSolver._log_branches(1 - z, k_range)
+        result = 0.5 * (log1[:, :, None, :] - log2[:, None, :, :])
+        return result.reshape(-1, z.shape[-1])
+
+    @staticmethod
+    def multi_valued_arcth(z: np.ndarray, k_range=range(-6, 6)) -> np.ndarray:
+        # Solver drops zero values, here they become infinities so that every row keeps its length
+        return 1 / VectorSolver.multi_valued_arth(1 / z, k_range=k_range)
+
+    @staticmethod
+    def _reciprocal(x: np.ndarray) -> np.ndarray:
+        # x is a fresh result of a ufunc, so it can be overwritten instead of allocating another array
+        return np.divide(1, x, out=x)
+
+    @staticmethod
+    def power_int(a: np.ndarray, n: int) -> np.ndarray:
+        """a ^ n for an integer n, by repeated squaring, branch by branch like np.power does"""
+        if n == 0:
+            return np.ones_like(a)
+        result = None
+        square = a
+        m = abs(n)
+        while True:
+            if m & 1:
+                result = square if result is None else result * square
+            m >>= 1
+            if m == 0:
+                break
+            square = square * square
+        if n < 0:
+            return np.divide(1, result)
+        return result
+
+    @staticmethod
+    def _combine(a: np.ndarray, b: np.ndarray, op, num_branches: int) -> np.ndarray:
+        a, b = BranchSet.fit_pair(a, b, 1, BranchSet.budget(num_branches))
+        return BranchSet.unique(VectorSolver._apply_op(a, b, op))
+
+    @staticmethod
+    def _apply_op(a: np.ndarray, b: np.ndarray, op) -> np.ndarray:
+        result = op(a[:, None, :], b[None, :, :])
+        return result.reshape(-1, result.shape[-1])
+
+    @staticmethod
+    def _get_solution_for_func(exp: list[Expression | Token]) -> Callable[[np.ndarray], np.ndarray]:
+        if exp[0].type == TokenType.FUNC1:
+            solve = VectorSolver.get_func1(exp[0].value)
+            inner = VectorSolver.get_array_function(exp[2])
+            return lambda z, **kwargs: solve(inner(z, **kwargs), **kwargs)
+        elif exp[0].type == TokenType.FUNC2:
+            solve = VectorSolver.get_func2(exp[0].value)
+            solve1 = VectorSolver.get_array_function(exp[2])
+            solve2 = VectorSolver.get_array_function(exp[4])
+            return lambda z, **kwargs: solve(solve1(z, **kwargs), solve2(z, **kwargs), **kwargs)
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, exp[0].value)
+
+    @staticmethod
+    def _get_solution_for_unary(exp: list[Expression | Token]) -> Callable[[np.ndarray], np.ndarray]:
+        value = exp[0].value
+        if exp[0].type == TokenType.UNARY and value == '-':
+            inner = VectorSolver.get_array_function(exp[1])
+            return lambda z, **kwargs: -inner(z, **kwargs)
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
+
+    @staticmethod
+    def _get_solution_for_par(exp: list[Expression | Token]) -> Callable[[np.ndarray], np.ndarray]:
+        value = exp[0].value
+        if exp[0].type == TokenType.PARL and exp[2].type == TokenType.PARR:
+            return VectorSolver.get_array_function(exp[1])
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, value)
+
+    @staticmethod
+    def _get_solution_for_binary(exp: list[Expression | Token]) -> Callable[[np.ndarray], np.ndarray]:
+        if exp[1].type == TokenType.BINARY:
+            op = exp[1].value
+            solve1 = VectorSolver.get_array_function(exp[0])
+            solve2 = VectorSolver.get_array_function(exp[2])
+
+            if op in VectorSolver.binary_operators:
+                operation = VectorSolver.binary_operators[op]
+                return lambda z, num_branches=6, **kwargs: VectorSolver._combine(
+                    solve1(z, num_branches=num_branches, **kwargs), solve2(z, num_branches=num_branches, **kwargs),
+                    operation, num_branches)
+
+        raise ParserError(ParserErrorType.NOT_SUPPORTED, exp[1].value)
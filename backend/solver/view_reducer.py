@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class ViewReducer:
+    """
+        Drops the points of a result that can't be seen in the result view.
+        view is the visible rectangle, {'top', 'bottom', 'left', 'right'} like the ViewRectangle of the frontend,
+        size is its size in pixels.
+        - culling: points whose every branch is outside the view grown by margin (a share of its size
+          on every side) are dropped, except the neighbours of kept points, so lines still leave the view.
+          Every run of kept points is a piece of its own, the line is broken where points are dropped
+          rather than joined by a chord across the view;
+        - decimation: Ramer-Douglas-Peucker with pixel_tolerance pixels, a point is kept if any branch needs it.
+        Non-finite values and their neighbours are always kept, they break the lines where they are.
+    """
+    def __init__(self, view: dict, size: tuple[int, int] = (1000, 1000), pixel_tolerance: float = 0.5,
+                 margin: float = 0.5):
+        left, right, bottom, top = (float(view[side]) for side in ['left', 'right', 'bottom', 'top'])
+        width, height = size
+        if not (right > left and top > bottom and width > 0 and height > 0 and pixel_tolerance >= 0 and margin >= 0):
+            raise ValueError('Bad view')
+        dx = (right - left) * margin
+        dy = (top - bottom) * margin
+        self.bounds = (left - dx, right + dx, bottom - dy, top + dy)
+        self.tolerance = pixel_tolerance * max((right - left) / width, (top - bottom) / height)
+
+    def reduce(self, fz: np.ndarray) -> list[np.ndarray]:
+        """(branches, points) values -> the same branches with the points worth sending, a piece per run of them"""
+        if fz.shape[1] <= 2:
+            return [fz]
+        return [piece if piece.shape[1] <= 2 else piece[:, self.decimated(piece)]
+                for piece in ViewReducer.runs(fz, self.visible(fz))]
+
+    def visible(self, fz: np.ndarray) -> np.ndarray:
+        left, right, bottom, top = self.bounds
+        with np.errstate(invalid='ignore'):
+            inside = ((fz.real >= left) & (fz.real <= right) & (fz.imag >= bottom) & (fz.imag <= top)
+                      | ~np.isfinite(fz)).any(axis=0)
+        keep = inside.copy()
+        keep[1:] |= inside[:-1]
+        keep[:-1] |= inside[1:]
+        return keep
+
+    @staticmethod
+    def runs(fz: np.ndarray, keep: np.ndarray) -> list[np.ndarray]:
+        """The runs of points kept, between the points dropped"""
+        kept = np.flatnonzero(keep)
+        if len(kept) == 0:
+            return []
+        return [fz[:, run] for run in np.split(kept, np.flatnonzero(np.diff(kept) > 1) + 1)]
+
+    def decimated(self, fz: np.ndarray) -> np.ndarray:
+        branches, points = fz.shape
+        finite = np.isfinite(fz)
+        fixed = ~finite
+        fixed[:, 1:] |= ~finite[:, :-1]
+        fixed[:, :-1] |= ~finite[:, 1:]
+        fixed[:, [0, -1]] = True
+        keep = ViewReducer.rdp(fz.reshape(-1), fixed.reshape(-1), self.tolerance)
+        return keep.reshape(branches, points).any(axis=0)
+
+    @staticmethod
+    def rdp(z: np.ndarray, fixed: np.ndarray, tolerance: float) -> np.ndarray:
+        """
+            Ramer-Douglas-Peucker over the polyline z, the pieces between fixed points are simplified separately.
+            All the pieces of one round are split together, with array operations.
+        """
+        keep = fixed.copy()
+        kept = np.flatnonzero(keep)
+        starts, ends = kept[:-1], kept[1:]
+        while True:
+            inner = ends - starts - 1
+            starts, ends, inner = starts[inner > 0], ends[inner > 0], inner[inner > 0]
+            if len(starts) == 0:
+                return keep
+            piece = np.repeat(np.arange(len(starts)), inner)
+            first = np.cumsum(inner) - inner
+            index = np.arange(inner.sum()) - np.repeat(first, inner) + np.repeat(starts + 1, inner)
+            a = z[starts][piece]
+            chord = z[ends][piece] - a
+            offset = z[index] - a
+            # distance to the chord as a segment, not as a line: a polyline may go back along itself
+            square = np.abs(chord) ** 2
+            with np.errstate(invalid='ignore', divide='ignore'):
+                t = np.clip(np.where(square > 0, (np.conj(chord) * offset).real / square, 0), 0, 1)
+            distance = np.abs(offset - t * chord)
+            # the farthest point of every piece: sort by piece, then by distance going down
+            order = np.lexsort((-distance, piece))
+            farthest = order[first]
+            split = distance[farthest] > tolerance
+            points = index[farthest][split]
+            keep[points] = True
+            starts, ends = np.concatenate([starts[split], points]), np.concatenate([points, ends[split]])
@@ -0,0 +1,117 @@
+import struct
+import zlib
+import numpy as np
+
+from .z_array import ZLabeledArray
+
+
+class WireFormat:
+    """
+        Binary form of labeled strokes, used instead of JSON when the client asks for it.
+        All numbers are little-endian.
+
+        header  24 bytes  magic b'CXS1', dtype code (u8), flags (u8), 2 reserved bytes,
+                          number of strokes (u32), 4 reserved bytes, quantization step (f64)
+        table   16 bytes per stroke: label (f64), number of points (u32), number of branches (u32)
+        payload values of all strokes one after another, every value is a (real, imaginary) pair.
+                Within a stroke the values go point by point, all branches of a point together,
+                like in the JSON response. Strokes of a request have one branch.
+
+        dtype   0 float64, 1 float32,
+                2 int32 multiples of the quantization step, non-finite values are sent as -2^31
+        flags   bit 0: the payload is compressed with zlib
+
+        A compressed payload is inflated up to the size its table gives, and at most max_payload bytes:
+        a small request can't inflate to more than the largest request the server accepts.
+    """
+    mimetype = 'application/x-complex-strokes'
+    magic = b'CXS1'
+    header = struct.Struct('<4sBBxxIxxxxd')
+    record = struct.Struct('<dII')
+    dtypes = {'float64': 0, 'float32': 1, 'quantized': 2}
+    value_types = {0: np.dtype('<f8'), 1: np.dtype('<f4'), 2: np.dtype('<i4')}
+    compressed = 1
+    missing = np.iinfo(np.int32).min
+    max_payload = 32 * 1024 * 1024  # COMPLEX_MAX_BODY of asgi.py, by default
+
+    @staticmethod
+    def decode(buffer: bytes) -> list[tuple[float, np.ndarray]]:
+        """
+            Labels with the (points, branches, 2) float arrays of the strokes.
+            float64 payloads that aren't compressed are not copied, the arrays are views of buffer.
+        """
+        try:
+            magic, code, flags, count, step = WireFormat.header.unpack_from(buffer, 0)
+            if magic != WireFormat.magic or code not in WireFormat.value_types:
+                raise TypeError('Not a valid stroke buffer')
+            table = [WireFormat.record.unpack_from(buffer, WireFormat.header.size + i * WireFormat.record.size)
+                     for i in range(count)]
+            offset = WireFormat.header.size + count * WireFormat.record.size
+            payload = memoryview(buffer)[offset:]
+            value_type = WireFormat.value_types[code]
+            sizes = [points * branches * 2 for _, points, branches in table]
+            if flags & WireFormat.compressed:
+                payload = WireFormat._decompress(payload, sum(sizes) * value_type.itemsize)
+            values = np.frombuffer(payload, dtype=value_type, count=sum(sizes))
+        except (struct.error, zlib.error, ValueError):
+            raise TypeError('Not a valid stroke buffer')
+
+        if code == WireFormat.dtypes['quantized']:
+            missing = values == WireFormat.missing
+            values = values * step
+            values[missing] = np.nan
+        strokes = []
+        start = 0
+        for (label, points, branches), size in zip(table, sizes):
+            strokes.append((label, values[start:start + size].reshape(points, branches, 2)))
+            start += size
+        return strokes
+
+    @staticmethod
+    def _decompress(payload, size: int) -> bytes:
+        # one byte more than the table gives, so that the end of a stream of the right size is read
+        if size > WireFormat.max_payload:
+            raise TypeError('Stroke buffer too large')
+        decompressor = zlib.decompressobj()
+        inflated = decompressor.decompress(payload, size + 1)
+        if len(inflated) > size or not decompressor.eof:
+            raise TypeError('Not a valid stroke buffer')
+        return inflated
+
+    @staticmethod
+    def read_strokes(buffer: bytes) -> ZLabeledArray:
+        strokes = WireFormat.decode(buffer)
+        if any(values.shape[1] != 1 for _, values in strokes):
+            raise TypeError('Not a valid labeled array')
+        return ZLabeledArray([[label, values[:, 0, :]] for label, values in strokes])
+
+    @staticmethod
+    def encode(strokes: list[tuple[float, np.ndarray]], dtype='float64', step=1e-6, compress=False) -> bytes:
+        """strokes are labels with (branches, points) complex arrays, as the solvers return them"""
+        code = WireFormat.dtypes[dtype]
+        table = []
+        parts = []
+        for label, fz in strokes:
+            branches, points = fz.shape
+            table.append(WireFormat.record.pack(float(label), points, branches))
+            parts.append(WireFormat._pack_values(fz.T, code, step))
+        payload = b''.join(parts)
+        if compress:
+            payload = zlib.compress(payload, 1)
+        header = WireFormat.header.pack(WireFormat.magic, code, WireFormat.compressed if compress else 0,
+                                        len(table), step)
+        return b''.join([header, *table, payload])
+
+    @staticmethod
+    def _pack_values(fz: np.ndarray, code: int, step: float) -> bytes:
+        # complex128 is a (real, imaginary) pair of float64 already, float64 output is the array itself
+        if code == WireFormat.dtypes['float64']:
+            return np.ascontiguousarray(fz, dtype='<c16').tobytes()
+        if code == WireFormat.dtypes['float32']:
+            return np.ascontiguousarray(fz, dtype='<c8').tobytes()
+        pairs = np.ascontiguousarray(fz, dtype=np.complex128).view(np.float64)
+        limit = np.iinfo(np.int32).max
+        with np.errstate(invalid='ignore'):
+            quantized = np.clip(np.rint(pairs / step), -limit, limit)
+        quantized[~np.isfinite(pairs)] = WireFormat.missing
+        return quantized.astype('<i4').tobytes()
@@ -1,9 +1,13 @@
+import hashlib
 import numpy as np
 
+from .shapes import Shapes
+
 
 class ZArray:
     def __init__(self, points: [[float, float]]):
-        self.points = np.array(points)
+        # arrays are kept as they are, so a view of a request buffer stays a view
+        self.points = np.asarray(points)
 
     def get_x (self):
         return self.points[..., 0]
@@ -11,8 +15,25 @@ class ZArray:
     def get_y (self):
         return self.points[..., 1]
 
+    def get_z(self):
+        points = self.points
+        if points.dtype == np.float64 and points.ndim == 2 and points.shape[1] == 2 and points.flags.c_contiguous:
+            # (x, y) pairs of float64 are laid out exactly like complex128, no need to compute anything
+            return points.view(np.complex128)[:, 0]
+        return self.get_x().astype(np.float64) + self.get_y() * 1j
+
+    @property
+    def content_hash(self) -> str:
+        # same points give the same hash, whatever number type they were sent as
+        points = np.ascontiguousarray(self.points, dtype=np.float64)
+        return hashlib.blake2b(points.tobytes() + str(points.shape).encode(), digest_size=16).hexdigest()
+
 
 class ZLabeledArray:
+    """
+        Labeled strokes: [[label, points], ...] where points are [x, y] pairs,
+        or a shape the points are sampled from, see Shapes.
+    """
     def __init__(self, labeled_points):
         if labeled_points is [[int, ZArray]]:
             self.labeled_points = labeled_points
@@ -22,7 +43,10 @@ class ZLabeledArray:
                 for labeled in labeled_points:
                     label = labeled[0]
                     points = labeled[1]
+                    if isinstance(points, dict):
+                        # (x, y) pairs of float64, a view of the complex points
+                        points = Shapes.sample(points).view(np.float64).reshape(-1, 2)
                     z = ZArray(points)
                     self.labeled_points.append([label, z])
-            except TypeError:
+            except (TypeError, IndexError):
                 raise TypeError('Not a valid labeled array')
\ No newline at end of file
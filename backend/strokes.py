@@ -0,0 +1,213 @@
+import json
+import numpy as np
+from solver.z_array import ZArray, ZLabeledArray
+from solver.wire_format import WireFormat
+from solver.equation_cache import EquationCache
+from solver.equation import Equation, EquationGroup
+from solver.result_cache import ResultCache
+from solver.branch_set import BranchSet
+from solver.adaptive_sampler import AdaptiveSampler
+from solver.view_reducer import ViewReducer
+from solver.stroke_splitter import StrokeSplitter
+from solver.preimage import Preimage
+from solver.parallel_evaluator import ParallelEvaluator
+from solver.parser import Expression, ExpressionType, ParserError
+from metrics import RequestTiming
+
+
+def flatten_branches(fz: np.ndarray) -> list[list[float]]:
+    # (branches, points) -> all branches of the first point, then of the second one, and so on
+    w = fz.T.reshape(-1)
+    return np.stack((w.real, w.imag), axis=-1).tolist()
+
+def error_text(e: ParserError) -> str:
+    return f'{e.type.value} {e.text_value}'
+
+def sampler_from_args(args) -> AdaptiveSampler | None:
+    # ?sampling=adaptive&tolerance=0.01&maxStep=0.25&maxDepth=10, raises ValueError for bad values
+    if args.get('sampling', 'points') == 'points':
+        return None
+    if args.get('sampling') != 'adaptive':
+        raise ValueError('Unknown sampling')
+    return AdaptiveSampler(tolerance=float(args.get('tolerance', 0.01)), max_step=float(args.get('maxStep', 0.25)),
+                           max_depth=int(args.get('maxDepth', 10)))
+
+def fields_from_args(args) -> dict:
+    # a binary request has no JSON body, its fields come in the query string:
+    # ?lnBranches=6&view=top,bottom,left,right&viewSize=width,height&pixelTolerance=0.5&split=1&jumpRatio=8
+    # &trackBranches=1
+    fields = {'lnBranches': int(args.get('lnBranches', 6))}
+    if 'view' in args:
+        fields['view'] = dict(zip(['top', 'bottom', 'left', 'right'], map(float, args['view'].split(','))))
+    if 'viewSize' in args:
+        fields['viewSize'] = [int(size) for size in args['viewSize'].split(',')]
+    if 'pixelTolerance' in args:
+        fields['pixelTolerance'] = float(args['pixelTolerance'])
+    if args.get('split', '0') == '1':
+        fields['split'] = True
+    if args.get('trackBranches', '0') == '1':
+        fields['trackBranches'] = True
+    for name in ['jumpRatio', 'maxModulus']:
+        if name in args:
+            fields[name] = float(args[name])
+    return fields
+
+def binary_options_from_args(args) -> dict:
+    # the binary format is sent only to clients asking for it, its options come in the query string:
+    # ?dtype=float32&step=1e-6&compress=1, raises TypeError or ValueError for bad values
+    options = {'dtype': args.get('dtype', 'float64'),
+               'step': float(args.get('step', 1e-6)),
+               'compress': args.get('compress', '0') == '1'}
+    if options['dtype'] not in WireFormat.dtypes or not options['step'] > 0:
+        raise TypeError('Bad binary format options')
+    return options
+
+def reducer_from_fields(raw_data: dict) -> ViewReducer | None:
+    # {"view": {"top", "bottom", "left", "right"}, "viewSize": [width, height], "pixelTolerance": 0.5}
+    # in the request body, raises ValueError, TypeError or KeyError for bad values
+    if raw_data.get('view') is None:
+        return None
+    width, height = raw_data.get('viewSize', [1000, 1000])
+    return ViewReducer(raw_data['view'], (int(width), int(height)), float(raw_data.get('pixelTolerance', 0.5)))
+
+def splitter_from_fields(raw_data: dict) -> StrokeSplitter | None:
+    # {"split": true, "jumpRatio": 8, "maxModulus": 1e8} in the request body, raises ValueError or TypeError
+    # for bad values
+    if raw_data.get('split') is not True:
+        return None
+    return StrokeSplitter(float(raw_data.get('jumpRatio', 8.0)), float(raw_data.get('maxModulus', 1e8)))
+
+def track_from_fields(raw_data: dict) -> bool:
+    # {"trackBranches": true} in the request body: every branch of a stroke comes as a polyline of its own
+    return raw_data.get('trackBranches') is True
+
+def preimage_from_fields(raw_data: dict, exp: Expression) -> Preimage:
+    # {"region": {"left", "right", "bottom", "top"}, "seeds": 16, "maxIterations": 30, "maxPreimages": 64}
+    # in the request body, raises ValueError, TypeError or KeyError for bad values and ParserError
+    # for a function without a derivative
+    region = raw_data.get('region', {'left': -4, 'right': 4, 'bottom': -4, 'top': 4})
+    return Preimage(exp, tuple(float(region[side]) for side in ['left', 'right', 'bottom', 'top']),
+                    int(raw_data.get('seeds', 16)), int(raw_data.get('maxIterations', 30)),
+                    int(raw_data.get('maxPreimages', 64)))
+
+class StrokesRequest:
+    """
+        A /strokes request, read the same way by the Flask app and by the workers of asgi.py: the fields
+        come in the JSON body, or in the query string when the strokes come in the binary format.
+        binary tells if the client accepts the binary format.
+        Raises TypeError, ValueError, KeyError or AttributeError for a bad request
+    """
+    def __init__(self, args, content_type: str, body: bytes, binary: bool, timing: RequestTiming):
+        self.timing = timing
+        with timing.phase('decode'):
+            raw_data = fields_from_args(args) if content_type == WireFormat.mimetype else json.loads(body)
+            self.ln_branches = raw_data.get('lnBranches', 6)
+            self.options = binary_options_from_args(args) if binary else None
+            self.sampler = sampler_from_args(args)
+            self.reducer = reducer_from_fields(raw_data)
+            self.splitter = splitter_from_fields(raw_data)
+            self.track = track_from_fields(raw_data)
+            self.f = args.get('f')
+        with timing.phase('strokes'):
+            if content_type == WireFormat.mimetype:
+                self.z_array = WireFormat.read_strokes(body)
+            else:
+                self.z_array = ZLabeledArray(raw_data['z'])
+
+    def compile(self, equations: EquationCache) -> Equation | None:
+        # None for a function string without an expression, raises ParserError
+        with self.timing.phase('compile'):
+            self.timing.equation_cached = self.f in equations
+            eq = equations.get(self.f)
+            self.timing.function = eq.function_string
+            if eq.expression.type == ExpressionType.NONE:
+                return None
+            eq.vector_function  # compiled here rather than in the first evaluation
+        return eq
+
+    def evaluate(self, results: ResultCache, eq: Equation, evaluator: ParallelEvaluator | None = None):
+        # the labeled pieces of the strokes, one stroke at a time, see evaluate_strokes
+        return evaluate_strokes(results, eq, self.z_array, self.ln_branches, self.sampler, self.reducer,
+                                self.timing, evaluator, self.splitter, self.track)
+
+    def serialize(self, strokes: list) -> tuple[str, bytes]:
+        # the content type and the body of the response
+        with self.timing.phase('serialize'):
+            if self.options is not None:
+                return WireFormat.mimetype, WireFormat.encode(strokes, **self.options)
+            return 'application/json', json.dumps([[label, flatten_branches(fz)] for label, fz in strokes]).encode()
+
+def evaluate_strokes(results: ResultCache, eq: Equation, z_array: ZLabeledArray, ln_branches,
+                     sampler: AdaptiveSampler | None = None, reducer: ViewReducer | None = None,
+                     timing: RequestTiming | None = None, evaluator: ParallelEvaluator | None = None,
+                     splitter: StrokeSplitter | None = None, track: bool = False):
+    # one stroke at a time, so a streamed response holds only the stroke being sent;
+    # large requests are evaluated ahead by the evaluator, on several processes.
+    # With a splitter or track, a stroke comes as its pieces (see stroke_pieces), all with its label
+    timing = timing if timing is not None else RequestTiming('')
+    function = eq.vector_function
+    sampling = sampler.key if sampler is not None else ()
+    evaluated = {}  # stroke index -> values evaluated ahead by the evaluator
+    if evaluator is not None and sampler is None:
+        with timing.phase('evaluate'):
+            missing = [i for i, (_, z) in enumerate(z_array.labeled_points)
+                       if ResultCache.key(eq.function_string, z, ln_branches) not in results]
+            zs = [z_array.labeled_points[i][1].get_z() for i in missing]
+            if evaluator.worth_it(sum(len(z) for z in zs)):
+                evaluated = dict(zip(missing, evaluator.evaluate(eq.function_string, function, zs, ln_branches)))
+    for i, (label, z) in enumerate(z_array.labeled_points):
+        with timing.phase('evaluate'):
+            # strokes are sent again on every recalculation, most of them are already evaluated
+            key = ResultCache.key(eq.function_string, z, ln_branches, sampling)
+            fz = evaluated.pop(i, None)
+            cached = False
+            if fz is None:
+                fz = results.get(key)
+                cached = fz is not None
+            if fz is None:
+                if sampler is None:
+                    fz = function(z.get_z(), num_branches=ln_branches)
+                else:
+                    fz = sampler.sample(function, z.get_z(), ln_branches)
+            if not cached:
+                results.put(key, fz)
+            # the whole result is cached, the view changes more often than the strokes
+            pieces = stroke_pieces(fz, reducer, splitter, track)
+        timing.count_stroke(fz.shape[0], fz.shape[1], cached)
+        for piece in pieces:
+            yield label, piece
+
+def stroke_pieces(fz: np.ndarray, reducer: ViewReducer | None, splitter: StrokeSplitter | None,
+                  track: bool) -> list[np.ndarray]:
+    # the polylines sent for the (branches, points) values of a stroke: the values themselves, or with
+    # a reducer a piece per run of them in the view, and with a splitter their (1, n) pieces.
+    # With track, the branches are matched on all the points first (see BranchSet.track), before
+    # the reducer drops some of them, and every branch comes as its pieces: cut by the splitter,
+    # or else at the jumps left, where a branch runs off the computed ones
+    if not track:
+        pieces = reducer.reduce(fz) if reducer is not None else [fz]
+        return [part for piece in pieces for part in splitter.split(piece)] if splitter is not None else pieces
+    fz = BranchSet.track(fz)
+    if splitter is not None:
+        keep, cut = splitter.cuts(fz)
+    else:
+        keep, cut = np.ones(fz.shape, dtype=bool), StrokeSplitter().jumps(fz)
+    pieces = StrokeSplitter.pieces(fz, keep, cut)
+    if reducer is None:
+        return pieces
+    return [part for piece in pieces for part in reducer.reduce(piece)]
+
+def evaluate_group(results: ResultCache, group: EquationGroup, z: ZArray, ln_branches,
+                   timing: RequestTiming | None = None) -> list:
+    # one evaluation of the merged function for all equations of the group, unless all of them are cached
+    keys = [ResultCache.key(eq.function_string, z, ln_branches) for eq in group.equations]
+    values = [results.get(key) for key in keys]
+    cached = all(fz is not None for fz in values)
+    if not cached:
+        values = group.vector_function(z.get_z(), num_branches=ln_branches)
+        for key, fz in zip(keys, values):
+            results.put(key, fz)
+    if timing is not None:
+        for fz in values:
+            timing.count_stroke(fz.shape[0], fz.shape[1], cached)
+    return values
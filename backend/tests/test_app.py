@@ -0,0 +1,88 @@
+"""
+    Responses of the Flask app are strict JSON, which is all JSON.parse of the frontend reads:
+    no NaN or Infinity, whatever options the request has.
+    A function nested too deep to be compiled is a bad function string, a 400 rather than a 500.
+"""
+import json
+
+import numpy as np
+import pytest
+
+from app import app
+from solver.parser import Parser
+
+# out of the view [-2, 2]^2 (grown by half of it on every side) and back in elsewhere
+stroke = [[float(x), float(y)] for x, y in zip(np.linspace(0.1, 8, 200), np.sin(np.linspace(0.1, 8, 200)))]
+stroke += [[float(x), 2.0] for x in np.linspace(8, 0.1, 200)]
+view = {'left': -2, 'right': 2, 'bottom': -2, 'top': 2}
+options = [{}, {'view': view}, {'view': view, 'split': True}, {'trackBranches': True},
+           {'view': view, 'trackBranches': True}, {'view': view, 'trackBranches': True, 'split': True}]
+
+
+def strict(text: str):
+    def reject(constant):
+        raise ValueError(f'{constant} is not JSON')
+    return json.loads(text, parse_constant=reject)
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.mark.parametrize('fields', options)
+@pytest.mark.parametrize('f', ['z', 'ln(z)'])
+def test_strokes_are_strict_json(client, f, fields):
+    response = client.post('/strokes?f=' + f, data=json.dumps({'z': [[0, stroke]], 'lnBranches': 1, **fields}))
+    assert response.status_code == 200
+    strokes = strict(response.get_data(as_text=True))
+    assert len(strokes) > 0 and all(label == 0 for label, _ in strokes)
+
+
+@pytest.mark.parametrize('fields', options)
+def test_ndjson_is_strict_json(client, fields):
+    response = client.post('/strokes?f=z', data=json.dumps({'z': [[0, stroke]], **fields}),
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    for line in response.get_data(as_text=True).splitlines():
+        strict(line)
+
+
+@pytest.mark.parametrize('fields', options)
+def test_batch_is_strict_json(client, fields):
+    response = client.post('/strokes/batch', data=json.dumps({'functions': ['z', 'ln(z)'], 'z': [[0, stroke]],
+                                                              'lnBranches': 1, **fields}))
+    assert response.status_code == 200
+    assert all('strokes' in result for result in strict(response.get_data(as_text=True)))
+
+
+def test_culled_stroke_is_broken_not_joined(client):
+    response = client.post('/strokes?f=z', data=json.dumps({'z': [[0, stroke]], 'view': view}))
+    pieces = strict(response.get_data(as_text=True))
+    # one piece leaving the view, one coming back into it
+    assert len(pieces) == 2
+    for _, points in pieces:
+        steps = np.abs(np.diff(np.array(points) @ [1, 1j]))
+        assert steps.max() < 4
+
+
+deep = ['+'.join(['z'] * 1000), '^'.join(['z'] * 1000), 'sin(' * 1000 + 'z' + ')' * 1000, '(' * 1000 + 'z' + ')' * 1000]
+
+
+@pytest.mark.parametrize('f', deep)
+@pytest.mark.parametrize('route', ['/strokes', '/preimage'])
+def test_deep_function_is_bad_request(client, route, f):
+    response = client.post(f'{route}?f={f}', data=json.dumps({'z': [[0, stroke]]}))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('f', deep)
+def test_deep_function_tile_is_bad_request(client, f):
+    assert client.get(f'/tiles/0/0/0.png?f={f}').status_code == 400
+
+
+def test_deepest_function_compiles(client):
+    # the deepest tree accepted, with its derivative for the preimage
+    f = '^'.join(['z'] * Parser.max_depth)
+    response = client.post(f'/preimage?f={f}', data=json.dumps({'z': [[0, stroke[:3]]]}))
+    assert response.status_code == 200
@@ -0,0 +1,58 @@
+"""
+    A live session sends the values of a stroke in pieces, the branches of every piece in the order
+    of the branches already sent, whatever order the worker gives them in.
+"""
+import asyncio
+import json
+
+import numpy as np
+
+import worker
+from live import LiveSession
+from solver.wire_format import WireFormat
+
+worker.initialize(1 << 20)
+
+
+def session(shuffle: bool) -> LiveSession:
+    calls = 0
+
+    async def evaluate(request: tuple) -> tuple:
+        nonlocal calls
+        status, content_type, body, timing = worker.handle_strokes(*request)
+        calls += 1
+        if status != 200 or not shuffle or calls % 2 == 0:
+            return status, content_type, body, timing
+        # the branches of every other response in another order
+        strokes = [(label, np.ascontiguousarray(values[:, ::-1, 0] + 1j * values[:, ::-1, 1]).T)
+                   for label, values in WireFormat.decode(body)]
+        return status, content_type, WireFormat.encode(strokes), timing
+
+    return LiveSession(evaluate)
+
+
+def draw(live: LiveSession, points: np.ndarray, size: int) -> np.ndarray:
+    """The (points, branches) values the client ends up with, drawing points size at a time"""
+    async def run():
+        values = None
+        assert (await live.handle(json.dumps({'type': 'function', 'f': 'ln(z)', 'lnBranches': 2})))[0]['type'] \
+            == 'function'
+        for i in range(0, len(points), size):
+            chunk = [[z.real, z.imag] for z in points[i:i + size]]
+            for message in await live.handle(json.dumps({'type': 'points', 'label': 1, 'points': chunk})):
+                new = np.array(message['values'], dtype=np.float64).reshape(-1, message['branches'], 2)
+                new = new[..., 0] + 1j * new[..., 1]
+                values = new if values is None else np.concatenate((values[:message['start']], new))
+        return values
+
+    return asyncio.run(run())
+
+
+def test_pieces_join_branch_by_branch():
+    points = 1 + np.exp(1j * np.linspace(0, 2, 60))
+    whole = draw(session(False), points, len(points))
+    for shuffle in [False, True]:
+        values = draw(session(shuffle), points, 7)
+        assert values.shape == whole.shape
+        # no stroke crosses the cut of ln(z), every branch is continuous
+        assert np.abs(np.diff(values, axis=0)).max() < 0.1
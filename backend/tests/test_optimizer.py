@@ -0,0 +1,74 @@
+"""
+    The optimizer keeps the values of the functions: every formula of the corpus is compiled with and without it
+    and evaluated on the same points, point by point (Solver) and on whole strokes (VectorSolver),
+    for several numbers of branches. The timings are in benchmarks/optimizer_equivalence.py.
+"""
+import warnings
+
+import numpy as np
+import pytest
+
+from solver.compiler import Compiler
+from solver.optimizer import Optimizer
+from solver.parser import Parser
+from solver.solver import Solver
+from solver.vector_solver import VectorSolver
+
+corpus = [
+    # constant folding
+    '2*pi*i*z', 'z*2*pi*i', '2*3*z+4+5', 'sin(1)*z', 'e^(i*pi)*z', '-2*z', '--z', '-(1+2)*z', 'abs(-3)*phi(i)+z',
+    'real(2+3i)*z+im(2+3i)', '(1/3)*z', 'z/(2*pi)', 'ctg(1)+cth(1)+sch(1)+csch(1)+z',
+    # constants that depend on the number of branches are not folded
+    'ln(2)*z', 'log(2,3)*z', 'root(4,2)*z', 'asin(2)+z', 'atg(2*i)*z',
+    # small integer powers
+    'z^2', 'z^3', 'z^4', 'z^7', 'z^16', 'z^17', 'z^0', 'z^1', 'z^-1', 'z^-3', 'z^(1+1)', 'z^2.5', 'z^i', '2^z',
+    'ln(z)^2', 'asin(z)^3', '(z+1)^2*(z-1)^-2', 'z^2^2', 'root(z,2)^2',
+    # repeated subexpressions
+    'z^2+z^2', 'sin(z)*sin(z)', '(z+1)/(z+1)', 'ln(z+1)+ln(z+1)*2', 'ln(z)-ln(z)', 'sin(z^2)+cos(z^2)+z^2',
+    # everything at once
+    '2*pi*i*z^2+ln(2)*z^2', '(z-i)/(z+i)', 'e^(2*pi*i*z)', 'ctg(z)+cth(z)+sch(z)+csch(z)', 'z+1/z', '-z+1',
+]
+solvers = {'vector': VectorSolver, 'point': Solver}
+
+
+def points() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    random = rng.uniform(-3, 3, 200) + 1j * rng.uniform(-3, 3, 200)
+    special = np.array([0, 1, -1, 1j, -1j, 1e-300, 1e300, 1e-8j, np.pi, -0.5])
+    return np.concatenate([random, special]).astype(np.complex128)
+
+
+def functions(f: str, solver) -> tuple:
+    """f compiled without and with the optimizer, linked against solver and wrapped for arrays"""
+    expression = Parser.try_get_expression(f, True)[1]
+    plain = Compiler.compile(expression)
+    optimized = Compiler.compile(Optimizer.optimize(expression))
+    return solver.wrap_for_array(Compiler.link(plain, solver)), solver.wrap_for_array(Compiler.link(optimized, solver))
+
+
+def evaluate(f, z, num_branches):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            values = f(z, num_branches=num_branches)
+    except Exception as e:  # the point by point path can't evaluate some functions at all
+        return type(e).__name__
+    return values if isinstance(values, np.ndarray) else np.array(values, dtype=np.complex128)
+
+
+@pytest.mark.parametrize('num_branches', [0, 1, 3])
+@pytest.mark.parametrize('solver', solvers.keys())
+@pytest.mark.parametrize('f', corpus)
+def test_optimized_values(f, solver, num_branches):
+    plain, optimized = functions(f, solvers[solver])
+    # points one by one: the scalar path raises where numpy gives inf or nan
+    z = points() if solver == 'vector' else points()[:20]
+    expected = evaluate(plain, z, num_branches)
+    got = evaluate(optimized, z, num_branches)
+    # folding can only remove failures: 'real(2+3i)' fails point by point when it isn't folded
+    if isinstance(expected, str):
+        return
+    assert not isinstance(got, str), got
+    assert got.shape == expected.shape
+    # within the rounding of the reordered operations
+    np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-12, equal_nan=True)
@@ -0,0 +1,158 @@
+"""
+    The single-pass parser builds the trees the backtracking parser it replaced built, quirks included:
+    binary operators of one priority group to the right, and a leading minus in the first argument of
+    log or root stops at the operator with the lowest priority of that argument.
+    The one-regexp tokenizer gives the tokens of the one it replaced, implicit multiplications included.
+    Trees are hash-consed: equal formulas and equal subtrees are one object, kept while something refers to it.
+"""
+import gc
+import pickle
+
+import pytest
+
+from solver.parser import Parser, Expression, ExpressionType, Token, TokenType, ParserError, ParserErrorType
+
+
+def shape(exp: Expression) -> str:
+    # the tree written with every binary and unary operation in parentheses, a parenthesis of the formula
+    # in square brackets
+    parts = exp.value
+    if exp.type == ExpressionType.VAL:
+        return parts[0].value
+    if exp.type == ExpressionType.PAR:
+        return f'[{shape(parts[1])}]'
+    if exp.type == ExpressionType.UNARY:
+        return f'(-{shape(parts[1])})'
+    if exp.type == ExpressionType.BINARY:
+        return f'({shape(parts[0])}{parts[1].value}{shape(parts[2])})'
+    return f'{parts[0].value}({",".join(shape(part) for part in parts[2::2])})'
+
+
+def parse(f: str) -> Expression:
+    return Parser.try_get_expression(f, True)[1]
+
+
+# trees of the backtracking parser
+trees = {
+    'z': 'z', '2.5': '2.5', 'pi': 'pi', 'z+1': '(z+1)', '1/z': '(1/z)', 'z+1/z': '(z+(1/z))',
+    'z-1-1': '(z-(1-1))', 'z-1+1': '(z-(1+1))', 'z/2/3': '(z/(2/3))', 'z/2*3': '(z/(2*3))', 'z^2^3': '(z^(2^3))',
+    'z-(1-1)': '(z-[(1-1)])', '((z))': '[[z]]', '(z-i)/(z+i)': '([(z-i)]/[(z+i)])', 'e^(i*z)': '(e^[(i*z)])',
+    '-z': '(-z)', '--z': '(-(-z))', '-z^2': '(-(z^2))', '-z*2': '(-(z*2))', '-z+1': '(-(z+1))',
+    'z*-1': '(z*(-1))', 'z^-2': '(z^(-2))', '2^-z^2': '(2^(-(z^2)))',
+    'sin(z)^2': '(sin(z)^2)', 'sin(z^2)': 'sin((z^2))', 'ln(-z)': 'ln((-z))', 'sin(cos(tg(z)))': 'sin(cos(tg(z)))',
+    'real(z)+im(z)*i': '(real(z)+(im(z)*i))', 'log(z,2)': 'log(z,2)', 'root(z,3)': 'root(z,3)',
+    'log(-z^2,2)': 'log(((-z)^2),2)', 'log(-z*2+1,2)': 'log(((-(z*2))+1),2)', 'root(-z-1,2)': 'root(((-z)-1),2)',
+    'log(2,-z^2)': 'log(2,(-(z^2)))',
+}
+
+
+@pytest.mark.parametrize('f, tree', trees.items())
+def test_tree(f, tree):
+    assert shape(parse(f)) == tree
+
+
+def test_right_grouping():
+    # z-1-1 is z-(1-1), which is what the solvers have always computed
+    left, operator, right = parse('z-1-1').value
+    assert left is parse('z') and operator.value == '-' and right is parse('1-1')
+    left, operator, right = parse('z/2*3').value
+    assert left is parse('z') and operator.value == '/' and right is parse('2*3')
+
+
+def test_first_argument_minus():
+    # the leading minus of a first argument stops at its lowest operator, elsewhere it takes everything
+    assert shape(parse('log(-z^2,2)').value[2]) == '((-z)^2)'
+    assert shape(parse('log(2,-z^2)').value[4]) == '(-(z^2))'
+    assert shape(parse('-z^2')) == '(-(z^2))'
+
+
+@pytest.mark.parametrize('f', ['z+', '(z', 'z)', '()', 'sin()', 'sin z', 'log(z)', 'root(z,2,3)', 'z,2',
+                               '2(z+1)', '(z+1)(z-1)'])
+def test_invalid_expression(f):
+    with pytest.raises(ParserError) as error:
+        parse(f)
+    assert error.value.type == ParserErrorType.INVALID_EXPRESSION
+
+
+def test_too_many_variables():
+    with pytest.raises(ParserError) as error:
+        parse('x+y')
+    assert error.value.type == ParserErrorType.TOO_MANY_VARIABLES
+    assert error.value.text_value == 'x, y'
+
+
+def test_too_deep():
+    assert Parser.depth(parse('+'.join(['z'] * Parser.max_depth))) == Parser.max_depth
+    with pytest.raises(ParserError):
+        parse('+'.join(['z'] * (Parser.max_depth + 1)))
+    with pytest.raises(ParserError):
+        parse('(' * 1000 + 'z' + ')' * 1000)
+
+
+@pytest.mark.parametrize('f', ['z+', 'x+y', 'z$'])
+def test_errors_without_accept_error(f):
+    assert Parser.try_get_expression(f) == (False, Expression([], ExpressionType.NONE))
+
+
+# tokens of the tokenizer that sliced the string, as value:type
+tokens = {
+    '2z': '2:NUM *:BINARY z:VAR', 'zi': 'z:VAR *:BINARY i:CONST', 'z2': 'z:VAR *:BINARY 2:NUM',
+    '2.5z': '2.5:NUM *:BINARY z:VAR', '2pi z': '2:NUM *:BINARY pi:CONST *:BINARY z:VAR',
+    'ipi': 'i:CONST *:BINARY pi:CONST', 'ez': 'e:CONST *:BINARY z:VAR', 'Z ^ 2': 'Z:VAR ^:BINARY 2:NUM',
+    'imz': 'im:FUNC1 z:VAR', 'sinz': 'sin:FUNC1 z:VAR', 'phi(z)pi': 'phi:FUNC1 (:PARL z:VAR ):PARR pi:CONST',
+    '-z': '-:UNARY z:VAR', 'z-1': 'z:VAR -:BINARY 1:NUM', '(-z)': '(:PARL -:UNARY z:VAR ):PARR',
+    'z*-1': 'z:VAR *:BINARY -:UNARY 1:NUM', 'sin(z)-1': 'sin:FUNC1 (:PARL z:VAR ):PARR -:BINARY 1:NUM',
+    'log(z,-2)': 'log:FUNC2 (:PARL z:VAR ,:SEPAR -:UNARY 2:NUM ):PARR',
+    'sh(z)+sch(z)': 'sh:FUNC1 (:PARL z:VAR ):PARR +:BINARY sch:FUNC1 (:PARL z:VAR ):PARR',
+    'arcth(z)+cth(z)': 'arcth:FUNC1 (:PARL z:VAR ):PARR +:BINARY cth:FUNC1 (:PARL z:VAR ):PARR',
+    'actg(z)-tg(z)': 'actg:FUNC1 (:PARL z:VAR ):PARR -:BINARY tg:FUNC1 (:PARL z:VAR ):PARR',
+}
+
+
+@pytest.mark.parametrize('f, expected', tokens.items())
+def test_tokens(f, expected):
+    assert ' '.join(f'{token.value}:{token.type.name}' for token in Parser.tokenize(f)) == expected
+
+
+@pytest.mark.parametrize('f, error_type, text', [('z$', ParserErrorType.UNKNOWN_TOKEN, '$'),
+                                                 ('z..2', ParserErrorType.UNKNOWN_TOKEN, '.'),
+                                                 ('1.', ParserErrorType.UNKNOWN_TOKEN, '.'),
+                                                 ('foo', ParserErrorType.TOO_MANY_VARIABLES, 'f, o')])
+def test_token_errors(f, error_type, text):
+    with pytest.raises(ParserError) as error:
+        Parser.tokenize(f)
+    assert (error.value.type, error.value.text_value) == (error_type, text)
+
+
+def test_empty():
+    assert Parser.try_get_expression('') == (True, Expression([], ExpressionType.NONE))
+
+
+@pytest.mark.parametrize('f, g', [('z^2+1', 'z ^ 2 + 1'), ('2z', '2*z'), ('sin(z)-1', 'sin( z )-1'),
+                                  ('log(-z^2,2)', 'log(-z^2, 2)')])
+def test_equal_formulas_are_one_expression(f, g):
+    assert parse(f) is parse(g)
+    assert hash(parse(f)) == hash(parse(g))
+
+
+def test_shared_subtrees():
+    exp = parse('sin(z^2)+cos(z^2)')
+    assert exp.value[0].value[2] is exp.value[2].value[2] is parse('z^2')
+    assert Token('z', TokenType.VAR) is parse('z').value[0]
+    assert parse('z-1-1') is not parse('(z-1)-1')
+
+
+def test_immutable_and_pickled_as_itself():
+    exp = parse('e^(i*z)')
+    with pytest.raises(AttributeError):
+        exp.extra = 1
+    assert pickle.loads(pickle.dumps(exp)) is exp
+
+
+def test_interned_while_referred_to():
+    key = '+'.join(['z^7'] * 3)
+    exp = parse(key)
+    count = len(Expression._interned)
+    del exp
+    gc.collect()
+    assert len(Expression._interned) < count
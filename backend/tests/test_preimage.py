@@ -0,0 +1,52 @@
+"""
+    Preimage finds points z with f(z) = w: every value it returns is mapped back onto its point of the stroke
+    by the principal branch of f, and a polynomial gets as many preimages as its degree.
+"""
+import numpy as np
+import pytest
+
+from solver.parser import Parser
+from solver.preimage import Preimage
+
+# half a circle of the w plane, around 0.5
+w = 0.5 + 1.5 * np.exp(1j * np.linspace(0, 3, 100))
+
+
+def preimage(f: str, **options) -> Preimage:
+    return Preimage(Parser.try_get_expression(f, True)[1], **options)
+
+
+@pytest.mark.parametrize('f', ['z^2', 'z^3+z', 'sin(z)', 'e^z', '(z-i)/(z+i)', 'ln(z)', 'z+1/z'])
+def test_maps_back(f):
+    solver = preimage(f)
+    z = solver.solve(w)
+    found = np.isfinite(z)
+    # some points have no preimage in the region: for ln(z) it is e^w, out of [-4, 4]^2 when |e^w| > 4
+    assert z.shape[1] == len(w) and found.any()
+    with np.errstate(all='ignore'):
+        fz = solver.function(z.reshape(-1))[0].reshape(z.shape)
+    np.testing.assert_allclose(fz[found], np.broadcast_to(w, z.shape)[found], rtol=1e-8, atol=1e-8)
+
+
+@pytest.mark.parametrize('f, degree', [('z^2', 2), ('z^3+z', 3), ('(z-1)*(z+1)*(z-2i)*z', 4)])
+def test_all_roots_of_a_polynomial(f, degree):
+    z = preimage(f).solve(w)
+    assert z.shape == (degree, len(w)) and np.isfinite(z).all()
+    # distinct at every point, and every row is one root followed along the stroke
+    gaps = np.abs(z[:, None, :] - z[None, :, :]) + np.eye(degree)[:, :, None]
+    assert gaps.min() > 1e-6
+    assert np.abs(np.diff(z, axis=1)).max() < 0.2
+
+
+def test_region():
+    z = preimage('z^2', region=(0, 4, -4, 4)).solve(w)
+    assert (z[np.isfinite(z)].real >= 0).all()
+    # one of the two roots is always in the right half-plane
+    assert (np.isfinite(z).sum(axis=0) >= 1).all()
+
+
+@pytest.mark.parametrize('options', [{'region': (1, -1, -1, 1)}, {'seeds': 0}, {'max_iterations': 0},
+                                     {'stride': 3}])
+def test_bad_options(options):
+    with pytest.raises(ValueError):
+        preimage('z^2', **options)
@@ -0,0 +1,54 @@
+"""
+    Shapes are sampled about "step" apart, 0.01 by default like scatterLine of the frontend, or with
+    "count" points in all: both ends of an open shape, a closed shape ending where it starts.
+"""
+import numpy as np
+import pytest
+
+from solver.shapes import Shapes
+
+
+@pytest.mark.parametrize('shape, count', [
+    ({'shape': 'segment', 'from': [0, 0], 'to': [1, 0]}, 101),
+    ({'shape': 'segment', 'from': [0, 0], 'to': [3, 4], 'step': 0.5}, 11),
+    ({'shape': 'segment', 'from': [0, 0], 'to': [1, 0], 'count': 11}, 11),
+    ({'shape': 'segment', 'from': [1, 1], 'to': [1, 1]}, 1),
+    ({'shape': 'rectangle', 'corners': [[1, 1], [-1, 0]]}, 601),
+    ({'shape': 'rectangle', 'corners': [[0, 0], [2, 1]], 'step': 0.5}, 13),
+    ({'shape': 'ellipse', 'center': [0, 0], 'radii': [1, 1]}, 630),
+    ({'shape': 'ellipse', 'center': [1, 1], 'radius': 2, 'count': 9}, 9),
+])
+def test_point_count(shape, count):
+    assert len(Shapes.sample(shape)) == count
+
+
+def test_segment():
+    z = Shapes.sample({'shape': 'segment', 'from': [0, 0], 'to': [3, 4], 'step': 0.5})
+    np.testing.assert_allclose(np.abs(np.diff(z)), 0.5)
+    assert (z[0], z[-1]) == (0, 3 + 4j)
+
+
+def test_rectangle():
+    # counterclockwise from the bottom left corner, whatever corners are given, back to it
+    z = Shapes.sample({'shape': 'rectangle', 'corners': [[2, 1], [0, 0]], 'step': 0.5})
+    assert z[0] == z[-1] == 0
+    assert [2, 2 + 1j, 1j] == [corner for corner in z if corner in [2, 2 + 1j, 1j]]
+    assert np.all((z.real == 0) | (z.real == 2) | (z.imag == 0) | (z.imag == 1))
+
+
+def test_ellipse():
+    z = Shapes.sample({'shape': 'ellipse', 'center': [1, -1], 'radii': [2, 1]})
+    np.testing.assert_allclose(((z.real - 1) / 2) ** 2 + (z.imag + 1) ** 2, 1)
+    np.testing.assert_allclose(z[-1], z[0], atol=1e-12)
+    # evenly spaced in angle, so the steps are 0.01 on average, longer where the ellipse is flatter
+    steps = np.abs(np.diff(z))
+    assert abs(steps.mean() - 0.01) < 1e-4 and steps.max() < 0.02
+
+
+@pytest.mark.parametrize('shape', [{'shape': 'segment', 'from': [0, 0], 'to': [1e9, 0]},
+                                   {'shape': 'segment', 'from': [0, 0], 'to': [1, 0], 'step': 0},
+                                   {'shape': 'ellipse', 'center': [0, 0], 'radius': float('inf')},
+                                   {'shape': 'polyline', 'points': []}, {'shape': 'star'}])
+def test_bad_shape(shape):
+    with pytest.raises(ValueError):
+        Shapes.sample(shape)
@@ -0,0 +1,55 @@
+"""
+    StrokeSplitter cuts the image of a stroke across poles and cuts, and only there: a stroke through
+    the pole of 1/z or across the cut of ln(z) comes in two pieces a branch, one that avoids them in one.
+"""
+import numpy as np
+import pytest
+
+from solver.equation import Equation
+from solver.stroke_splitter import StrokeSplitter
+
+
+def values(f: str, z: np.ndarray) -> np.ndarray:
+    eq = Equation(f)
+    eq.expression
+    return eq.vector_function(z, num_branches=1)
+
+
+def test_pole():
+    # -1 to 1 along the real axis, over 0 without reaching it
+    pieces = StrokeSplitter().split(values('1/z', np.linspace(-1, 1, 200) + 0j))
+    assert [piece.shape for piece in pieces] == [(1, 100), (1, 100)]
+    assert (pieces[0].real < 0).all() and (pieces[1].real > 0).all()
+
+
+def test_pole_dropped():
+    # 0 itself is infinite, it is dropped between the two pieces
+    pieces = StrokeSplitter().split(values('1/z', np.linspace(-1, 1, 201) + 0j))
+    assert [piece.shape for piece in pieces] == [(1, 100), (1, 100)]
+    assert all(np.isfinite(piece).all() for piece in pieces)
+
+
+def test_ln_cut():
+    # across the negative real axis, where the imaginary part of every branch jumps by 2*pi
+    fz = values('ln(z)', -1 + 1j * np.linspace(-1, 1, 200))
+    pieces = StrokeSplitter().split(fz)
+    assert len(pieces) == 2 * fz.shape[0]
+    for piece in pieces:
+        assert piece.shape == (1, 100)
+        assert np.abs(np.diff(piece)).max() < 0.1
+
+
+@pytest.mark.parametrize('f, z', [('1/z', np.linspace(-1, 1, 200) + 0.5j), ('ln(z)', 1 + 1j * np.linspace(-1, 1, 200)),
+                                  ('z^2', np.linspace(-1, 1, 200) + 0j)])
+def test_smooth_stroke_is_one_piece(f, z):
+    fz = values(f, z)
+    pieces = StrokeSplitter().split(fz)
+    assert len(pieces) == fz.shape[0]
+    assert all(piece.shape == (1, len(z)) for piece in pieces)
+
+
+def test_tg_pole():
+    # 0 to 3 goes over pi/2, where tg goes from a large positive value to a large negative one
+    pieces = StrokeSplitter().split(values('tg(z)', np.linspace(0, 3, 301) + 0j))
+    assert len(pieces) == 2
+    assert pieces[0][0, -1].real > 100 and pieces[1][0, 0].real < -100
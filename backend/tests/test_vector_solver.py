@@ -0,0 +1,36 @@
+"""
+    Rows of VectorSolver values are branches: row k is the same branch whatever points are evaluated,
+    which AdaptiveSampler relies on when it evaluates the middles of pieces separately.
+"""
+import numpy as np
+import pytest
+
+from solver.equation import Equation
+
+functions = ['ln(z)', 'atg(z)', 'arth(z)', 'atg(ln(z))', 'ln(z)+ln(z)', 'root(z,3)+ln(z)', 'asin(z)', 'ln(z)-ln(z)',
+             'log(z,2)', 'root(z,2)^2']
+
+
+@pytest.mark.parametrize('num_branches', [1, 3])
+@pytest.mark.parametrize('f', functions)
+def test_rows_line_up(f, num_branches):
+    eq = Equation(f)
+    eq.expression
+    z = np.linspace(0.3 + 0.2j, 1.2 + 0.9j, 200)
+    values = eq.vector_function(z, num_branches=num_branches)
+    middles = eq.vector_function((z[:-1] + z[1:]) / 2, num_branches=num_branches)
+    assert middles.shape == (values.shape[0], len(z) - 1)
+    # the middle of every row is between the values of that row, not of another branch,
+    # except across a cut, where the row itself jumps (atg(ln(z)) where |z| = 1)
+    expected = (values[:, :-1] + values[:, 1:]) / 2
+    smooth = np.abs(np.diff(values, axis=1)) < 0.1
+    assert smooth.mean() > 0.9
+    np.testing.assert_allclose(middles[smooth], expected[smooth], atol=1e-3)
+
+
+def test_rows_of_a_point_set_and_its_subset():
+    eq = Equation('atg(z)')
+    eq.expression
+    z = np.array([-2 - 1j, -2 + 1j, 2 + 1j, 0.5 - 0.3j])
+    values = eq.vector_function(z, num_branches=1)
+    np.testing.assert_allclose(eq.vector_function(z[2:], num_branches=1), values[:, 2:])
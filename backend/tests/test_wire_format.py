@@ -0,0 +1,86 @@
+"""
+    The binary format of strokes (see WireFormat): what is encoded decodes to the same values, to the
+    precision of its dtype, and a compressed request inflates to the size its table gives and no more,
+    so a small request can't take the memory of a large one.
+"""
+import zlib
+
+import numpy as np
+import pytest
+
+from app import app
+from solver.wire_format import WireFormat
+
+
+# two strokes of 3 branches and one of 1 branch, with a pole
+fz = np.exp(1j * np.linspace(0, 6, 50))[None, :] * np.array([[1], [2], [3]]) + 0.25
+strokes = [(1.0, fz), (-2.5, np.array([[1 + 2j, np.inf, np.nan + 1j]])), (7.0, fz[:, :0])]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('dtype, step, tolerance', [('float64', 1e-6, 0), ('float32', 1e-6, 1e-6),
+                                                    ('quantized', 1e-6, 0.5e-6), ('quantized', 0.01, 0.005)])
+def test_round_trip(dtype, step, tolerance, compress):
+    buffer = WireFormat.encode(strokes, dtype, step, compress)
+    decoded = WireFormat.decode(buffer)
+    assert [label for label, _ in decoded] == [label for label, _ in strokes]
+    for (_, values), (_, expected) in zip(decoded, strokes):
+        # (points, branches, 2) floats of the (branches, points) complex values
+        assert values.shape == (expected.shape[1], expected.shape[0], 2)
+        finite = np.isfinite(expected.T)
+        z = values[..., 0] + 1j * values[..., 1]
+        np.testing.assert_allclose(z[finite], expected.T[finite], rtol=tolerance, atol=tolerance)
+        if dtype != 'quantized':
+            np.testing.assert_array_equal(np.isnan(values[..., 0]), np.isnan(expected.T.real))
+        else:
+            # the quantized format has no infinity or NaN, any value that isn't finite is missing
+            assert np.isnan(z[~finite]).all()
+
+
+def test_header():
+    buffer = WireFormat.encode(strokes, 'quantized', 0.01, True)
+    magic, code, flags, count, step = WireFormat.header.unpack_from(buffer)
+    assert (magic, code, flags, count, step) == (WireFormat.magic, WireFormat.dtypes['quantized'],
+                                                 WireFormat.compressed, 3, 0.01)
+
+
+def test_float64_request_is_a_view():
+    buffer = WireFormat.encode([(0.0, np.array([[1 + 2j, 3 + 4j]]))])
+    z_array = WireFormat.read_strokes(buffer)
+    points = z_array.labeled_points[0][1].points
+    assert points.base is not None and points.tolist() == [[1.0, 2.0], [3.0, 4.0]]
+
+
+def test_request_strokes_have_one_branch():
+    with pytest.raises(TypeError):
+        WireFormat.read_strokes(WireFormat.encode(strokes[:1]))
+
+
+def request_buffer(payload: bytes, points: int, compressed: bool = True) -> bytes:
+    header = WireFormat.header.pack(WireFormat.magic, WireFormat.dtypes['float64'],
+                                    WireFormat.compressed if compressed else 0, 1, 1e-6)
+    return header + WireFormat.record.pack(1.0, points, 1) + payload
+
+
+def test_compressed_request_is_read():
+    strokes = WireFormat.decode(request_buffer(zlib.compress(bytes(16 * 10)), 10))
+    assert strokes[0][1].shape == (10, 1, 2)
+
+
+@pytest.mark.parametrize('payload', [zlib.compress(bytes(100_000_000)),  # a 100 MB payload in 100 kB
+                                     zlib.compress(bytes(16 * 10 + 1)),  # a byte more than the table gives
+                                     zlib.compress(bytes(16 * 10))[:-4]])  # a stream cut short
+def test_compressed_request_inflates_to_its_table(payload):
+    with pytest.raises(TypeError):
+        WireFormat.decode(request_buffer(payload, 10))
+
+
+def test_table_larger_than_a_request():
+    with pytest.raises(TypeError):
+        WireFormat.decode(request_buffer(zlib.compress(b''), WireFormat.max_payload // 16 + 1))
+
+
+def test_compression_bomb_is_bad_request():
+    response = app.test_client().post('/strokes?f=z', data=request_buffer(zlib.compress(bytes(100_000_000)), 10),
+                                      content_type=WireFormat.mimetype)
+    assert response.status_code == 400
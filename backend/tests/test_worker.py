@@ -0,0 +1,47 @@
+"""
+    A worker of the concurrent serving mode (asgi.py) answers /strokes requests like the Flask app,
+    both read them with strokes.StrokesRequest.
+"""
+import json
+
+import pytest
+
+import worker
+from app import app
+from solver.wire_format import WireFormat
+
+stroke = [[0.5, 0.25], [1.0, -1.0], [2.0, 3.0]]
+
+
+@pytest.fixture(scope='module', autouse=True)
+def caches():
+    worker.initialize(1024 * 1024)
+
+
+@pytest.mark.parametrize('query, fields', [('f=z*z', {}), ('f=ln(z)', {'lnBranches': 2}),
+                                           ('f=sqrt(z)', {'trackBranches': True}), ('f=z-', {}),
+                                           ('f=z', {'z': 'bad'}), ('', {})])
+def test_same_json_response(query, fields):
+    body = json.dumps({'z': [[3, stroke]], **fields}).encode()
+    args = dict(item.split('=') for item in query.split('&') if item)
+    status, response_type, response, record = worker.handle_strokes(args, 'application/json', False, body)
+    expected = app.test_client().post('/strokes?' + query, data=body)
+    assert status == expected.status_code
+    assert record['status'] == status
+    if status == 200 and response:
+        assert response_type == 'application/json'
+        assert json.loads(response) == expected.get_json()
+    else:
+        assert response == expected.get_data()
+
+
+@pytest.mark.parametrize('query', ['f=exp(z)&dtype=float32&compress=1', 'f=z&dtype=int8', 'f=z&step=abc'])
+def test_same_binary_response(query):
+    body = json.dumps({'z': [[3, stroke]]}).encode()
+    args = dict(item.split('=') for item in query.split('&'))
+    status, response_type, response, _ = worker.handle_strokes(args, 'application/json', True, body)
+    expected = app.test_client().post('/strokes?' + query, data=body, headers={'Accept': WireFormat.mimetype})
+    assert status == expected.status_code
+    assert response == expected.get_data()
+    if status == 200:
+        assert response_type == WireFormat.mimetype
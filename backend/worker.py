@@ -0,0 +1,66 @@
+"""
+    Worker process of the concurrent serving mode (see asgi.py).
+    Every worker keeps its own equation and result caches and answers stroke requests from its pipe.
+"""
+from solver.equation_cache import EquationCache
+from solver.result_cache import ResultCache
+from solver.parser import ParserError
+from metrics import RequestTiming
+from strokes import StrokesRequest, error_text
+
+equations: EquationCache | None = None
+results: ResultCache | None = None
+
+
+def initialize(result_cache_bytes: int = 64 * 1024 * 1024):
+    global equations, results
+    equations = EquationCache(max_size=256)
+    equations.warm()
+    results = ResultCache(max_bytes=result_cache_bytes)
+
+
+def handle_strokes(args: dict[str, str], content_type: str, binary: bool,
+                   body: bytes) -> tuple[int, str, bytes, dict]:
+    """
+        The /strokes request of the Flask app, without Flask: returns the status, the content type
+        and the body of the response, and the record of its RequestTiming.
+        binary tells if the client accepts the binary format.
+    """
+    timing = RequestTiming('strokes')
+    status, response_type, response = _handle_strokes(args, content_type, binary, body, timing)
+    timing.status = status
+    return status, response_type, response, timing.record()
+
+
+def _handle_strokes(args: dict[str, str], content_type: str, binary: bool, body: bytes,
+                    timing: RequestTiming) -> tuple[int, str, bytes]:
+    try:
+        strokes_request = StrokesRequest(args, content_type, body, binary, timing)
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return 400, 'text/plain', b'Bad request'
+    if strokes_request.f is None:
+        return 200, 'text/plain', b''
+    try:
+        eq = strokes_request.compile(equations)
+        if eq is None:
+            return 400, 'text/plain', b'Bad function string'
+        strokes = list(strokes_request.evaluate(results, eq))
+    except ParserError as e:
+        return 400, 'text/plain', error_text(e).encode()
+    return 200, *strokes_request.serialize(strokes)
+
+
+def serve(conn, result_cache_bytes: int):
+    """Main loop of a worker: a request tuple in, a response tuple out, until the pipe is closed"""
+    initialize(result_cache_bytes)
+    conn.send('ready')
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            response = handle_strokes(*request)
+        except Exception as e:  # the worker must survive whatever a request does
+            response = 500, 'text/plain', f'Internal error: {type(e).__name__}'.encode(), None
+        conn.send(response)
@@ -1,4 +1,4 @@
-import {Line, zArray} from "../../../types/lines.ts";
+import {Line, Shape, zArray} from "../../../types/lines.ts";
 import {LineType, ViewRectangle} from "../../../types/const.ts";
 
 export function pixelCoordsToAxisCoords(
@@ -50,6 +50,22 @@ export function scatterLine(line: Line, smoothness: number): Line {
     }
 }
 
+// the shape of a line for /strokes, the points of lines that have no shape
+export function lineToStroke(line: Line, smoothness: number): zArray | Shape {
+    switch (line.type) {
+        case LineType.Segment:
+            return {shape: 'segment', from: line.values[0], to: line.values[1], step: smoothness};
+        case LineType.Rectangle:
+            return {shape: 'rectangle', corners: [line.values[0], line.values[1]], step: smoothness};
+        case LineType.Ellipse: {
+            const [cx, cy, x1, y1] = [...line.values[0], ...line.values[1]];
+            return {shape: 'ellipse', center: line.values[0], radii: [Math.abs(cx - x1), Math.abs(cy - y1)], step: smoothness};
+        }
+        default:
+            return scatterLine(line, smoothness).values;
+    }
+}
+
 function segmentToSharp(line: Line, smoothness: number): Line {
     const points: zArray = [];
     const [x1, y1, x2, y2] = [...line.values[0], ...line.values[1]];
@@ -3,10 +3,10 @@ import Panel from "../Components/ToolsPanel/Panel.tsx";
 import { DrawingPlane } from "../Components/Graph/DrawingPlane.tsx";
 import { ResultPlane } from "../Components/Graph/ResultPlane.tsx";
 import { useEffect, useState } from "react";
-import { Line, zLabeledStrokes } from "../types/lines.ts";
+import { Line, zLabeledShapes, zLabeledStrokes } from "../types/lines.ts";
 import { useAppDispatch, useAppSelector } from "../hooks";
 import { addResult, resizeDrawing, resizeResult } from "../store/action.ts";
-import { scatterLine } from "../Components/Graph/Drawing/helpers.ts";
+import { lineToStroke } from "../Components/Graph/Drawing/helpers.ts";
 import { ComplexError, ErrorType, LineType } from "../types/const.ts";
 import { GraphSettings } from "../Components/Graph/GraphSettings.tsx";
 import "./Main.css"
@@ -29,11 +29,13 @@ function resultIsLabeledStrokes(maybeLabeledStrokes: any): maybeLabeledStrokes i
     return maybeLabeledStrokes instanceof Array;
 }
 
-async function getStrokes(z: zLabeledStrokes, f: string, lnBranches: number): Promise<zLabeledStrokes | ComplexError> {
+async function getStrokes(z: zLabeledShapes, f: string, lnBranches: number): Promise<zLabeledStrokes | ComplexError> {
     try {
         const response = await fetch("https://complex.pythonanywhere.com/strokes?" + new URLSearchParams({ f: f }).toString(), {
             method: 'POST',
-            body: JSON.stringify({ z, lnBranches }),
+            // split: the server cuts lines at poles and branch cuts, every branch comes as lines of its own;
+            // trackBranches: a line follows one branch along the stroke instead of jumping between them
+            body: JSON.stringify({ z, lnBranches, split: true, trackBranches: true }),
         });
 
         if (response.status === 200) {
@@ -98,7 +100,7 @@ function Main() {
         const fetches = userFunctions.map(({ id: funcId, expression, color }) => {
             const lowerExpr = expression.toLowerCase();
             return getStrokes(
-                inputLines.map(line => scatterLine(line, 0.01)).map(line => [line.id, line.values]),
+                inputLines.map(line => [line.id, lineToStroke(line, 0.01)]),
                 lowerExpr,
                 lnBranches
             ).then(res => ({ res, color, funcId }));
@@ -4,6 +4,14 @@ export type zArray = [number, number][]
 
 export type zLabeledStrokes = [number, zArray][]
 
+// a stroke sent as its shape, the server samples its points (see solver/shapes.py)
+export type Shape =
+    | { shape: 'segment', from: [number, number], to: [number, number], step?: number }
+    | { shape: 'rectangle', corners: [[number, number], [number, number]], step?: number }
+    | { shape: 'ellipse', center: [number, number], radii: [number, number], step?: number }
+
+export type zLabeledShapes = [number, zArray | Shape][]
+
 export type Line = {
     id: number,
     color: string,